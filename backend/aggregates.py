@@ -0,0 +1,125 @@
+"""
+SQL aggregation layer for dashboard KPIs
+
+Each function computes its figures with SUM/COUNT expressions in the database
+instead of loading every row and summing ORM properties in Python. The
+expressions mirror the hybrid properties in models.py.
+"""
+
+from sqlalchemy import Integer, case, cast, func, select, true
+from models import Harvest, Milling, Storage, Sale
+
+
+def milling_total_cost_expr():
+    """SQL expression for Milling.total_cost (needs an outer join to Harvest)"""
+    return (
+        func.coalesce(Harvest.ffb_cost, 0)
+        + Milling.milling_cost
+        + func.coalesce(Milling.transport_cost, 0)
+    )
+
+
+def harvest_totals(session):
+    """Get harvest count and total FFB weight"""
+    count, total_weight = session.query(
+        func.count(Harvest.id),
+        func.coalesce(func.sum(Harvest.total_weight), 0)
+    ).one()
+    return {'count': count, 'total_weight': total_weight}
+
+
+def milling_totals(session):
+    """Get milling count, total oil produced and total production cost"""
+    count, total_oil, total_cost = session.query(
+        func.count(Milling.id),
+        func.coalesce(func.sum(Milling.oil_yield), 0),
+        func.coalesce(func.sum(milling_total_cost_expr()), 0)
+    ).select_from(Milling).outerjoin(Harvest, Milling.harvest_id == Harvest.id).one()
+    return {'count': count, 'total_oil': total_oil, 'total_cost': total_cost}
+
+
+def sales_totals(session):
+    """Get sales count, total revenue and pending payment figures"""
+    count, total_revenue, pending_count, pending_amount = session.query(
+        func.count(Sale.id),
+        func.coalesce(func.sum(Sale.total_revenue), 0),
+        func.coalesce(func.sum(cast(Sale.is_payment_pending, Integer)), 0),
+        func.coalesce(func.sum(case((Sale.is_payment_pending, Sale.total_revenue), else_=0)), 0)
+    ).one()
+    return {
+        'count': count,
+        'total_revenue': total_revenue,
+        'pending_count': pending_count,
+        'pending_amount': pending_amount
+    }
+
+
+def available_storage_total(session):
+    """Get remaining CPO quantity across unsold containers"""
+    return session.query(
+        func.coalesce(func.sum(Storage.remaining_quantity), 0)
+    ).filter(Storage.is_sold == False).scalar()
+
+
+def unsold_quantity_total(session):
+    """Get the original quantity of all unsold containers"""
+    return session.query(
+        func.coalesce(func.sum(Storage.quantity), 0)
+    ).filter(Storage.is_sold == False).scalar()
+
+
+def dashboard_totals(session):
+    """Every figure the dashboard KPIs and the low-stock alert need, in one statement
+
+    Each table is aggregated in its own single-row derived table and the four
+    rows are cross joined, so the database scans each table once and the
+    figures come back in a single round trip.
+    """
+    harvest = select(
+        func.coalesce(func.sum(Harvest.total_weight), 0).label('harvest_total_weight')
+    ).subquery()
+    milling = select(
+        func.count(Milling.id).label('milling_count'),
+        func.coalesce(func.sum(Milling.oil_yield), 0).label('milling_total_oil'),
+        func.coalesce(func.sum(milling_total_cost_expr()), 0).label('milling_total_cost')
+    ).select_from(Milling).outerjoin(Harvest, Milling.harvest_id == Harvest.id).subquery()
+    sales = select(
+        func.coalesce(func.sum(Sale.total_revenue), 0).label('sales_total_revenue'),
+        func.coalesce(func.sum(cast(Sale.is_payment_pending, Integer)), 0).label('sales_pending_count'),
+        func.coalesce(func.sum(case((Sale.is_payment_pending, Sale.total_revenue), else_=0)), 0).label('sales_pending_amount')
+    ).subquery()
+    storage = select(
+        func.coalesce(func.sum(Storage.remaining_quantity), 0).label('storage_available'),
+        func.coalesce(func.sum(Storage.quantity), 0).label('storage_unsold_quantity')
+    ).where(Storage.is_sold == False).subquery()
+
+    row = session.execute(
+        select(harvest, milling, sales, storage)
+        .select_from(harvest)
+        .join(milling, true())
+        .join(sales, true())
+        .join(storage, true())
+    ).mappings().one()
+    return dict(row)
+
+
+def summary_from_totals(totals):
+    """Dashboard KPIs from dashboard_totals()"""
+    return {
+        'total_ffb_harvested': totals['harvest_total_weight'],
+        'total_oil_produced': totals['milling_total_oil'],
+        'total_milling_cost': totals['milling_total_cost'],
+        'total_revenue': totals['sales_total_revenue'],
+        'total_profit': totals['sales_total_revenue'] - totals['milling_total_cost'],
+        'total_storage': totals['storage_available'],
+        'pending_payments_count': totals['sales_pending_count'],
+        'total_pending_amount': totals['sales_pending_amount'],
+        'average_oil_yield': (
+            totals['milling_total_oil'] / totals['milling_count'] if totals['milling_count'] else 0
+        )
+    }
+
+
+def dashboard_summary(session):
+    """Compute the dashboard KPIs with a single aggregate statement"""
+    return summary_from_totals(dashboard_totals(session))
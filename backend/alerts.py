@@ -0,0 +1,181 @@
+"""
+Set-based alert engine
+
+Every alert category is computed with a single SQL query evaluated against
+one `as_of` timestamp, so an alerts poll costs a constant handful of queries
+regardless of how many harvests, containers or sales exist.
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import and_, exists
+from models import Harvest, Milling, Storage, Sale
+from aggregates import unsold_quantity_total
+import config
+
+
+SEVERITIES = ('critical', 'high', 'medium', 'low')
+ALERT_TYPES = ('milling', 'storage', 'stock', 'payment')
+
+
+def milling_cutoff_date(as_of):
+    """Latest harvest date that is more than MILLING_ALERT_HOURS old at as_of
+
+    Mirrors Harvest.needs_milling_alert, which measures from midnight of the harvest date.
+    """
+    cutoff = as_of - timedelta(hours=config.MILLING_ALERT_HOURS)
+    if cutoff.time() == datetime.min.time():
+        return cutoff.date() - timedelta(days=1)
+    return cutoff.date()
+
+
+def next_time_boundary(now):
+    """Next moment a time-based alert can change without any write
+
+    Expiry and near-expiry status change when the UTC date does; the milling
+    cutoff moves when now - MILLING_ALERT_HOURS crosses midnight.
+    """
+    midnight = datetime.combine(now.date(), datetime.min.time())
+    candidates = [midnight + timedelta(days=1)]
+    milling = midnight + timedelta(hours=config.MILLING_ALERT_HOURS % 24)
+    candidates.append(milling if milling > now else milling + timedelta(days=1))
+    return min(candidates)
+
+
+def unmilled_harvests_query(session, as_of):
+    """Harvests past the milling threshold with no milling record (anti-join)"""
+    milled = exists().where(Milling.harvest_id == Harvest.id)
+    return session.query(
+        Harvest.id, Harvest.plantation, Harvest.harvest_date
+    ).filter(
+        Harvest.harvest_date <= milling_cutoff_date(as_of),
+        ~milled
+    ).order_by(Harvest.harvest_date, Harvest.id)
+
+
+def expiring_storage_query(session, as_of, include_expired=True, include_near_expiry=True):
+    """Unsold containers that are expired and/or within the expiry warning window"""
+    today = as_of.date()
+    if include_near_expiry:
+        predicate = Storage.expiry_date <= today + timedelta(days=config.STORAGE_EXPIRY_WARNING_DAYS)
+        if not include_expired:
+            predicate = and_(predicate, Storage.expiry_date >= today)
+    else:
+        predicate = Storage.expiry_date < today
+
+    return session.query(
+        Storage.id, Storage.container_id, Storage.expiry_date
+    ).filter(
+        Storage.is_sold == False,
+        predicate
+    ).order_by(Storage.expiry_date, Storage.id)
+
+
+def pending_payments_query(session):
+    """Sales awaiting payment"""
+    return session.query(
+        Sale.id, Sale.buyer_name, Sale.total_revenue
+    ).filter(
+        Sale.payment_status == 'Pending'
+    ).order_by(Sale.sale_date, Sale.id)
+
+
+def milling_alert(row):
+    return {
+        'type': 'milling',
+        'severity': 'high',
+        'message': f'FFB from {row.plantation} harvested on {row.harvest_date} needs milling',
+        'harvest_id': row.id
+    }
+
+
+def storage_alert(row, today):
+    days_until_expiry = (row.expiry_date - today).days
+    if days_until_expiry < 0:
+        return {
+            'type': 'storage',
+            'severity': 'critical',
+            'message': f'Container {row.container_id} has expired!',
+            'storage_id': row.id
+        }
+    return {
+        'type': 'storage',
+        'severity': 'medium',
+        'message': f'Container {row.container_id} expires in {days_until_expiry} days',
+        'storage_id': row.id
+    }
+
+
+def payment_alert(row):
+    return {
+        'type': 'payment',
+        'severity': 'low',
+        'message': f'Payment pending from {row.buyer_name} for ₦{row.total_revenue:,.2f}',
+        'sale_id': row.id
+    }
+
+
+def collect_alerts(session, as_of=None, severities=None, types=None, limit=None, unsold_quantity=None):
+    """Compute alerts with one query per category
+
+    severities / types restrict the categories evaluated (None means all).
+    limit caps the number of alerts returned; total_count still reports how
+    many alerts matched. unsold_quantity, when the caller already has it
+    (see aggregates.dashboard_totals), saves the low-stock query.
+    """
+    as_of = as_of or datetime.utcnow()
+    today = as_of.date()
+    severities = set(severities or SEVERITIES)
+    types = set(types or ALERT_TYPES)
+
+    alerts = []
+    total_count = 0
+
+    def take(query, build):
+        """Append up to the remaining limit of rows and count the rest"""
+        nonlocal total_count
+        remaining = None if limit is None else limit - len(alerts)
+        if remaining is None:
+            rows = query.all()
+            total_count += len(rows)
+        elif remaining > 0:
+            rows = query.limit(remaining).all()
+            total_count += len(rows) if len(rows) < remaining else query.order_by(None).count()
+        else:
+            rows = []
+            total_count += query.order_by(None).count()
+        alerts.extend(build(row) for row in rows)
+
+    # Milling alerts
+    if 'milling' in types and 'high' in severities:
+        take(unmilled_harvests_query(session, as_of), milling_alert)
+
+    # Storage alerts
+    if 'storage' in types and ({'critical', 'medium'} & severities):
+        query = expiring_storage_query(
+            session, as_of,
+            include_expired='critical' in severities,
+            include_near_expiry='medium' in severities
+        )
+        take(query, lambda row: storage_alert(row, today))
+
+    # Low stock alert
+    if 'stock' in types and 'medium' in severities:
+        total_storage = unsold_quantity if unsold_quantity is not None else unsold_quantity_total(session)
+        if total_storage < config.LOW_STOCK_THRESHOLD_KG:
+            total_count += 1
+            if limit is None or len(alerts) < limit:
+                alerts.append({
+                    'type': 'stock',
+                    'severity': 'medium',
+                    'message': f'Low stock: Only {total_storage:.2f}kg CPO in storage',
+                    'current_stock': total_storage
+                })
+
+    # Payment alerts
+    if 'payment' in types and 'low' in severities:
+        take(pending_payments_query(session), payment_alert)
+
+    return {
+        'alerts': alerts,
+        'total_count': total_count
+    }
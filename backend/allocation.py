@@ -0,0 +1,85 @@
+"""
+Split one buyer order across several storage containers
+
+Containers are drawn down in policy order until the requested quantity is
+covered: 'fefo' (first expiry, first out) or 'fifo' (oldest storage_date
+first), optionally restricted to one plantation. All Sale rows, storage
+updates and rollup entries are written in the caller's transaction.
+"""
+
+from datetime import datetime
+from models import QUANTITY_EPSILON, Storage, Sale
+import config
+import rollups
+
+POLICIES = ('fefo', 'fifo')
+
+
+def candidate_containers(session, policy='fefo', plantation=None, as_of=None, include_expired=False):
+    """Unsold containers with stock left, in the order the policy draws from them"""
+    if policy not in POLICIES:
+        raise ValueError(f'Invalid policy: {policy}. Allowed: {", ".join(POLICIES)}')
+
+    query = session.query(Storage).filter(
+        Storage.is_sold == False,
+        Storage.remaining_quantity > QUANTITY_EPSILON
+    )
+    if plantation:
+        query = query.filter(Storage.plantation_source == plantation)
+    if not include_expired:
+        query = query.filter(Storage.expiry_date >= (as_of or datetime.utcnow().date()))
+
+    if policy == 'fefo':
+        return query.order_by(Storage.expiry_date, Storage.storage_date, Storage.id)
+    return query.order_by(Storage.storage_date, Storage.id)
+
+
+def plan_allocation(containers, quantity):
+    """Decide how much to take from each container, in order
+
+    Returns a list of (storage, quantity) pairs. Raises ValueError if the
+    containers do not hold enough stock.
+    """
+    if quantity <= 0:
+        raise ValueError('quantity must be positive')
+
+    plan = []
+    needed = quantity
+    for storage in containers:
+        take = min(storage.remaining_quantity, needed)
+        plan.append((storage, take))
+        needed -= take
+        if needed <= QUANTITY_EPSILON:
+            return plan
+
+    available = quantity - needed
+    raise ValueError(f'Cannot sell {quantity}kg. Only {available:.2f}kg available under this policy.')
+
+
+def allocate_sale(session, quantity, sale_fields, policy='fefo', plantation=None, include_expired=False):
+    """Sell quantity kg across containers in one transaction
+
+    sale_fields holds the Sale columns shared by every split (sale_date,
+    buyer_name, price_per_kg, payment_status, payment_date). Returns a list
+    of (storage, sale) pairs; the caller commits.
+    """
+    containers = iter(candidate_containers(
+        session, policy, plantation, as_of=sale_fields['sale_date'], include_expired=include_expired
+    ).yield_per(config.ALLOCATION_CHUNK_SIZE))
+    try:
+        plan = plan_allocation(containers, quantity)
+    finally:
+        # Stop fetching once the quantity is covered; usually only the first chunk is read
+        containers.close()
+
+    allocations = []
+    for storage, take in plan:
+        sale = Sale(storage_id=storage.id, quantity_sold=take, **sale_fields)
+        session.add(sale)
+        storage.record_sale(take)
+        rollups.record_sale(session, sale, storage.plantation_source)
+        allocations.append((storage, sale))
+
+    # One flush writes every Sale and storage update (including is_sold) as batched statements
+    session.flush()
+    return allocations
@@ -2,14 +2,37 @@
 Flask API for Palm Oil Business Management System
 """
 
+import os
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime, date
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker, scoped_session
+from datetime import datetime, date, timedelta
 import config
-from models import Base, Harvest, Milling, Storage, Sale
+from models import QUANTITY_EPSILON, Base, Harvest, Milling, Storage, Sale
 from reports import ReportGenerator
+from report_jobs import ReportJobQueue, ReportQueueFull
+from report_cache import ReportCache
+import aggregates
+import pagination
+import alerts
+import rollups
+import versions
+import http_cache
+import serialization
+import compression
+import ingest
+import allocation
+import concurrency
+import database
+import metrics
+import sql_profiler
+import request_profiler
+import live_updates
+import changes
+import dashboard
+import fieldsets
+import cache
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -21,14 +44,38 @@ allowed_origins = [
     'https://pem-zee.vercel.app',  # Production (UPDATE THIS with your actual Vercel URL)
     'https://pem-zee-*.vercel.app',  # Vercel preview deployments
 ]
-CORS(app, origins=allowed_origins, supports_credentials=True)
+CORS(app, origins=allowed_origins, supports_credentials=True, expose_headers=['ETag', sql_profiler.HEADER, request_profiler.CAPTURE_HEADER])
 
-# Database setup
-engine = create_engine(config.SQLALCHEMY_DATABASE_URI)
-Session = sessionmaker(bind=engine)
+# Fast JSON encoding and negotiated response compression
+app.json = serialization.FastJSONProvider(app)
+compression.init_app(app)
 
-# Initialize report generator
+# Database setup (pool sizing and SQLite pragmas come from config)
+engine = database.create_db_engine()
+session_factory = sessionmaker(bind=engine)
+# One session per request thread, removed when the request ends
+Session = scoped_session(session_factory)
+
+# Initialize report generator and background report job pool
 report_gen = ReportGenerator()
+report_cache = ReportCache()
+report_jobs = ReportJobQueue(session_factory, report_gen, report_cache)
+
+# Live alert / KPI stream; check for changes as soon as this worker commits a write
+live = live_updates.Broadcaster(session_factory)
+event.listen(session_factory, 'after_commit', lambda session: live.wake())
+
+# Shared response cache for the dashboard endpoints; commits evict entries tagged with the tables they bumped
+response_cache = cache.create_cache()
+event.listen(session_factory, 'after_commit',
+             lambda session: response_cache.invalidate(*session.info.get('bumped_versions', ())))
+
+# Request, SQL and pool metrics for the /metrics endpoint
+metrics.init_app(app, engine, session_factory)
+# Per-request SQL profiling and N+1 detection (only when SQL_PROFILING is on)
+sql_profiler.init_app(app, engine)
+# On-demand cProfile / tracemalloc captures (admin header or sampling)
+request_profiler.init_app(app)
 
 # Initialize database tables (critical for production)
 try:
@@ -39,36 +86,150 @@ except Exception as e:
 
 
 def get_session():
-    """Get database session"""
+    """Get the current request's database session"""
     return Session()
 
 
-# ============= HARVEST ENDPOINTS =============
+@app.teardown_appcontext
+def remove_session(exception=None):
+    """Roll back anything left uncommitted and return the connection to the pool"""
+    Session.remove()
+
+
+def versioned(*tables):
+    """Add ETag / If-None-Match support to a read endpoint that depends on the given tables"""
+    return http_cache.conditional(get_session, *tables)
+
+
+# Tables the dashboard summary and alerts are computed from
+DASHBOARD_TABLES = ('harvests', 'milling', 'storage', 'sales')
+
+
+def cached(name, tables, compute, time_dependent=False):
+    """Serve compute() through the response cache, keyed on the request's query args
+
+    time_dependent results (alerts evaluated at the current time) expire at
+    the next alert time boundary unless the request pins ?as_of=.
+    """
+    max_age = None
+    if time_dependent and not request.args.get('as_of'):
+        now = datetime.utcnow()
+        max_age = (alerts.next_time_boundary(now) - now).total_seconds()
+    return response_cache.get_or_compute(
+        get_session, name, tables, compute, params=sorted(request.args.items(multi=True)), max_age=max_age
+    )
+
+
+# ============= LIST ENDPOINT HELPERS =============
+
+HARVEST_LIST = pagination.ListSpec(
+    Harvest,
+    date_column=Harvest.harvest_date,
+    filters={
+        'plantation': Harvest.plantation,
+        'ripeness': Harvest.ripeness,
+        'is_purchased': Harvest.is_purchased
+    },
+    sortable=['harvest_date', 'num_bunches', 'weight_per_bunch'],
+    default_sort='-harvest_date'
+)
+
+MILLING_LIST = pagination.ListSpec(
+    Milling,
+    date_column=Milling.milling_date,
+    filters={
+        'mill_location': Milling.mill_location,
+        'harvest_id': Milling.harvest_id
+    },
+    sortable=['milling_date', 'oil_yield', 'milling_cost'],
+    default_sort='-milling_date'
+)
+
+STORAGE_LIST = pagination.ListSpec(
+    Storage,
+    date_column=Storage.storage_date,
+    filters={
+        'plantation': Storage.plantation_source,
+        'is_sold': Storage.is_sold
+    },
+    sortable=['storage_date', 'quantity'],
+    default_sort='-storage_date'
+)
+
+SALE_LIST = pagination.ListSpec(
+    Sale,
+    date_column=Sale.sale_date,
+    filters={
+        'buyer': Sale.buyer_name,
+        'payment_status': Sale.payment_status,
+        'storage_id': Sale.storage_id
+    },
+    sortable=['sale_date', 'quantity_sold', 'price_per_kg'],
+    default_sort='-sale_date'
+)
+
+
+def list_response(spec):
+    """Serve a list endpoint: filtered and sorted, keyset-paginated or streamed on request"""
+    args = request.args.copy()
+
+    if serialization.wants_stream(args) and not pagination.wants_page(args):
+        session = get_session()
+        try:
+            spec.ordered(session, args)  # Validate arguments before the response starts
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        finally:
+            session.close()
+        return serialization.stream_json_array(
+            session_factory, lambda session: spec.ordered(session, args), spec.serializer(args)
+        )
 
-@app.route(f'{config.API_PREFIX}/harvests', methods=['GET'])
-def get_harvests():
-    """Get all harvest records"""
     session = get_session()
     try:
-        harvests = session.query(Harvest).order_by(Harvest.harvest_date.desc()).all()
-        return jsonify([h.to_dict() for h in harvests])
+        serialize = spec.serializer(args)
+        rows, page_info = pagination.list_query(session, spec, args)
+        return jsonify(pagination.page_response([serialize(row) for row in rows], page_info))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     finally:
         session.close()
 
 
-@app.route(f'{config.API_PREFIX}/harvests/<int:id>', methods=['GET'])
-def get_harvest(id):
-    """Get specific harvest record"""
+def detail_response(model, id, not_found):
+    """Serve a single record by id, narrowed to ?fields= when given"""
     session = get_session()
     try:
-        harvest = session.query(Harvest).get(id)
-        if not harvest:
-            return jsonify({'error': 'Harvest not found'}), 404
-        return jsonify(harvest.to_dict())
+        fieldset = fieldsets.parse(model, request.args.get('fields'))
+        query = session.query(model)
+        if fieldset is not None:
+            query = query.options(*fieldset.load_options())
+        record = query.get(id)
+        if not record:
+            return jsonify({'error': not_found}), 404
+        return jsonify(fieldset.serialize(record) if fieldset is not None else record.to_dict())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     finally:
         session.close()
 
 
+# ============= HARVEST ENDPOINTS =============
+
+@app.route(f'{config.API_PREFIX}/harvests', methods=['GET'])
+@versioned('harvests')
+def get_harvests():
+    """Get harvest records (filterable, keyset-paginated when ?limit= or ?cursor= is given)"""
+    return list_response(HARVEST_LIST)
+
+
+@app.route(f'{config.API_PREFIX}/harvests/<int:id>', methods=['GET'])
+@versioned('harvests')
+def get_harvest(id):
+    """Get specific harvest record"""
+    return detail_response(Harvest, id, 'Harvest not found')
+
+
 @app.route(f'{config.API_PREFIX}/harvests', methods=['POST'])
 def create_harvest():
     """Create new harvest record"""
@@ -88,6 +249,7 @@ def create_harvest():
         )
 
         session.add(harvest)
+        versions.bump_after_commit(session, 'harvests')
         session.commit()
 
         return jsonify(harvest.to_dict()), 201
@@ -98,30 +260,37 @@ def create_harvest():
         session.close()
 
 
-# ============= MILLING ENDPOINTS =============
-
-@app.route(f'{config.API_PREFIX}/milling', methods=['GET'])
-def get_milling():
-    """Get all milling records"""
+@app.route(f'{config.API_PREFIX}/harvests/bulk', methods=['POST'])
+def bulk_create_harvests():
+    """Create many harvest records from a JSON array, NDJSON or CSV upload"""
     session = get_session()
     try:
-        milling_records = session.query(Milling).order_by(Milling.milling_date.desc()).all()
-        return jsonify([m.to_dict() for m in milling_records])
+        chunk_size = request.args.get('chunk_size', type=int)
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+        summary = ingest.bulk_insert_harvests(session, ingest.iter_records(request), chunk_size)
+        return jsonify(summary), 201 if summary['inserted'] and not summary['failed'] else 200
+    except ValueError as e:
+        session.rollback()
+        return jsonify({'error': str(e)}), 400
     finally:
         session.close()
 
 
+# ============= MILLING ENDPOINTS =============
+
+@app.route(f'{config.API_PREFIX}/milling', methods=['GET'])
+@versioned('milling', 'harvests')
+def get_milling():
+    """Get milling records (filterable, keyset-paginated when ?limit= or ?cursor= is given)"""
+    return list_response(MILLING_LIST)
+
+
 @app.route(f'{config.API_PREFIX}/milling/<int:id>', methods=['GET'])
+@versioned('milling', 'harvests')
 def get_milling_record(id):
     """Get specific milling record"""
-    session = get_session()
-    try:
-        milling = session.query(Milling).get(id)
-        if not milling:
-            return jsonify({'error': 'Milling record not found'}), 404
-        return jsonify(milling.to_dict())
-    finally:
-        session.close()
+    return detail_response(Milling, id, 'Milling record not found')
 
 
 @app.route(f'{config.API_PREFIX}/milling', methods=['POST'])
@@ -160,6 +329,8 @@ def create_milling():
         )
 
         session.add(storage)
+        rollups.record_milling(session, milling, plantation_source)
+        versions.bump_after_commit(session, 'milling', 'storage', 'daily_financials')
         session.commit()
 
         return jsonify({
@@ -176,44 +347,54 @@ def create_milling():
 # ============= STORAGE ENDPOINTS =============
 
 @app.route(f'{config.API_PREFIX}/storage', methods=['GET'])
+@versioned('storage')
 def get_storage():
-    """Get all storage inventory"""
-    session = get_session()
-    try:
-        storage_records = session.query(Storage).order_by(Storage.storage_date.desc()).all()
-        return jsonify([s.to_dict() for s in storage_records])
-    finally:
-        session.close()
+    """Get storage inventory (filterable, keyset-paginated when ?limit= or ?cursor= is given)"""
+    return list_response(STORAGE_LIST)
 
 
 @app.route(f'{config.API_PREFIX}/storage/available', methods=['GET'])
+@versioned('storage')
 def get_available_storage():
-    """Get available (not fully sold) storage inventory with remaining quantities"""
+    """Get available (not fully sold) storage inventory with remaining quantities (optional ?fields=)"""
     session = get_session()
     try:
-        # Get all storage records (not fully sold)
-        storage_records = session.query(Storage).filter_by(is_sold=False).all()
-
-        # Filter to only include containers with remaining quantity
-        available_records = [s for s in storage_records if s.remaining_quantity > 0]
+        # Served by the (is_sold, storage_date) index, oldest stock first
+        query = session.query(Storage)
+        fieldset = fieldsets.parse(Storage, request.args.get('fields'))
+        if fieldset is not None:
+            query = query.options(*fieldset.load_options(Storage.remaining_quantity))
+        available_records = query.filter(
+            Storage.is_sold == False,
+            Storage.remaining_quantity > 0
+        ).order_by(Storage.storage_date, Storage.id).all()
 
         # Calculate total remaining quantity
         total_remaining = sum(s.remaining_quantity for s in available_records)
+        serialize = fieldset.serialize if fieldset is not None else Storage.to_dict
 
         return jsonify({
-            'inventory': [s.to_dict() for s in available_records],
+            'inventory': [serialize(s) for s in available_records],
             'total_quantity': total_remaining
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     finally:
         session.close()
 
 
 @app.route(f'{config.API_PREFIX}/storage/alerts', methods=['GET'])
+@versioned('storage')
 def get_storage_alerts():
     """Get storage alerts (near expiry, expired)"""
     session = get_session()
     try:
-        storage_records = session.query(Storage).filter_by(is_sold=False).all()
+        # Only load containers inside the expiry warning window
+        warning_date = datetime.utcnow().date() + timedelta(days=config.STORAGE_EXPIRY_WARNING_DAYS)
+        storage_records = session.query(Storage).filter(
+            Storage.is_sold == False,
+            Storage.expiry_date <= warning_date
+        ).all()
 
         near_expiry = [s.to_dict() for s in storage_records if s.is_near_expiry]
         expired = [s.to_dict() for s in storage_records if s.is_expired]
@@ -228,51 +409,34 @@ def get_storage_alerts():
 
 
 @app.route(f'{config.API_PREFIX}/storage/<int:id>', methods=['GET'])
+@versioned('storage')
 def get_storage_record(id):
     """Get specific storage record"""
-    session = get_session()
-    try:
-        storage = session.query(Storage).get(id)
-        if not storage:
-            return jsonify({'error': 'Storage record not found'}), 404
-        return jsonify(storage.to_dict())
-    finally:
-        session.close()
+    return detail_response(Storage, id, 'Storage record not found')
 
 
 # ============= SALES ENDPOINTS =============
 
 @app.route(f'{config.API_PREFIX}/sales', methods=['GET'])
+@versioned('sales')
 def get_sales():
-    """Get all sales records"""
-    session = get_session()
-    try:
-        sales = session.query(Sale).order_by(Sale.sale_date.desc()).all()
-        return jsonify([s.to_dict() for s in sales])
-    finally:
-        session.close()
+    """Get sales records (filterable, keyset-paginated when ?limit= or ?cursor= is given)"""
+    return list_response(SALE_LIST)
 
 
 @app.route(f'{config.API_PREFIX}/sales/<int:id>', methods=['GET'])
+@versioned('sales')
 def get_sale(id):
     """Get specific sale record"""
-    session = get_session()
-    try:
-        sale = session.query(Sale).get(id)
-        if not sale:
-            return jsonify({'error': 'Sale not found'}), 404
-        return jsonify(sale.to_dict())
-    finally:
-        session.close()
+    return detail_response(Sale, id, 'Sale not found')
 
 
 @app.route(f'{config.API_PREFIX}/sales', methods=['POST'])
 def create_sale():
-    """Create new sale record and update storage"""
-    session = get_session()
-    try:
-        data = request.json
+    """Create new sale record and update storage (re-run if another sale changes the container first)"""
+    data = request.json
 
+    def sell(session):
         # Get storage record
         storage = session.query(Storage).get(data['storage_id'])
         if not storage:
@@ -282,10 +446,10 @@ def create_sale():
         remaining = storage.remaining_quantity
         quantity_to_sell = data['quantity_sold']
 
-        if remaining <= 0:
+        if remaining <= QUANTITY_EPSILON:
             return jsonify({'error': 'This storage container is empty (all quantity sold)'}), 400
 
-        if quantity_to_sell > remaining:
+        if quantity_to_sell > remaining + QUANTITY_EPSILON:
             return jsonify({
                 'error': f'Cannot sell {quantity_to_sell}kg. Only {remaining:.2f}kg available in this container.'
             }), 400
@@ -302,12 +466,13 @@ def create_sale():
         )
 
         session.add(sale)
-        session.flush()  # Flush to update storage.remaining_quantity calculation
 
-        # Mark as sold only if all quantity is sold
+        # Update sold/remaining totals in the same transaction (marks the container sold when empty).
+        # The versioned UPDATE fails if a concurrent sale committed first, and the check above is re-run.
+        storage.record_sale(quantity_to_sell)
         new_remaining = storage.remaining_quantity
-        if new_remaining <= 0:
-            storage.is_sold = True
+        rollups.record_sale(session, sale, storage.plantation_source)
+        versions.bump_after_commit(session, 'sales', 'storage', 'daily_financials')
 
         session.commit()
 
@@ -316,11 +481,58 @@ def create_sale():
             'storage_remaining': new_remaining,
             'container_fully_sold': storage.is_sold
         }), 201
+
+    try:
+        return concurrency.run_with_retry(get_session, sell)
+    except concurrency.WriteConflict as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route(f'{config.API_PREFIX}/sales/allocate', methods=['POST'])
+def allocate_sale():
+    """Sell a total quantity across several containers (FEFO or FIFO) in one transaction"""
+    data = request.json
+
+    def sell(session):
+        sale_fields = dict(
+            sale_date=datetime.strptime(data['sale_date'], '%Y-%m-%d').date(),
+            buyer_name=data['buyer_name'],
+            price_per_kg=data['price_per_kg'],
+            payment_status=data['payment_status'],
+            payment_date=datetime.strptime(data['payment_date'], '%Y-%m-%d').date() if data.get('payment_date') else None
+        )
+
+        split = allocation.allocate_sale(
+            session,
+            quantity=data['quantity'],
+            sale_fields=sale_fields,
+            policy=data.get('policy', 'fefo'),
+            plantation=data.get('plantation'),
+            include_expired=data.get('include_expired', False)
+        )
+        versions.bump_after_commit(session, 'sales', 'storage', 'daily_financials')
+        session.commit()
+
+        return jsonify({
+            'quantity_sold': sum(sale.quantity_sold for _, sale in split),
+            'allocations': [{
+                'storage_id': storage.id,
+                'container_id': storage.container_id,
+                'quantity_sold': sale.quantity_sold,
+                'storage_remaining': storage.remaining_quantity,
+                'container_fully_sold': storage.is_sold,
+                'sale': sale.to_dict()
+            } for storage, sale in split]
+        }), 201
+
+    try:
+        return concurrency.run_with_retry(get_session, sell)
+    except concurrency.WriteConflict as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
-        session.rollback()
         return jsonify({'error': str(e)}), 400
-    finally:
-        session.close()
 
 
 @app.route(f'{config.API_PREFIX}/sales/<int:id>/payment', methods=['PATCH'])
@@ -333,10 +545,14 @@ def update_payment_status(id):
             return jsonify({'error': 'Sale not found'}), 404
 
         data = request.json
+        was_pending = sale.is_payment_pending
         sale.payment_status = data['payment_status']
         if data.get('payment_date'):
             sale.payment_date = datetime.strptime(data['payment_date'], '%Y-%m-%d').date()
 
+        plantation = sale.storage.plantation_source if sale.storage else 'Unknown'
+        rollups.record_payment_change(session, sale, was_pending, plantation)
+        versions.bump_after_commit(session, 'sales', 'daily_financials')
         session.commit()
         return jsonify(sale.to_dict())
     except Exception as e:
@@ -349,143 +565,136 @@ def update_payment_status(id):
 # ============= DASHBOARD ENDPOINTS =============
 
 @app.route(f'{config.API_PREFIX}/dashboard/summary', methods=['GET'])
+@versioned('harvests', 'milling', 'storage', 'sales')
 def get_dashboard_summary():
     """Get financial summary and KPIs"""
     session = get_session()
     try:
-        # Get all records
-        harvests = session.query(Harvest).all()
-        milling_records = session.query(Milling).all()
-        sales = session.query(Sale).all()
-        storage_records = session.query(Storage).filter_by(is_sold=False).all()
-
-        # Calculate totals
-        total_ffb_weight = sum(h.total_weight for h in harvests)
-        total_milling_cost = sum(m.total_cost for m in milling_records)
-        total_oil_produced = sum(m.oil_yield for m in milling_records)
-        total_revenue = sum(s.total_revenue for s in sales)
-        # Use remaining_quantity to show actual available stock (not original quantity)
-        total_storage = sum(s.remaining_quantity for s in storage_records)
-
-        # Calculate profit
-        total_profit = total_revenue - total_milling_cost
-
-        # Payment tracking
-        pending_payments = [s for s in sales if s.is_payment_pending]
-        total_pending_amount = sum(s.total_revenue for s in pending_payments)
-
-        return jsonify({
-            'total_ffb_harvested': total_ffb_weight,
-            'total_oil_produced': total_oil_produced,
-            'total_milling_cost': total_milling_cost,
-            'total_revenue': total_revenue,
-            'total_profit': total_profit,
-            'total_storage': total_storage,
-            'pending_payments_count': len(pending_payments),
-            'total_pending_amount': total_pending_amount,
-            'average_oil_yield': total_oil_produced / len(milling_records) if milling_records else 0
-        })
+        return jsonify(cached('dashboard_summary', DASHBOARD_TABLES, lambda: aggregates.dashboard_summary(session)))
     finally:
         session.close()
 
 
 @app.route(f'{config.API_PREFIX}/dashboard/profit-trends', methods=['GET'])
+@versioned('daily_financials')
 def get_profit_trends():
-    """Get profit trends over time"""
+    """Get profit trends over time from the daily_financials rollup
+
+    Optional query args: granularity (day|week|month), date_from, date_to, plantation.
+    """
     session = get_session()
     try:
-        sales = session.query(Sale).order_by(Sale.sale_date).all()
-        milling_records = session.query(Milling).order_by(Milling.milling_date).all()
-
-        # Group by date
-        trends = {}
-
-        # Add costs
-        for m in milling_records:
-            date_str = m.milling_date.isoformat()
-            if date_str not in trends:
-                trends[date_str] = {'date': date_str, 'cost': 0, 'revenue': 0, 'profit': 0}
-            trends[date_str]['cost'] += m.total_cost
-
-        # Add revenue
-        for s in sales:
-            date_str = s.sale_date.isoformat()
-            if date_str not in trends:
-                trends[date_str] = {'date': date_str, 'cost': 0, 'revenue': 0, 'profit': 0}
-            trends[date_str]['revenue'] += s.total_revenue
-
-        # Calculate profit
-        for date_str in trends:
-            trends[date_str]['profit'] = trends[date_str]['revenue'] - trends[date_str]['cost']
-
-        return jsonify(sorted(trends.values(), key=lambda x: x['date']))
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+
+        return jsonify(cached('profit_trends', ('daily_financials',), lambda: rollups.profit_trends(
+            session,
+            granularity=request.args.get('granularity', 'day'),
+            date_from=date.fromisoformat(date_from) if date_from else None,
+            date_to=date.fromisoformat(date_to) if date_to else None,
+            plantation=request.args.get('plantation')
+        )))
+    except rollups.RollupMissing as e:
+        return jsonify({'error': str(e)}), 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     finally:
         session.close()
 
 
 @app.route(f'{config.API_PREFIX}/dashboard/alerts', methods=['GET'])
+@versioned('harvests', 'milling', 'storage', 'sales')
 def get_all_alerts():
-    """Get all alerts (milling, storage, payments)"""
+    """Get all alerts (milling, storage, payments)
+
+    Optional query args: severity and type (comma-separated), limit, as_of (ISO timestamp).
+    """
     session = get_session()
     try:
-        alerts = []
-
-        # Milling alerts
-        harvests = session.query(Harvest).all()
-        for h in harvests:
-            if h.needs_milling_alert:
-                # Check if already milled
-                milled = session.query(Milling).filter_by(harvest_id=h.id).first()
-                if not milled:
-                    alerts.append({
-                        'type': 'milling',
-                        'severity': 'high',
-                        'message': f'FFB from {h.plantation} harvested on {h.harvest_date} needs milling',
-                        'harvest_id': h.id
-                    })
-
-        # Storage alerts
-        storage_records = session.query(Storage).filter_by(is_sold=False).all()
-        for s in storage_records:
-            if s.is_expired:
-                alerts.append({
-                    'type': 'storage',
-                    'severity': 'critical',
-                    'message': f'Container {s.container_id} has expired!',
-                    'storage_id': s.id
-                })
-            elif s.is_near_expiry:
-                alerts.append({
-                    'type': 'storage',
-                    'severity': 'medium',
-                    'message': f'Container {s.container_id} expires in {s.days_until_expiry} days',
-                    'storage_id': s.id
-                })
-
-        # Low stock alert
-        total_storage = sum(s.quantity for s in storage_records)
-        if total_storage < config.LOW_STOCK_THRESHOLD_KG:
-            alerts.append({
-                'type': 'stock',
-                'severity': 'medium',
-                'message': f'Low stock: Only {total_storage:.2f}kg CPO in storage',
-                'current_stock': total_storage
-            })
-
-        # Payment alerts
-        pending_sales = session.query(Sale).filter_by(payment_status='Pending').all()
-        for s in pending_sales:
-            alerts.append({
-                'type': 'payment',
-                'severity': 'low',
-                'message': f'Payment pending from {s.buyer_name} for ₦{s.total_revenue:,.2f}',
-                'sale_id': s.id
-            })
+        severities = request.args.get('severity')
+        types = request.args.get('type')
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        if limit is not None and limit < 0:
+            raise ValueError('limit must not be negative')
+        as_of = datetime.fromisoformat(request.args['as_of']) if request.args.get('as_of') else None
+
+        return jsonify(cached('alerts', DASHBOARD_TABLES, lambda: alerts.collect_alerts(
+            session,
+            as_of=as_of,
+            severities=severities.split(',') if severities else None,
+            types=types.split(',') if types else None,
+            limit=limit
+        ), time_dependent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        session.close()
 
-        return jsonify({
-            'alerts': alerts,
-            'total_count': len(alerts)
-        })
+
+@app.route(f'{config.API_PREFIX}/dashboard/bootstrap', methods=['GET'])
+@versioned('harvests', 'milling', 'storage', 'sales', 'daily_financials')
+def get_dashboard_bootstrap():
+    """Get the summary, alerts and profit trends for the dashboard in one round trip
+
+    Optional query args: include (comma-separated summary, alerts, trends; default all),
+    alert_limit and as_of for alerts, granularity, date_from, date_to and plantation for trends.
+    """
+    session = get_session()
+    try:
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+        alert_limit = int(request.args['alert_limit']) if request.args.get('alert_limit') else None
+        if alert_limit is not None and alert_limit < 0:
+            raise ValueError('alert_limit must not be negative')
+        sections = dashboard.parse_sections(request.args.get('include'))
+        tables = DASHBOARD_TABLES + ('daily_financials',)
+
+        return jsonify(cached('dashboard_bootstrap', tables, lambda: dashboard.bootstrap(
+            session,
+            sections=sections,
+            as_of=datetime.fromisoformat(request.args['as_of']) if request.args.get('as_of') else None,
+            alert_limit=alert_limit,
+            granularity=request.args.get('granularity', 'day'),
+            date_from=date.fromisoformat(date_from) if date_from else None,
+            date_to=date.fromisoformat(date_to) if date_to else None,
+            plantation=request.args.get('plantation')
+        ), time_dependent='alerts' in sections))
+    except rollups.RollupMissing as e:
+        return jsonify({'error': str(e)}), 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        session.close()
+
+
+@app.route(f'{config.API_PREFIX}/stream', methods=['GET'])
+def stream_updates():
+    """Server-Sent Events stream of dashboard KPI and alert changes"""
+    try:
+        return live_updates.event_stream(live)
+    except live_updates.StreamFull as e:
+        return jsonify({'error': str(e)}), 503
+
+
+# ============= CHANGE FEED =============
+
+@app.route(f'{config.API_PREFIX}/changes', methods=['GET'])
+@versioned('harvests', 'milling', 'storage', 'sales')
+def get_changes():
+    """Harvest, milling, storage and sale rows inserted or updated since ?since=<cursor>
+
+    Omit since for a full first sync. Optional query arg: limit (rows per page across all tables).
+    """
+    session = get_session()
+    try:
+        limit = int(request.args.get('limit', config.CHANGE_FEED_PAGE_SIZE))
+        if limit < 1:
+            raise ValueError('limit must be at least 1')
+        return jsonify(changes.changes_page(
+            session, cursor=request.args.get('since'), limit=min(limit, config.MAX_PAGE_SIZE)
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     finally:
         session.close()
 
@@ -494,21 +703,22 @@ def get_all_alerts():
 
 @app.route(f'{config.API_PREFIX}/reports/excel', methods=['GET'])
 def generate_excel_report():
-    """Generate Excel report"""
+    """Generate Excel report (constant-memory streaming export)"""
     session = get_session()
     try:
         report_type = request.args.get('type', 'summary')
-
-        harvests = session.query(Harvest).all()
-        milling_records = session.query(Milling).all()
-        storage_records = session.query(Storage).all()
-        sales = session.query(Sale).all()
-
-        filepath = report_gen.generate_excel_report(
-            harvests, milling_records, storage_records, sales, report_type
+        if report_type not in config.REPORT_TYPES:
+            allowed = ', '.join(config.REPORT_TYPES)
+            return jsonify({'error': f'Invalid report type: {report_type}. Allowed: {allowed}'}), 400
+
+        # Serve from the report cache when the data hasn't changed; otherwise
+        # stream rows from the database in chunks instead of loading every table
+        filepath, _ = report_cache.get_or_render(
+            session, 'excel', report_type,
+            lambda: report_gen.generate_excel_report_streaming(session, report_type)
         )
 
-        return send_file(filepath, as_attachment=True)
+        return send_file(filepath, as_attachment=True, download_name=f'palm_oil_report_{report_type}.xlsx')
     finally:
         session.close()
 
@@ -519,32 +729,130 @@ def generate_pdf_report():
     session = get_session()
     try:
         report_type = request.args.get('type', 'summary')
+        if report_type not in config.REPORT_TYPES:
+            allowed = ', '.join(config.REPORT_TYPES)
+            return jsonify({'error': f'Invalid report type: {report_type}. Allowed: {allowed}'}), 400
+
+        def render():
+            harvests = session.query(Harvest).all()
+            milling_records = session.query(Milling).all()
+            storage_records = session.query(Storage).all()
+            sales = session.query(Sale).all()
+            return report_gen.generate_pdf_report(
+                harvests, milling_records, storage_records, sales, report_type
+            )
+
+        filepath, _ = report_cache.get_or_render(session, 'pdf', report_type, render)
+
+        return send_file(filepath, as_attachment=True, download_name=f'palm_oil_report_{report_type}.pdf')
+    finally:
+        session.close()
 
-        harvests = session.query(Harvest).all()
-        milling_records = session.query(Milling).all()
-        storage_records = session.query(Storage).all()
-        sales = session.query(Sale).all()
 
-        filepath = report_gen.generate_pdf_report(
-            harvests, milling_records, storage_records, sales, report_type
-        )
+@app.route(f'{config.API_PREFIX}/reports/jobs', methods=['POST'])
+def create_report_job():
+    """Queue a report for background rendering"""
+    try:
+        data = request.json or {}
+        job = report_jobs.submit(data.get('format', 'excel'), data.get('type', 'summary'))
+        job['status_url'] = f'{config.API_PREFIX}/reports/jobs/{job["id"]}'
+        return jsonify(job), 202
+    except ReportQueueFull as e:
+        return jsonify({'error': str(e)}), 429
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        return send_file(filepath, as_attachment=True)
-    finally:
-        session.close()
 
+@app.route(f'{config.API_PREFIX}/reports/jobs/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """Get report job status and progress"""
+    job = report_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Report job not found'}), 404
 
-# ============= HEALTH CHECK =============
+    result = job.to_dict()
+    if job.status == 'done':
+        result['download_url'] = f'{config.API_PREFIX}/reports/jobs/{job.id}/download'
+    return jsonify(result)
+
+
+@app.route(f'{config.API_PREFIX}/reports/jobs/<job_id>/download', methods=['GET'])
+def download_report_job(job_id):
+    """Download the rendered file of a finished report job"""
+    job = report_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Report job not found'}), 404
+    if job.status != 'done':
+        return jsonify({'error': f'Report is not ready (status: {job.status})'}), 409
+    if not os.path.exists(job.filepath):
+        return jsonify({'error': 'Report file has been evicted from the cache. Please create a new job.'}), 410
+
+    extension = 'xlsx' if job.report_format == 'excel' else 'pdf'
+    return send_file(job.filepath, as_attachment=True,
+                     download_name=f'palm_oil_report_{job.report_type}.{extension}')
+
+
+# ============= HEALTH CHECK AND METRICS =============
 
 @app.route(f'{config.API_PREFIX}/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'timestamp': datetime.utcnow().isoformat()
+        'timestamp': datetime.utcnow().isoformat(),
+        'database_pool': database.pool_status(engine)
     })
 
 
+@app.route(config.METRICS_PATH, methods=['GET'])
+def get_metrics():
+    """Prometheus metrics for this worker process"""
+    return metrics.metrics_response()
+
+
+@app.route(f'{config.API_PREFIX}/debug/sql', methods=['GET'])
+def get_sql_profiles():
+    """Recent per-request SQL profiles from this worker (requires SQL_PROFILING)"""
+    if not config.SQL_PROFILING:
+        return jsonify({'error': 'SQL profiling is disabled. Set SQL_PROFILING=true to enable it.'}), 404
+    return jsonify({'profiles': sql_profiler.recent_profiles()})
+
+
+# ============= ADMIN ENDPOINTS =============
+
+def admin_error():
+    """Error response unless the request carries the admin token (None when it does)"""
+    if not config.ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled. Set ADMIN_TOKEN to enable them.'}), 404
+    if not request_profiler.is_admin(request.headers.get(request_profiler.TOKEN_HEADER)):
+        return jsonify({'error': 'Invalid or missing admin token'}), 403
+    return None
+
+
+@app.route(f'{config.API_PREFIX}/admin/cache', methods=['GET'])
+def get_cache_stats():
+    """Response cache tier sizes and this worker's hit/miss counts and ratios"""
+    return admin_error() or jsonify(response_cache.stats())
+
+
+@app.route(f'{config.API_PREFIX}/admin/profiles', methods=['GET'])
+def list_profiles():
+    """List saved request profile captures, newest first"""
+    return admin_error() or jsonify({'captures': request_profiler.list_captures()})
+
+
+@app.route(f'{config.API_PREFIX}/admin/profiles/<capture_id>/<kind>', methods=['GET'])
+def download_profile(capture_id, kind):
+    """Download a capture as raw pstats or as its text summary (kind: pstats|text)"""
+    error = admin_error()
+    if error:
+        return error
+    filepath = request_profiler.capture_path(capture_id, kind)
+    if not filepath:
+        return jsonify({'error': 'Profile capture not found'}), 404
+    return send_file(filepath, as_attachment=True, download_name=os.path.basename(filepath))
+
+
 if __name__ == '__main__':
     # Initialize database
     Base.metadata.create_all(engine)
@@ -0,0 +1,389 @@
+"""
+Endpoint and report benchmark suite
+
+For each dataset size, fills a scratch database with generate_data.py and
+times every API endpoint through the Flask test client, plus the in-memory
+ReportGenerator methods, writing the timings to a JSON file. Compare two
+result files (e.g. from two commits) to spot regressions.
+
+Usage:
+    python benchmark.py --sizes 10000,100000 --output bench-new.json
+    python benchmark.py --compare bench-old.json bench-new.json
+
+Uses a temporary SQLite database unless DATABASE_URL is set.
+WARNING: generate_data replaces all data in the target database.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+
+class Case:
+    """One timed operation; rule and method tie it to an app.py route for coverage checks"""
+
+    def __init__(self, name, run, rule=None, method='GET', setup=None, repeat=None):
+        self.name = name
+        self.run = run
+        self.rule = rule
+        self.method = method
+        self.setup = setup
+        self.repeat = repeat
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(durations):
+    """Latency statistics in milliseconds"""
+    values = sorted(duration * 1000 for duration in durations)
+    return {
+        'runs': len(values),
+        'min_ms': round(values[0], 3),
+        'median_ms': round(statistics.median(values), 3),
+        'p95_ms': round(percentile(values, 95), 3),
+        'mean_ms': round(statistics.fmean(values), 3),
+        'max_ms': round(values[-1], 3)
+    }
+
+
+def build_cases(app_module, context, report_types):
+    """Benchmark cases covering every app.py route plus the ReportGenerator methods"""
+    import versions
+    from models import Harvest, Milling, Storage, Sale
+
+    p = app_module.config.API_PREFIX
+    today = date.today().isoformat()
+    session_factory = app_module.session_factory
+
+    def bump_report_tables():
+        """Invalidate cached reports so the next request renders from scratch"""
+        session = session_factory()
+        try:
+            versions.bump(session, *versions.TABLES)
+            session.commit()
+        finally:
+            session.close()
+
+    def drop_response_cache():
+        """Empty the dashboard response cache so the next request computes from scratch"""
+        app_module.response_cache.invalidate(*versions.TABLES)
+
+    def get(path):
+        return lambda client: client.get(path)
+
+    def post(path, body):
+        return lambda client: client.post(path, json=body)
+
+    sale = {'sale_date': today, 'buyer_name': 'Benchmark', 'price_per_kg': 1000, 'payment_status': 'Pending'}
+    bulk_rows = [{'harvest_date': today, 'plantation': 'Aba', 'num_bunches': 10, 'weight_per_bunch': 15,
+                  'ripeness': 'Ripe'} for _ in range(1000)]
+
+    def run_report_job(report_format):
+        def run(client):
+            job = client.post(f'{p}/reports/jobs', json={'format': report_format, 'type': 'summary'}).get_json()
+            context['job_id'] = job['id']
+            while True:
+                status = client.get(f'{p}/reports/jobs/{job["id"]}')
+                if status.get_json()['status'] in ('done', 'failed'):
+                    return status
+                time.sleep(0.005)
+        return run
+
+    def read_stream_snapshot(client):
+        """Open the live update stream and wait for its first snapshot event"""
+        response = client.get(f'{p}/stream', buffered=False)
+        for chunk in response.response:
+            if b'event: snapshot' in chunk:
+                break
+        response.close()
+
+    def ensure_finished_job():
+        """Have one finished report job to poll and download"""
+        if 'job_id' not in context:
+            run_report_job('excel')(app_module.app.test_client())
+
+    cases = [
+        Case('health', get(f'{p}/health'), f'{p}/health'),
+        Case('metrics', get(app_module.config.METRICS_PATH), app_module.config.METRICS_PATH),
+        Case('sql profiles', get(f'{p}/debug/sql'), f'{p}/debug/sql'),
+        Case('list profile captures', get(f'{p}/admin/profiles'), f'{p}/admin/profiles'),
+        Case('download profile capture', get(f'{p}/admin/profiles/missing/text'), f'{p}/admin/profiles/<capture_id>/<kind>'),
+        Case('list harvests (all)', get(f'{p}/harvests'), f'{p}/harvests', repeat=3),
+        Case('list harvests (page)', get(f'{p}/harvests?limit=50'), f'{p}/harvests'),
+        Case('list harvests (stream)', get(f'{p}/harvests?stream=true'), f'{p}/harvests', repeat=3),
+        Case('get harvest', get(f'{p}/harvests/{context["harvest_id"]}'), f'{p}/harvests/<int:id>'),
+        Case('create harvest', post(f'{p}/harvests', bulk_rows[0]), f'{p}/harvests', 'POST'),
+        Case('bulk create 1000 harvests', post(f'{p}/harvests/bulk', bulk_rows), f'{p}/harvests/bulk', 'POST'),
+        Case('list milling (all)', get(f'{p}/milling'), f'{p}/milling', repeat=3),
+        Case('list milling (page)', get(f'{p}/milling?limit=50'), f'{p}/milling'),
+        Case('list milling (fields)', get(f'{p}/milling?fields=id,milling_date,total_cost'), f'{p}/milling', repeat=3),
+        Case('get milling', get(f'{p}/milling/{context["milling_id"]}'), f'{p}/milling/<int:id>'),
+        Case('create milling', post(f'{p}/milling', {
+            'milling_date': today, 'mill_location': 'Aba Mill', 'harvest_id': context['harvest_id'],
+            'milling_cost': 10000, 'oil_yield': 30
+        }), f'{p}/milling', 'POST'),
+        Case('list storage (all)', get(f'{p}/storage'), f'{p}/storage', repeat=3),
+        Case('list storage (page)', get(f'{p}/storage?limit=50&is_sold=false'), f'{p}/storage'),
+        Case('available storage', get(f'{p}/storage/available'), f'{p}/storage/available', repeat=3),
+        Case('available storage (picker fields)', get(f'{p}/storage/available?fields=id,container_id,remaining_quantity'),
+             f'{p}/storage/available', repeat=3),
+        Case('storage alerts', get(f'{p}/storage/alerts'), f'{p}/storage/alerts'),
+        Case('get storage', get(f'{p}/storage/{context["storage_id"]}'), f'{p}/storage/<int:id>'),
+        Case('list sales (all)', get(f'{p}/sales'), f'{p}/sales', repeat=3),
+        Case('list sales (page)', get(f'{p}/sales?limit=50&payment_status=Pending'), f'{p}/sales'),
+        Case('get sale', get(f'{p}/sales/{context["sale_id"]}'), f'{p}/sales/<int:id>'),
+        Case('create sale', post(f'{p}/sales', dict(sale, storage_id=context['storage_id'], quantity_sold=0.01)),
+             f'{p}/sales', 'POST'),
+        Case('allocate sale', post(f'{p}/sales/allocate', dict(sale, quantity=0.05, include_expired=True)),
+             f'{p}/sales/allocate', 'POST'),
+        Case('update payment', lambda client: client.patch(
+            f'{p}/sales/{context["sale_id"]}/payment', json={'payment_status': 'Pending'}
+        ), f'{p}/sales/<int:id>/payment', 'PATCH'),
+        Case('dashboard summary (cold)', get(f'{p}/dashboard/summary'), f'{p}/dashboard/summary',
+             setup=drop_response_cache),
+        Case('dashboard summary (cached)', get(f'{p}/dashboard/summary'), f'{p}/dashboard/summary'),
+        Case('profit trends (month)', get(f'{p}/dashboard/profit-trends?granularity=month'),
+             f'{p}/dashboard/profit-trends', setup=drop_response_cache),
+        Case('dashboard alerts (cold)', get(f'{p}/dashboard/alerts?limit=100'), f'{p}/dashboard/alerts',
+             setup=drop_response_cache),
+        Case('dashboard alerts (cached)', get(f'{p}/dashboard/alerts?limit=100'), f'{p}/dashboard/alerts'),
+        Case('dashboard bootstrap (cold)', get(f'{p}/dashboard/bootstrap?alert_limit=100'), f'{p}/dashboard/bootstrap',
+             setup=drop_response_cache),
+        Case('dashboard bootstrap (cached)', get(f'{p}/dashboard/bootstrap?alert_limit=100'),
+             f'{p}/dashboard/bootstrap'),
+        Case('cache stats', get(f'{p}/admin/cache'), f'{p}/admin/cache'),
+        Case('stream first snapshot', read_stream_snapshot, f'{p}/stream'),
+        Case('changes (first page)', get(f'{p}/changes'), f'{p}/changes'),
+        Case('report job excel (cold)', run_report_job('excel'), f'{p}/reports/jobs', 'POST',
+             setup=bump_report_tables, repeat=3),
+        Case('report job status', lambda client: client.get(f'{p}/reports/jobs/{context["job_id"]}'),
+             f'{p}/reports/jobs/<job_id>', setup=ensure_finished_job),
+        Case('report job download', lambda client: client.get(f'{p}/reports/jobs/{context["job_id"]}/download'),
+             f'{p}/reports/jobs/<job_id>/download', setup=ensure_finished_job),
+    ]
+
+    for report_type in report_types:
+        cases += [
+            Case(f'excel report {report_type} (cold)', get(f'{p}/reports/excel?type={report_type}'),
+                 f'{p}/reports/excel', setup=bump_report_tables, repeat=3),
+            Case(f'excel report {report_type} (cached)', get(f'{p}/reports/excel?type={report_type}'),
+                 f'{p}/reports/excel'),
+            Case(f'pdf report {report_type} (cold)', get(f'{p}/reports/pdf?type={report_type}'),
+                 f'{p}/reports/pdf', setup=bump_report_tables, repeat=3),
+            Case(f'pdf report {report_type} (cached)', get(f'{p}/reports/pdf?type={report_type}'),
+                 f'{p}/reports/pdf'),
+        ]
+
+    # The in-memory ReportGenerator methods, timed without the query that feeds them
+    def ensure_records():
+        if 'records' in context:
+            return
+        session = session_factory()
+        context['records'] = (session.query(Harvest).all(), session.query(Milling).all(),
+                              session.query(Storage).all(), session.query(Sale).all())
+        context['records_session'] = session
+
+    for report_type in report_types:
+        cases += [
+            Case(f'ReportGenerator.generate_excel_report {report_type}',
+                 lambda client, report_type=report_type: app_module.report_gen.generate_excel_report(
+                     *context['records'], report_type=report_type),
+                 setup=ensure_records, repeat=3),
+            Case(f'ReportGenerator.generate_pdf_report {report_type}',
+                 lambda client, report_type=report_type: app_module.report_gen.generate_pdf_report(
+                     *context['records'], report_type=report_type),
+                 setup=ensure_records, repeat=3),
+        ]
+    return cases
+
+
+def check_coverage(app_module, cases):
+    """Warn about routes in app.py that no benchmark case exercises"""
+    covered = {(case.rule, case.method) for case in cases}
+    for rule in app_module.app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            if (rule.rule, method) not in covered:
+                print(f'  ⚠️  No benchmark case for {method} {rule.rule}')
+
+
+def pick_context(app_module):
+    """Ids of existing records for detail and write endpoints"""
+    from sqlalchemy import func
+    from models import Harvest, Milling, Storage, Sale
+
+    session = app_module.session_factory()
+    try:
+        return {
+            'harvest_id': session.query(func.min(Harvest.id)).scalar(),
+            'milling_id': session.query(func.min(Milling.id)).scalar(),
+            # The fullest unsold container, so repeated small sales never run it dry
+            'storage_id': session.query(Storage.id).filter(Storage.is_sold == False)
+                                 .order_by(Storage.remaining_quantity.desc()).limit(1).scalar(),
+            'sale_id': session.query(func.min(Sale.id)).scalar()
+        }
+    finally:
+        session.close()
+
+
+def run_case(client, case, repeat, warmup):
+    """Time one case; returns its summary dict"""
+    durations = []
+    statuses = {}
+    size = None
+    for attempt in range(warmup + (case.repeat or repeat)):
+        if case.setup:
+            case.setup()
+        started = time.perf_counter()
+        response = case.run(client)
+        elapsed = time.perf_counter() - started
+
+        status = getattr(response, 'status_code', None)
+        if status is not None:
+            size = len(response.get_data())
+            response.close()
+            statuses[status] = statuses.get(status, 0) + 1
+        if attempt >= warmup:
+            durations.append(elapsed)
+
+    result = summarize(durations)
+    if statuses:
+        result['status'] = max(statuses, key=statuses.get)
+        result['bytes'] = size
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, repeat, warmup, report_types, skip, seed):
+    import config
+    config.REPORTS_DIR = tempfile.mkdtemp(prefix='benchmark-reports-')
+    config.REPORT_CACHE_DIR = os.path.join(config.REPORTS_DIR, 'cache')
+    config.CACHE_DIR = os.path.join(config.REPORTS_DIR, 'response-cache')
+
+    import sqlalchemy
+    import app as app_module
+    import generate_data
+
+    client = app_module.app.test_client()
+    results = []
+
+    for size in sizes:
+        print(f'\n=== {size:,} harvests ===')
+        session = app_module.session_factory()
+        try:
+            generate_data.generate(session, size, seed=seed, log=lambda message: None)
+        finally:
+            session.close()
+
+        context = pick_context(app_module)
+        cases = build_cases(app_module, context, report_types)
+        if size == sizes[0]:
+            check_coverage(app_module, cases)
+
+        for case in cases:
+            if any(pattern in case.name for pattern in skip):
+                continue
+            result = run_case(client, case, repeat, warmup)
+            results.append(dict(size=size, case=case.name, **result))
+            print(f'  {case.name:<48} median {result["median_ms"]:>10.2f} ms   p95 {result["p95_ms"]:>10.2f} ms'
+                  + (f'   [{result["status"]}]' if result.get('status') not in (None, 200, 201, 202) else ''))
+
+        if 'records_session' in context:
+            context['records_session'].close()
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'database': app_module.engine.dialect.name,
+            'repeat': repeat,
+            'warmup': warmup,
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+def compare(old_path, new_path, threshold):
+    """Print median changes between two result files; returns True if any case regressed"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    baseline = {(r['size'], r['case']): r for r in old['results']}
+    print(f'{old["meta"].get("commit")} -> {new["meta"].get("commit")} (regression threshold x{threshold})')
+    regressed = False
+    for result in new['results']:
+        before = baseline.get((result['size'], result['case']))
+        if not before:
+            continue
+        ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        flag = ''
+        if ratio >= threshold:
+            flag = '  ❌ REGRESSION'
+            regressed = True
+        elif ratio <= 1 / threshold:
+            flag = '  ✅ faster'
+        print(f'{result["size"]:>10,}  {result["case"]:<48} {before["median_ms"]:>10.2f} -> '
+              f'{result["median_ms"]:>10.2f} ms  x{ratio:.2f}{flag}')
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000', help='Comma-separated harvest counts to generate')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per case (slow cases use fewer)')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--report-types', default='summary', help='Comma-separated report types to time')
+    parser.add_argument('--skip', default='', help='Comma-separated substrings of case names to skip')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files and exit')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Median slowdown ratio counted as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+    output = run_benchmarks(
+        sizes=[int(size) for size in args.sizes.split(',')],
+        repeat=args.repeat,
+        warmup=args.warmup,
+        report_types=[t for t in args.report_types.split(',') if t],
+        skip=[s for s in args.skip.split(',') if s],
+        seed=args.seed
+    )
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f'\nWrote {len(output["results"])} results to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
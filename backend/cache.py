@@ -0,0 +1,314 @@
+"""
+Two-tier cache for expensive read endpoints
+
+Values are cached under a name plus the request's parameters and tagged
+with the tables they are computed from. Lookups go through:
+
+1. a per-worker LRU tier (LocalTier), bounded by CACHE_LOCAL_MAX_BYTES of
+   encoded JSON and CACHE_LOCAL_TTL_SECONDS
+2. a tier shared by every worker: a SQLite file under CACHE_DIR (SQLiteTier)
+   or, when CACHE_REDIS_URL is set and the redis package is installed,
+   Redis (RedisTier). The SQLite tier is bounded by CACHE_SHARED_MAX_BYTES
+   with least-recently-used eviction; size Redis with maxmemory and an LRU
+   policy.
+
+Every entry records the table change counters (see versions.py) it was
+computed against, and a lookup only accepts an entry whose counters match
+the current ones. A write committed by any worker or script therefore makes
+older entries unreachable at once, including copies in other workers'
+local tiers. On top of that, commits made through the app delete the
+entries tagged with the tables they bumped (invalidate()), so dead entries
+don't take up space until evicted.
+
+Outcomes are counted per cache name (local_hit, shared_hit, miss, error) in
+the cache_requests metric and in stats() for GET /api/admin/cache.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+import config
+import metrics
+import serialization
+import versions
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+
+RESULTS = ('local_hit', 'shared_hit', 'miss', 'error')
+SHARED_TOUCH_SECONDS = 30  # Refresh an entry's last-used time in the SQLite tier at most this often
+
+Entry = namedtuple('Entry', 'tags generations value size expires_at')
+
+
+def cache_key(name, params):
+    """Key for a cache name and JSON-serializable parameters"""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:20]
+    return f'{name}:{digest}'
+
+
+class LocalTier:
+    """In-process LRU of decoded values, bounded by their encoded size and a TTL"""
+
+    def __init__(self, max_bytes=config.CACHE_LOCAL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete_tags(self, tags):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if set(entry.tags) & set(tags)]:
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+
+class SQLiteTier:
+    """Shared tier in a SQLite file, used by every worker on the host"""
+
+    backend = 'sqlite'
+
+    def __init__(self, path, max_bytes=config.CACHE_SHARED_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, tags TEXT NOT NULL, generations TEXT NOT NULL, value BLOB NOT NULL, '
+                'size INTEGER NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_entries_used_at ON entries (used_at)')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key, now):
+        """(generations, encoded value) for a live entry, or None"""
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT generations, value, used_at FROM entries WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[2] > SHARED_TOUCH_SECONDS:
+            connection.execute('UPDATE entries SET used_at = ? WHERE key = ?', (now, key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, tags, generations, encoded, expires_at, now):
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO entries (key, tags, generations, value, size, expires_at, used_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, f',{",".join(tags)},', json.dumps(generations), encoded, len(encoded), expires_at, now)
+        )
+        self.evict(now)
+
+    def evict(self, now):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        connection = self._connection()
+        connection.execute('DELETE FROM entries WHERE expires_at <= ?', (now,))
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in connection.execute('SELECT key, size FROM entries ORDER BY used_at').fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+
+    def delete_tags(self, tags):
+        connection = self._connection()
+        for tag in tags:
+            connection.execute('DELETE FROM entries WHERE tags LIKE ?', (f'%,{tag},%',))
+
+    def stats(self):
+        entries, total = self._connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'backend': self.backend, 'entries': entries, 'bytes': total, 'max_bytes': self.max_bytes}
+
+
+class RedisTier:
+    """Shared tier in Redis: one hash per entry plus a set of keys per tag"""
+
+    backend = 'redis'
+    PREFIX = 'palm_oil:cache:'
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key, now):
+        generations, encoded = self.client.hmget(self.PREFIX + key, 'generations', 'value')
+        if encoded is None:
+            return None
+        return json.loads(generations), encoded
+
+    def set(self, key, tags, generations, encoded, expires_at, now):
+        name = self.PREFIX + key
+        pipeline = self.client.pipeline()
+        pipeline.hset(name, mapping={'generations': json.dumps(generations), 'value': encoded})
+        pipeline.expire(name, max(1, int(expires_at - now)))
+        for tag in tags:
+            pipeline.sadd(f'{self.PREFIX}tag:{tag}', name)
+        pipeline.execute()
+
+    def delete_tags(self, tags):
+        for tag in tags:
+            tag_key = f'{self.PREFIX}tag:{tag}'
+            names = self.client.smembers(tag_key)
+            self.client.delete(tag_key, *names)
+
+    def stats(self):
+        memory = self.client.info('memory')
+        return {'backend': self.backend, 'bytes': memory.get('used_memory'), 'max_bytes': memory.get('maxmemory')}
+
+
+class Cache:
+    """Look up computed values in the local, then the shared tier, computing them on a miss"""
+
+    def __init__(self, local, shared=None, enabled=True, local_ttl=config.CACHE_LOCAL_TTL_SECONDS,
+                 shared_ttl=config.CACHE_SHARED_TTL_SECONDS):
+        self.local = local
+        self.shared = shared
+        self.enabled = enabled
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _record(self, name, result):
+        metrics.CACHE_REQUESTS.inc(name, result)
+        with self._lock:
+            counts = self._counts.setdefault(name, dict.fromkeys(RESULTS, 0))
+            counts[result] += 1
+
+    def _shared_call(self, name, method, *args):
+        """Call the shared tier; a failure there counts as an error and never fails the request"""
+        try:
+            return method(*args)
+        except Exception as e:
+            self._record(name, 'error')
+            print(f'Warning: shared cache {method.__name__} failed: {e}')
+            return None
+
+    def get_or_compute(self, get_session, name, tables, compute, params=None, max_age=None):
+        """Cached result of compute(), valid while the given tables are unchanged
+
+        The table counters are read in a session of their own that is closed
+        before compute() runs, so compute() starts a fresh transaction.
+        max_age caps how long the value may be served (e.g. until a time-based
+        alert boundary). compute() must return JSON-serializable data.
+        """
+        if not self.enabled:
+            return compute()
+
+        session = get_session()
+        try:
+            generations = versions.current(session, *tables)
+        finally:
+            session.close()
+
+        key = cache_key(name, params)
+        now = time.time()
+        entry = self.local.get(key, now)
+        if entry is not None and entry.generations == generations:
+            self._record(name, 'local_hit')
+            return entry.value
+
+        local_expires = now + (min(self.local_ttl, max_age) if max_age is not None else self.local_ttl)
+        shared_expires = now + (min(self.shared_ttl, max_age) if max_age is not None else self.shared_ttl)
+
+        if self.shared is not None:
+            found = self._shared_call(name, self.shared.get, key, now)
+            if found is not None and found[0] == generations:
+                value = json.loads(found[1])
+                self.local.set(key, Entry(tables, generations, value, len(found[1]), local_expires))
+                self._record(name, 'shared_hit')
+                return value
+
+        self._record(name, 'miss')
+        value = compute()
+        # Encoded the way responses are, so a shared hit serializes to the same bytes
+        encoded = serialization.dumps(value)
+        self.local.set(key, Entry(tables, generations, value, len(encoded), local_expires))
+        if self.shared is not None:
+            self._shared_call(name, self.shared.set, key, tables, generations, encoded, shared_expires, now)
+        return value
+
+    def invalidate(self, *tags):
+        """Drop entries tagged with any of the given tables (called after a write commits)"""
+        if not self.enabled or not tags:
+            return
+        self.local.delete_tags(tags)
+        if self.shared is not None:
+            self._shared_call('invalidate', self.shared.delete_tags, tags)
+
+    def stats(self):
+        """Tier sizes and this worker's lookup outcomes with hit ratios"""
+        with self._lock:
+            requests = {name: dict(counts) for name, counts in self._counts.items()}
+        for counts in requests.values():
+            lookups = counts['local_hit'] + counts['shared_hit'] + counts['miss']
+            counts['hit_ratio'] = round((counts['local_hit'] + counts['shared_hit']) / lookups, 4) if lookups else None
+        shared = self._shared_call('stats', self.shared.stats) if self.shared is not None else None
+        return {
+            'enabled': self.enabled,
+            'worker': os.getpid(),
+            'local': self.local.stats(),
+            'shared': shared,
+            'requests': requests
+        }
+
+
+def create_cache():
+    """Cache configured from the CACHE_* settings"""
+    if not config.CACHE_ENABLED:
+        return Cache(LocalTier(), enabled=False)
+    if config.CACHE_REDIS_URL and redis is not None:
+        shared = RedisTier(config.CACHE_REDIS_URL)
+    else:
+        if config.CACHE_REDIS_URL:
+            print('Warning: CACHE_REDIS_URL is set but the redis package is not installed; using the SQLite cache')
+        shared = SQLiteTier(os.path.join(config.CACHE_DIR, 'shared.db'))
+    return Cache(LocalTier(), shared)
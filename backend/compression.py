@@ -0,0 +1,67 @@
+"""
+Response compression negotiated via Accept-Encoding
+
+Compresses JSON and text responses above COMPRESSION_MIN_BYTES with brotli
+(when the optional brotli package is installed) or gzip. File downloads and
+streamed responses are passed through untouched.
+"""
+
+import gzip
+from flask import request
+import config
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/csv')
+
+
+def available_encodings():
+    """Encodings this server can produce, in order of preference"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(data, encoding):
+    """Compress bytes with the given content encoding"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=config.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=config.COMPRESSION_GZIP_LEVEL)
+
+
+def compress_response(response):
+    """after_request hook: compress eligible responses"""
+    if (response.status_code < 200 or response.status_code >= 300
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    if len(data) < config.COMPRESSION_MIN_BYTES:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    # The compressed bytes differ from the identity representation, so the
+    # ETag can only promise semantic (weak) equivalence
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def init_app(app):
+    """Register response compression on a Flask app"""
+    app.after_request(compress_response)
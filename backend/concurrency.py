@@ -0,0 +1,62 @@
+"""
+Retry write transactions that lose a race with another worker
+
+Storage rows are versioned (Storage.version_id), so when two requests sell
+from the same container concurrently the second one's UPDATE matches no row
+and SQLAlchemy raises StaleDataError instead of overselling. The whole
+transaction is then re-run against fresh data, up to WRITE_RETRY_ATTEMPTS
+times. Lock timeouts on SQLite and serialization failures / deadlocks on
+PostgreSQL are retried the same way.
+"""
+
+import random
+import time
+from sqlalchemy.exc import OperationalError, DBAPIError
+from sqlalchemy.orm.exc import StaleDataError
+import config
+
+# PostgreSQL serialization_failure and deadlock_detected
+RETRYABLE_PGCODES = ('40001', '40P01')
+
+
+class WriteConflict(Exception):
+    """A write kept conflicting with concurrent updates and was given up"""
+
+
+def is_retryable(error):
+    """Check whether a failed transaction is safe to re-run from scratch"""
+    if isinstance(error, StaleDataError):
+        return True
+    if isinstance(error, OperationalError) and 'database is locked' in str(error.orig):
+        return True
+    if isinstance(error, DBAPIError):
+        return getattr(error.orig, 'pgcode', None) in RETRYABLE_PGCODES
+    return False
+
+
+def run_with_retry(session_factory, work, attempts=None):
+    """Run work(session) in a fresh session, retrying on write conflicts
+
+    work must do all of its reads inside the session it is given and commit
+    it; the session is rolled back and closed between attempts. Raises
+    WriteConflict when every attempt conflicted.
+    """
+    attempts = attempts or config.WRITE_RETRY_ATTEMPTS
+
+    for attempt in range(1, attempts + 1):
+        session = session_factory()
+        try:
+            return work(session)
+        except Exception as e:
+            session.rollback()
+            if not is_retryable(e):
+                raise
+            if attempt == attempts:
+                raise WriteConflict(
+                    'The record was changed by another request. Please try again.'
+                ) from e
+        finally:
+            session.close()
+
+        # Jittered exponential backoff so colliding workers don't retry in lockstep
+        time.sleep(config.WRITE_RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
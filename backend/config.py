@@ -17,6 +17,22 @@ else:
     DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'palm_oil.db')
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{DATABASE_PATH}'
 
+# Connection Pool (per worker process; size it so workers x (pool + overflow) stays under the database's connection limit)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))  # Extra connections allowed under burst load
+DB_POOL_TIMEOUT_SECONDS = 30  # Wait this long for a free connection before failing
+DB_POOL_RECYCLE_SECONDS = 1800  # Replace connections older than this (avoids server-side idle timeouts)
+DB_POOL_PRE_PING = True  # Check connections on checkout so a restarted database doesn't surface as errors
+
+# Applied to every new SQLite connection: WAL lets readers run alongside the writer
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # Safe with WAL; fsync at checkpoints instead of every commit
+    'busy_timeout': 5000,  # ms to wait for a lock before "database is locked"
+    'cache_size': -64000,  # Negative = KiB, i.e. 64 MB page cache
+    'mmap_size': 268435456  # 256 MB memory-mapped I/O
+}
+
 # Business Configuration
 OER_PERCENTAGE = 0.20  # Oil Extraction Rate (20%)
 DEFAULT_SHELF_LIFE_DAYS = 30  # CPO shelf life in days
@@ -36,5 +52,75 @@ HOST = '0.0.0.0'
 PORT = int(os.getenv('PORT', 5001))  # Use PORT from environment in production
 DEBUG = os.getenv('FLASK_ENV') != 'production'  # Disable debug in production
 
+# Pagination
+DEFAULT_PAGE_SIZE = 50  # Rows per page when ?limit= is given without a value
+MAX_PAGE_SIZE = 500  # Upper bound on ?limit=
+CHANGE_FEED_PAGE_SIZE = 500  # Rows per /api/changes page when ?limit= is not given
+STREAM_CHUNK_SIZE = 500  # Rows fetched and flushed per chunk for ?stream=true list responses
+
+# Concurrent Writes
+WRITE_RETRY_ATTEMPTS = 5  # Times a sale is re-run after losing a race on the same container
+WRITE_RETRY_BACKOFF_SECONDS = 0.02  # Base delay, doubled (with jitter) after each conflict
+ALLOCATION_CHUNK_SIZE = 20  # Candidate containers fetched per round trip when splitting an order
+
+# Bulk Ingestion
+BULK_INSERT_CHUNK_SIZE = 1000  # Rows per executemany batch / transaction for /harvests/bulk
+BULK_MAX_ERRORS = 1000  # Per-row errors returned in a bulk response (the failed count is always exact)
+
+# Metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() != 'false'  # Record request, SQL and report metrics
+METRICS_PATH = '/metrics'  # Prometheus scrape endpoint
+
+# SQL Profiling (development aid: records the calling code of every statement)
+SQL_PROFILING = os.getenv('SQL_PROFILING', 'false').lower() == 'true'
+SQL_SLOW_QUERY_MS = float(os.getenv('SQL_SLOW_QUERY_MS', 200))  # Log statements slower than this with their EXPLAIN plan
+SQL_N_PLUS_ONE_THRESHOLD = 5  # Identical statements per request reported as an N+1 pattern
+SQL_PROFILE_HISTORY = 50  # Recent request profiles kept per worker for /api/debug/sql
+
+# Request Profiling (cProfile / tracemalloc captures, see request_profiler.py)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')  # Required in X-Admin-Token for on-demand captures and /api/admin endpoints
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))  # Share of PROFILE_SAMPLE_ENDPOINTS requests captured
+PROFILE_SAMPLE_ENDPOINTS = ('generate_excel_report', 'generate_pdf_report', 'get_all_alerts')
+PROFILE_MAX_CAPTURES = 50  # Oldest captures are deleted beyond this
+PROFILE_TRACEMALLOC_FRAMES = 10  # Stack depth recorded per allocation in memory captures
+
+# Live Updates (Server-Sent Events on /api/stream)
+STREAM_POLL_SECONDS = 1  # How often each worker checks the change counters while streams are open
+STREAM_HEARTBEAT_SECONDS = 15  # Keep-alive comment interval on idle streams
+STREAM_MAX_SECONDS = 300  # Close streams after this long; EventSource reconnects and gets a fresh snapshot
+STREAM_RETRY_MS = 3000  # Reconnect delay suggested to EventSource clients
+STREAM_MAX_SUBSCRIBERS = int(os.getenv('STREAM_MAX_SUBSCRIBERS', 100))  # Open streams per worker (each holds a thread)
+STREAM_QUEUE_SIZE = 100  # Undelivered events per stream before a slow client is disconnected
+
+# Web Server (read by gunicorn.conf.py)
+# Worker processes. Each has its own connection pool and serves up to STREAM_MAX_SUBSCRIBERS streams, so a
+# deploy holds WEB_WORKERS x STREAM_MAX_SUBSCRIBERS streams (400 by default) on WEB_WORKERS x 15 connections
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', 4))
+# Threads per gthread worker: one per pooled connection for ordinary requests plus one per open stream
+# (streams don't hold a connection), so requests beyond the pool queue in gunicorn rather than on the pool
+WEB_THREADS = DB_POOL_SIZE + DB_MAX_OVERFLOW + STREAM_MAX_SUBSCRIBERS
+
+# Response Cache (dashboard summary, alerts and profit trends; see cache.py)
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() != 'false'
+CACHE_LOCAL_MAX_BYTES = int(os.getenv('CACHE_LOCAL_MAX_BYTES', 32 * 1024 * 1024))  # Per worker, measured as encoded JSON
+CACHE_LOCAL_TTL_SECONDS = 300
+CACHE_SHARED_MAX_BYTES = int(os.getenv('CACHE_SHARED_MAX_BYTES', 256 * 1024 * 1024))  # SQLite shared tier
+CACHE_SHARED_TTL_SECONDS = 3600
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')  # Shared tier in Redis instead of a SQLite file (needs the redis package)
+
+# Response Compression
+COMPRESSION_MIN_BYTES = 1024  # Don't compress responses smaller than this
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5  # Used when the optional brotli package is installed
+
 # Report Configuration
 REPORTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'reports')
+REPORT_CHUNK_SIZE = 1000  # Rows fetched per round trip when streaming Excel exports
+REPORT_TYPES = ['summary', 'all', 'harvest', 'milling', 'storage', 'sales']
+REPORT_JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', 2))  # Concurrent background renders per API worker
+REPORT_JOB_MAX_PENDING = int(os.getenv('REPORT_JOB_MAX_PENDING', 10))  # Queued + running jobs before new ones are rejected
+REPORT_CACHE_DIR = os.path.join(REPORTS_DIR, 'cache')
+PROFILES_DIR = os.path.join(os.path.dirname(REPORTS_DIR), 'profiles')  # Request profile captures, next to reports/
+CACHE_DIR = os.path.join(os.path.dirname(REPORTS_DIR), 'cache')  # SQLite shared response cache
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', 200 * 1024 * 1024))  # Evict least recently used reports above this
+REPORT_CACHE_MAX_AGE_DAYS = 7  # Evict cached reports not used for this long
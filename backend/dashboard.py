@@ -0,0 +1,74 @@
+"""
+Dashboard bootstrap: summary, alerts and profit trends in one call
+
+The home page needs the KPI summary, the alert list and the profit trend
+series. Served separately they cost three round trips and scan the sales,
+milling and storage tables once per endpoint. bootstrap() computes them in
+one session from a shared plan:
+
+- aggregates.dashboard_totals(): every KPI figure plus the unsold stock the
+  low-stock alert needs, in a single statement
+- alerts.collect_alerts(): the per-category alert lists, reusing that stock figure
+- rollups.profit_trends(): read from the daily_financials rollup
+
+On PostgreSQL the session runs at REPEATABLE READ so all sections come from
+one snapshot. SQLite reads each statement from the latest commit, as the
+separate endpoints do.
+"""
+
+import aggregates
+import alerts
+import rollups
+
+
+SECTIONS = ('summary', 'alerts', 'trends')
+
+
+def use_snapshot(session):
+    """Make every following read in this transaction see the same snapshot (PostgreSQL)
+
+    The isolation level can only be set before the transaction's first
+    statement, so raises RuntimeError if the session has already read
+    something (on every database, so ordering mistakes show up on SQLite too).
+    """
+    if session.in_transaction():
+        raise RuntimeError('use_snapshot() must be called before anything is read in the session')
+    if session.get_bind().dialect.name == 'postgresql':
+        session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+
+
+def parse_sections(value):
+    """Parse ?include=summary,alerts into a tuple of sections (all when empty)"""
+    if not value:
+        return SECTIONS
+    sections = tuple(section.strip() for section in value.split(',') if section.strip())
+    unknown = [section for section in sections if section not in SECTIONS]
+    if unknown:
+        raise ValueError(f'Unknown section: {", ".join(unknown)}. Allowed: {", ".join(SECTIONS)}')
+    return sections
+
+
+def bootstrap(session, sections=SECTIONS, as_of=None, alert_limit=None, granularity='day',
+              date_from=None, date_to=None, plantation=None):
+    """{section: data} for the requested sections, shaped like their standalone endpoints
+
+    Must be called before anything else has been read in the session's
+    transaction (see use_snapshot).
+    """
+    use_snapshot(session)
+    result = {}
+
+    totals = None
+    if 'summary' in sections or 'alerts' in sections:
+        totals = aggregates.dashboard_totals(session)
+    if 'summary' in sections:
+        result['summary'] = aggregates.summary_from_totals(totals)
+    if 'alerts' in sections:
+        result['alerts'] = alerts.collect_alerts(
+            session, as_of=as_of, limit=alert_limit, unsold_quantity=totals['storage_unsold_quantity']
+        )
+    if 'trends' in sections:
+        result['trends'] = rollups.profit_trends(
+            session, granularity=granularity, date_from=date_from, date_to=date_to, plantation=plantation
+        )
+    return result
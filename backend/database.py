@@ -0,0 +1,78 @@
+"""
+Database engine setup: connection pool sizing and SQLite pragmas
+
+Every entry point (the API, init_db and the maintenance scripts) creates its
+engine through create_db_engine() so they all get the same pool settings
+and, on SQLite, WAL mode so readers don't block the writer.
+"""
+
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+import config
+import metrics
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def connect(self):
+        started = time.perf_counter()
+        connection = super().connect()
+        metrics.DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+        return connection
+
+
+def is_sqlite_memory(url):
+    """Check whether a URL points at an in-memory SQLite database"""
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """connect event: apply SQLITE_PRAGMAS to each new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in config.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def create_db_engine(database_uri=None):
+    """Create an engine configured from the DB_POOL_* and SQLITE_PRAGMAS settings"""
+    url = make_url(database_uri or config.SQLALCHEMY_DATABASE_URI)
+    options = {'pool_pre_ping': config.DB_POOL_PRE_PING}
+
+    # In-memory SQLite uses a single shared connection, so pool sizing doesn't apply
+    if not is_sqlite_memory(url):
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=config.DB_POOL_RECYCLE_SECONDS
+        )
+
+    engine = create_engine(url, **options)
+    if url.get_backend_name() == 'sqlite':
+        event.listen(engine, 'connect', apply_sqlite_pragmas)
+    return engine
+
+
+def pool_status(engine):
+    """Current connection pool usage, for sizing the pool against the worker count"""
+    pool = engine.pool
+    status = {'pool_class': type(pool).__name__}
+    if not isinstance(pool, QueuePool):
+        return status
+
+    return dict(
+        status,
+        size=pool.size(),
+        max_overflow=pool._max_overflow,
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        # QueuePool reports unopened capacity as negative overflow; only count connections beyond size
+        overflow=max(pool.overflow(), 0)
+    )
@@ -0,0 +1,128 @@
+"""
+Sparse fieldsets for read endpoints (?fields=id,container_id,remaining_quantity)
+
+Every field a model's to_dict() returns is declared here with the columns it
+is computed from. A request for some fields loads only those columns
+(load_only), and only loads a milling record's harvest, with just its cost
+columns, when a requested field depends on the FFB cost. Values match
+to_dict() exactly.
+"""
+
+from datetime import date, datetime
+from sqlalchemy.orm import load_only, selectinload
+from models import Harvest, Milling, Storage, Sale
+
+
+class Field:
+    """One serialized field: the columns it reads and how to compute it from a row
+
+    harvest_columns are Harvest columns read through Milling.harvest.
+    """
+
+    def __init__(self, columns, value, harvest_columns=()):
+        self.columns = tuple(columns)
+        self.value = value
+        self.harvest_columns = tuple(harvest_columns)
+
+
+def iso(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def columns(*names):
+    """Plain column fields"""
+    return {name: Field((name,), lambda row, name=name: iso(getattr(row, name))) for name in names}
+
+
+def derived(attribute, *column_names, harvest_columns=()):
+    """Field computed by a model property from the given columns"""
+    return Field(column_names, lambda row: iso(getattr(row, attribute)), harvest_columns)
+
+
+WEIGHT_COLUMNS = ('num_bunches', 'weight_per_bunch')
+FFB_COST_COLUMNS = ('is_purchased', 'purchase_price') + WEIGHT_COLUMNS
+MILLING_COST_COLUMNS = ('milling_cost', 'transport_cost')
+EXPIRY_COLUMNS = ('storage_date', 'max_shelf_life_days')
+
+FIELDS = {
+    Harvest: {
+        **columns('id', 'harvest_date', 'plantation', 'num_bunches', 'weight_per_bunch', 'ripeness'),
+        'total_weight': derived('total_weight', *WEIGHT_COLUMNS),
+        'expected_oil_yield': derived('expected_oil_yield', *WEIGHT_COLUMNS),
+        'expected_oil_yield_liters': derived('expected_oil_yield_liters', *WEIGHT_COLUMNS),
+        **columns('is_purchased', 'supplier_name', 'purchase_price'),
+        'ffb_cost': derived('ffb_cost', *FFB_COST_COLUMNS),
+        'cost_per_kg': derived('cost_per_kg', *FFB_COST_COLUMNS),
+        'needs_milling_alert': derived('needs_milling_alert', 'harvest_date'),
+        **columns('created_at'),
+    },
+    Milling: {
+        **columns('id', 'milling_date', 'mill_location', 'harvest_id', 'milling_cost', 'oil_yield'),
+        'oil_yield_liters': derived('oil_yield_liters', 'oil_yield'),
+        **columns('transport_cost'),
+        'cost_per_kg': derived('cost_per_kg', 'oil_yield', *MILLING_COST_COLUMNS),
+        'cost_per_liter': derived('cost_per_liter', 'oil_yield', 'harvest_id', *MILLING_COST_COLUMNS,
+                                  harvest_columns=FFB_COST_COLUMNS),
+        'total_cost': derived('total_cost', 'harvest_id', *MILLING_COST_COLUMNS, harvest_columns=FFB_COST_COLUMNS),
+        **columns('created_at'),
+    },
+    Storage: {
+        **columns('id', 'container_id', 'milling_id', 'quantity'),
+        'quantity_liters': derived('quantity_liters', 'quantity'),
+        'total_sold': derived('total_sold', 'quantity_sold'),
+        **columns('remaining_quantity'),
+        'remaining_quantity_liters': derived('remaining_quantity_liters', 'remaining_quantity'),
+        **columns('storage_date', 'max_shelf_life_days', 'plantation_source', 'is_sold'),
+        'expiry_date': derived('expiry_date', *EXPIRY_COLUMNS),
+        'days_until_expiry': derived('days_until_expiry', *EXPIRY_COLUMNS),
+        'is_near_expiry': derived('is_near_expiry', 'is_sold', *EXPIRY_COLUMNS),
+        'is_expired': derived('is_expired', 'is_sold', *EXPIRY_COLUMNS),
+        **columns('created_at'),
+    },
+    Sale: {
+        **columns('id', 'sale_date', 'buyer_name', 'storage_id', 'quantity_sold'),
+        'quantity_sold_liters': derived('quantity_sold_liters', 'quantity_sold'),
+        **columns('price_per_kg', 'payment_status', 'payment_date'),
+        'total_revenue': derived('total_revenue', 'quantity_sold', 'price_per_kg'),
+        'is_payment_pending': derived('is_payment_pending', 'payment_status'),
+        **columns('created_at'),
+    },
+}
+
+
+class FieldSet:
+    """The requested fields of one model"""
+
+    def __init__(self, model, names):
+        self.model = model
+        self.fields = [(name, FIELDS[model][name]) for name in names]
+
+    def load_options(self, *extra_columns):
+        """Loader options reading only the needed columns (plus extra_columns, e.g. a keyset sort column)"""
+        names = {column for _, field in self.fields for column in field.columns}
+        names.update(column.key for column in extra_columns)
+        options = [load_only(*[getattr(self.model, name) for name in sorted(names)])]
+
+        harvest_names = {column for _, field in self.fields for column in field.harvest_columns}
+        if harvest_names:
+            options.append(
+                selectinload(Milling.harvest).load_only(*[getattr(Harvest, name) for name in sorted(harvest_names)])
+            )
+        return options
+
+    def serialize(self, row):
+        return {name: field.value(row) for name, field in self.fields}
+
+
+def parse(model, value):
+    """FieldSet for a ?fields= value, or None when all fields are wanted
+
+    Raises ValueError for unknown field names.
+    """
+    if not value:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in FIELDS[model]]
+    if unknown:
+        raise ValueError(f'Unknown field: {", ".join(unknown)}. Allowed: {", ".join(FIELDS[model])}')
+    return FieldSet(model, names) if names else None
@@ -0,0 +1,234 @@
+"""
+Generate a large synthetic dataset for load and performance testing
+
+Replaces all data in the target database (DATABASE_URL, or the development
+SQLite database) with seeded, realistic records:
+
+- harvests spread over --days up to today across config.PLANTATIONS, some purchased
+- milling for most harvests (recent ones are left unmilled to trigger alerts)
+- one storage container per milling with a spread of shelf lives, so some
+  containers are expired or near expiry
+- zero to three sales per container, a share of them pending payment
+
+The same --seed and sizes always produce the same data. Rows are written with
+Core executemany batches of --chunk-size. Storage sold/remaining totals are
+filled in as sales are generated, and the daily_financials rollup and table
+versions are rebuilt at the end, so the API sees a consistent database.
+
+Usage:
+    python generate_data.py --harvests 100000
+    python generate_data.py --harvests 1000000 --days 1095 --seed 7
+"""
+
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from models import init_db, QUANTITY_EPSILON, Harvest, Milling, Storage, Sale, DailyFinancials
+from rollups import rebuild_daily_financials
+import config
+import versions
+
+BUYERS = ['Okafor Foods', 'Adaeze Oils', 'Eze Traders', 'Bright Market', 'Chinedu & Sons',
+          'Kano Refinery', 'Nnamdi Stores', 'Lagos Soap Works', 'Ifeoma Ventures', 'Delta Kitchens']
+SUPPLIERS = ['Umuahia Growers', 'Nkwo Farmers', 'Ikot Ekpene Co-op', 'Obinze Estates']
+SHELF_LIVES = [20, 30, 30, 30, 45, 60]  # days; mostly the default, with a spread for expiry alerts
+
+
+class Generator:
+    """Builds rows for all four tables with sequential ids so foreign keys need no round trips"""
+
+    def __init__(self, seed, days, milled_ratio, sold_ratio, pending_ratio, purchased_ratio):
+        self.random = random.Random(seed)
+        self.today = date.today()
+        self.days = days
+        self.milled_ratio = milled_ratio
+        self.sold_ratio = sold_ratio
+        self.pending_ratio = pending_ratio
+        self.purchased_ratio = purchased_ratio
+        self.created_at = datetime.utcnow()
+        self.next_id = {'harvests': 1, 'milling': 1, 'storage': 1, 'sales': 1}
+
+    def _id(self, table):
+        value = self.next_id[table]
+        self.next_id[table] += 1
+        return value
+
+    def harvest(self, rows):
+        """Add one harvest and whatever milling, storage and sales follow from it"""
+        rnd = self.random
+        harvest_date = self.today - timedelta(days=int(rnd.triangular(0, self.days, 0)))
+        plantation = rnd.choice(config.PLANTATIONS)
+        num_bunches = rnd.randint(5, 40)
+        weight_per_bunch = round(rnd.uniform(10, 25), 1)
+        total_weight = num_bunches * weight_per_bunch
+        is_purchased = rnd.random() < self.purchased_ratio
+
+        harvest_id = self._id('harvests')
+        rows['harvests'].append({
+            'id': harvest_id,
+            'harvest_date': harvest_date,
+            'plantation': plantation,
+            'num_bunches': num_bunches,
+            'weight_per_bunch': weight_per_bunch,
+            'ripeness': rnd.choices(['Ripe', 'Unripe', 'Overripe'], weights=[85, 10, 5])[0],
+            'is_purchased': is_purchased,
+            'supplier_name': rnd.choice(SUPPLIERS) if is_purchased else None,
+            'purchase_price': round(total_weight * rnd.uniform(45, 70), 2) if is_purchased else None,
+            'created_at': self.created_at
+        })
+
+        # Harvests from the last day or two are often still waiting for the mill
+        recent = (self.today - harvest_date).days < 2
+        if rnd.random() >= (self.milled_ratio / 2 if recent else self.milled_ratio):
+            return
+
+        milling_date = min(harvest_date + timedelta(days=rnd.randint(0, 2)), self.today)
+        oil_yield = round(total_weight * config.OER_PERCENTAGE * rnd.uniform(0.85, 1.1), 2)
+        milling_id = self._id('milling')
+        rows['milling'].append({
+            'id': milling_id,
+            'milling_date': milling_date,
+            'mill_location': f'{plantation} Mill',
+            'harvest_id': harvest_id,
+            'milling_cost': round(rnd.uniform(8000, 20000), -2),
+            'oil_yield': oil_yield,
+            'transport_cost': round(rnd.uniform(0, 3000), -2),
+            'created_at': self.created_at
+        })
+
+        storage_id = self._id('storage')
+        storage = {
+            'id': storage_id,
+            'container_id': f'GEN{storage_id:09d}',
+            'milling_id': milling_id,
+            'quantity': oil_yield,
+            'storage_date': milling_date,
+            'max_shelf_life_days': rnd.choice(SHELF_LIVES),
+            'plantation_source': plantation,
+            'is_sold': False,
+            'quantity_sold': 0.0,
+            'remaining_quantity': oil_yield,
+            'created_at': self.created_at
+        }
+        rows['storage'].append(storage)
+
+        if rnd.random() >= self.sold_ratio:
+            return
+
+        # Sell part or all of the container in up to three sales
+        sell_total = oil_yield if rnd.random() < 0.5 else round(oil_yield * rnd.uniform(0.2, 0.9), 2)
+        sale_count = rnd.randint(1, 3)
+        sold = 0.0
+        for number in range(sale_count):
+            quantity = sell_total - sold if number == sale_count - 1 else round(sell_total / sale_count, 2)
+            if quantity <= 0:
+                break
+            sale_date = min(milling_date + timedelta(days=rnd.randint(0, 20)), self.today)
+            pending = rnd.random() < self.pending_ratio
+            rows['sales'].append({
+                'id': self._id('sales'),
+                'sale_date': sale_date,
+                'buyer_name': rnd.choice(BUYERS),
+                'storage_id': storage_id,
+                'quantity_sold': quantity,
+                'price_per_kg': round(rnd.uniform(900, 1400), -1),
+                'payment_status': 'Pending' if pending else 'Paid',
+                'payment_date': None if pending else min(sale_date + timedelta(days=rnd.randint(0, 10)), self.today),
+                'created_at': self.created_at
+            })
+            sold += quantity
+
+        storage['quantity_sold'] = sold
+        storage['remaining_quantity'] = oil_yield - sold
+        if storage['remaining_quantity'] <= QUANTITY_EPSILON:
+            storage['remaining_quantity'] = 0.0
+        storage['is_sold'] = storage['remaining_quantity'] <= 0
+
+
+def clear_data(session):
+    """Delete existing records, children first"""
+    session.query(DailyFinancials).delete()
+    session.query(Sale).delete()
+    session.query(Storage).delete()
+    session.query(Milling).delete()
+    session.query(Harvest).delete()
+    session.commit()
+
+
+def reset_sequences(session):
+    """Move PostgreSQL id sequences past the explicitly inserted ids"""
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('harvests', 'milling', 'storage', 'sales'):
+        session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+        ))
+
+
+def generate(session, harvests, days=365, seed=42, chunk_size=10000, milled_ratio=0.9, sold_ratio=0.7,
+             pending_ratio=0.25, purchased_ratio=0.2, log=print):
+    """Replace the database contents with a synthetic dataset; returns row counts per table"""
+    started = time.perf_counter()
+    clear_data(session)
+
+    generator = Generator(seed, days, milled_ratio, sold_ratio, pending_ratio, purchased_ratio)
+    tables = (('harvests', Harvest), ('milling', Milling), ('storage', Storage), ('sales', Sale))
+    counts = dict.fromkeys((name for name, _ in tables), 0)
+    rows = {name: [] for name, _ in tables}
+
+    def flush():
+        # Parents before children so foreign keys hold on PostgreSQL
+        for name, model in tables:
+            if rows[name]:
+                # Table-level insert: one executemany, without the ORM bulk path's per-row grouping
+                session.execute(model.__table__.insert(), rows[name])
+                counts[name] += len(rows[name])
+                rows[name] = []
+        session.commit()
+
+    for number in range(1, harvests + 1):
+        generator.harvest(rows)
+        if number % chunk_size == 0:
+            flush()
+            log(f"  {number:,}/{harvests:,} harvests ({time.perf_counter() - started:.1f}s)")
+    flush()
+
+    reset_sequences(session)
+    log("Rebuilding daily financials rollup...")
+    counts['daily_financials'] = rebuild_daily_financials(session)
+    versions.bump(session, *versions.TABLES)
+    session.commit()
+
+    log(f"Generated {sum(counts.values()):,} rows in {time.perf_counter() - started:.1f}s: "
+        + ', '.join(f'{name}={count:,}' for name, count in counts.items()))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--harvests', type=int, default=10000, help='Number of harvest records (other tables scale with it)')
+    parser.add_argument('--days', type=int, default=365, help='Spread harvest dates over this many days up to today')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Harvests per insert batch / transaction')
+    parser.add_argument('--milled-ratio', type=float, default=0.9)
+    parser.add_argument('--sold-ratio', type=float, default=0.7, help='Share of containers with at least one sale')
+    parser.add_argument('--pending-ratio', type=float, default=0.25, help='Share of sales awaiting payment')
+    parser.add_argument('--purchased-ratio', type=float, default=0.2, help='Share of harvests bought from suppliers')
+    args = parser.parse_args()
+
+    engine = init_db()
+    session = sessionmaker(bind=engine)()
+    try:
+        print(f"Generating data from {args.harvests:,} harvests (seed {args.seed})...")
+        generate(session, args.harvests, days=args.days, seed=args.seed, chunk_size=args.chunk_size,
+                 milled_ratio=args.milled_ratio, sold_ratio=args.sold_ratio,
+                 pending_ratio=args.pending_ratio, purchased_ratio=args.purchased_ratio)
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
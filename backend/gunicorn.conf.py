@@ -0,0 +1,15 @@
+"""
+Gunicorn settings, read automatically when gunicorn starts in this directory
+
+Worker processes come from config.WEB_WORKERS and threads per worker from
+config.WEB_THREADS, which is derived from the connection pool size and
+STREAM_MAX_SUBSCRIBERS. (Module-level names here are read as gunicorn
+settings, so config is not imported under its own name.)
+"""
+
+from config import WEB_THREADS, WEB_WORKERS
+
+workers = WEB_WORKERS
+worker_class = 'gthread'
+threads = WEB_THREADS
+timeout = 120
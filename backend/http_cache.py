@@ -0,0 +1,52 @@
+"""
+Conditional GET support (ETag / If-None-Match)
+
+Read endpoints declare which tables their response depends on. The ETag is
+a hash of those tables' change counters (see versions.py), the request URL
+and the current UTC date (expiry and milling-alert fields change daily), so
+an unchanged response costs one small query and no serialization.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from functools import wraps
+from flask import request, make_response
+import versions
+
+
+def compute_etag(table_versions):
+    """Build a strong ETag for the current request and data version"""
+    payload = json.dumps({
+        'path': request.path,
+        'args': sorted(request.args.items(multi=True)),
+        'versions': table_versions,
+        'date': datetime.utcnow().date().isoformat()
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def conditional(get_session, *tables):
+    """Decorate a GET view so it emits an ETag and answers If-None-Match with 304"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            session = get_session()
+            try:
+                etag = compute_etag(versions.current(session, *tables))
+            finally:
+                session.close()
+
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            # Let clients keep the body but revalidate on every use
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
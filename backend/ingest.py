@@ -0,0 +1,264 @@
+"""
+Bulk harvest ingestion
+
+Accepts a JSON array, NDJSON (one object per line) or CSV, validates every
+row independently and inserts the valid ones with executemany batches of
+BULK_INSERT_CHUNK_SIZE rows, one transaction per batch. Every format is read
+incrementally, so memory use doesn't grow with the upload. Invalid rows are
+reported back by position instead of failing the whole upload; if the rest
+of the upload can't be read (e.g. truncated JSON), the rows before it are
+still inserted and the summary says where reading stopped.
+"""
+
+import csv
+import io
+import itertools
+import json
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from models import Harvest
+from pagination import parse_bool
+import versions
+import config
+
+
+HARVEST_REQUIRED_FIELDS = ('harvest_date', 'plantation', 'num_bunches', 'weight_per_bunch', 'ripeness')
+
+JSON_MIMETYPES = ('application/json',)
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines')
+CSV_MIMETYPES = ('text/csv', 'application/csv')
+
+JSON_READ_SIZE = 64 * 1024  # Bytes read at a time from a JSON array upload
+
+
+def _blank(value):
+    """Treat missing values and empty CSV cells alike"""
+    return value is None or (isinstance(value, str) and value.strip() == '')
+
+
+def parse_harvest_row(data):
+    """Validate one incoming record and convert it to harvest column values
+
+    Raises ValueError describing the first problem found.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Row must be an object')
+
+    missing = [field for field in HARVEST_REQUIRED_FIELDS if _blank(data.get(field))]
+    if missing:
+        raise ValueError(f'Missing required fields: {", ".join(missing)}')
+
+    try:
+        harvest_date = datetime.strptime(str(data['harvest_date']).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'Invalid harvest_date: {data["harvest_date"]} (expected YYYY-MM-DD)')
+
+    try:
+        num_bunches = int(data['num_bunches'])
+        weight_per_bunch = float(data['weight_per_bunch'])
+    except (TypeError, ValueError):
+        raise ValueError('num_bunches and weight_per_bunch must be numbers')
+    if num_bunches <= 0 or weight_per_bunch <= 0:
+        raise ValueError('num_bunches and weight_per_bunch must be positive')
+
+    is_purchased = data.get('is_purchased')
+    if _blank(is_purchased):
+        is_purchased = False
+    elif isinstance(is_purchased, str):
+        is_purchased = parse_bool(is_purchased)
+    elif not isinstance(is_purchased, bool):
+        raise ValueError(f'Invalid is_purchased: {is_purchased}')
+
+    purchase_price = data.get('purchase_price')
+    if _blank(purchase_price):
+        purchase_price = None
+    else:
+        try:
+            purchase_price = float(purchase_price)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid purchase_price: {purchase_price}')
+
+    supplier_name = data.get('supplier_name')
+
+    return {
+        'harvest_date': harvest_date,
+        'plantation': str(data['plantation']).strip(),
+        'num_bunches': num_bunches,
+        'weight_per_bunch': weight_per_bunch,
+        'ripeness': str(data['ripeness']).strip(),
+        'is_purchased': is_purchased,
+        'supplier_name': None if _blank(supplier_name) else str(supplier_name).strip(),
+        'purchase_price': purchase_price,
+        'created_at': datetime.utcnow()
+    }
+
+
+def iter_ndjson(stream):
+    """Yield one record per non-empty line of a binary NDJSON stream
+
+    Lines that are not valid JSON are yielded as ValueError instances so
+    they are reported against their row number like any other bad row.
+    """
+    for line in io.TextIOWrapper(stream, encoding='utf-8'):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield ValueError('Invalid JSON')
+
+
+def iter_csv(stream):
+    """Yield one dict per data row of a binary CSV stream with a header row"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    yield from csv.DictReader(text)
+
+
+def iter_json_array(stream):
+    """Yield the records of a binary stream holding a JSON array, one element at a time
+
+    Elements are decoded with raw_decode as soon as they are complete in the
+    buffer, so only the current element is held in memory.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        """Read more of the upload; False at the end of the stream"""
+        nonlocal buffer, position, eof
+        chunk = text.read(JSON_READ_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        eof = not chunk
+        return not eof
+
+    def next_char():
+        """Skip whitespace and return the next character ('' at the end)"""
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or not fill():
+                return buffer[position:position + 1]
+
+    if next_char() != '[':
+        raise ValueError('Expected a JSON array of harvest records')
+    position += 1
+    if next_char() == ']':
+        return
+
+    while True:
+        next_char()
+        while True:
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+                # A value ending at the buffer's edge (e.g. a number) may continue in the next chunk
+                if end < len(buffer) or eof:
+                    break
+            except ValueError:
+                if eof:
+                    raise ValueError('Invalid JSON in array')
+            fill()
+        position = end
+        yield record
+
+        separator = next_char()
+        position += 1
+        if separator == ']':
+            return
+        if not separator:
+            raise ValueError('Unexpected end of JSON array')
+        if separator != ',':
+            raise ValueError('Invalid JSON in array (expected "," or "]")')
+
+
+def iter_records(request):
+    """Pick a record reader from the upload's content type (or file extension)
+
+    Multipart uploads read the 'file' part; other requests read the body.
+    """
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if upload is None:
+            raise ValueError("Multipart uploads must include a 'file' part")
+        name = (upload.filename or '').lower()
+        if name.endswith('.csv') or upload.mimetype in CSV_MIMETYPES:
+            return iter_csv(upload.stream)
+        if name.endswith(('.ndjson', '.jsonl')) or upload.mimetype in NDJSON_MIMETYPES:
+            return iter_ndjson(upload.stream)
+        if name.endswith('.json') or upload.mimetype in JSON_MIMETYPES:
+            return iter_json_array(upload.stream)
+        raise ValueError('Unsupported file type. Upload .csv, .ndjson/.jsonl or .json')
+
+    if request.mimetype in CSV_MIMETYPES:
+        return iter_csv(request.stream)
+    if request.mimetype in NDJSON_MIMETYPES:
+        return iter_ndjson(request.stream)
+    if request.mimetype in JSON_MIMETYPES:
+        return iter_json_array(request.stream)
+    raise ValueError(
+        'Unsupported Content-Type. Send application/json, application/x-ndjson, text/csv or a multipart file'
+    )
+
+
+def bulk_insert_harvests(session, records, chunk_size=None):
+    """Validate and insert harvest records in batches
+
+    Returns a summary dict: received, inserted, failed and errors (a list of
+    {'row': 1-based position, 'error': message}, capped at BULK_MAX_ERRORS).
+    """
+    chunk_size = chunk_size or config.BULK_INSERT_CHUNK_SIZE
+    summary = {'received': 0, 'inserted': 0, 'failed': 0, 'errors': []}
+
+    def fail(row_number, message):
+        summary['failed'] += 1
+        if len(summary['errors']) < config.BULK_MAX_ERRORS:
+            summary['errors'].append({'row': row_number, 'error': message})
+
+    def flush(batch):
+        try:
+            change_seq = versions.bump(session, 'harvests')['harvests']
+            session.execute(insert(Harvest), [dict(values, change_seq=change_seq) for _, values in batch])
+            session.commit()
+            summary['inserted'] += len(batch)
+        except SQLAlchemyError as e:
+            session.rollback()
+            message = str(e.orig if getattr(e, 'orig', None) is not None else e)
+            for row_number, _ in batch:
+                fail(row_number, message)
+
+    batch = []
+    records = iter(records)
+    for row_number in itertools.count(1):
+        try:
+            record = next(records)
+        except StopIteration:
+            break
+        except (ValueError, csv.Error) as e:
+            if row_number == 1:
+                raise  # Nothing was read: reject the upload as a whole
+            # The rest of the upload is unreadable; keep what was read before it
+            fail(row_number, f'Could not read the upload from this row on: {e}')
+            break
+
+        summary['received'] += 1
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            batch.append((row_number, parse_harvest_row(record)))
+        except ValueError as e:
+            fail(row_number, str(e))
+            continue
+
+        if len(batch) >= chunk_size:
+            flush(batch)
+            batch = []
+
+    if batch:
+        flush(batch)
+
+    return summary
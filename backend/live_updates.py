@@ -0,0 +1,218 @@
+"""
+Server-Sent Events for live alerts and dashboard KPIs
+
+One Broadcaster per worker process watches the table change counters (see
+versions.py) and the clock. When a write commits anywhere, or a time-based
+alert threshold passes (expiry counts change at midnight UTC, the milling
+alert cutoff MILLING_ALERT_HOURS after it), it recomputes the dashboard
+summary and alert list once and pushes only what changed to every
+subscriber's queue. Subscribers never query the database themselves, and
+the watcher thread only runs while someone is subscribed.
+
+Events on GET /api/stream:
+- snapshot: {summary, alerts, total_count}, sent first on every connection
+- summary:  the KPIs whose values changed
+- alerts:   {upserted: [alert], removed: [key], total_count}
+
+Every alert carries a `key` (e.g. "storage:12") so clients can apply deltas.
+Each open stream holds a server thread, so the web process runs gunicorn's
+gthread workers (see gunicorn.conf.py) with WEB_THREADS threads: one per
+pooled database connection plus STREAM_MAX_SUBSCRIBERS for streams. A deploy
+holds WEB_WORKERS x STREAM_MAX_SUBSCRIBERS streams. Streams close after
+STREAM_MAX_SECONDS and EventSource reconnects on its own.
+"""
+
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import Response
+import alerts
+import config
+import dashboard
+import serialization
+import versions
+
+
+# Tables the summary and alerts are computed from
+WATCHED_TABLES = ('harvests', 'milling', 'storage', 'sales')
+ALERT_ID_FIELDS = ('harvest_id', 'storage_id', 'sale_id')
+
+
+class StreamFull(Exception):
+    """Raised when a worker already serves STREAM_MAX_SUBSCRIBERS streams"""
+
+
+def alert_key(alert):
+    """Stable identity of an alert across recomputations, e.g. 'milling:42' or 'stock'"""
+    for field in ALERT_ID_FIELDS:
+        if field in alert:
+            return f'{alert["type"]}:{alert[field]}'
+    return alert['type']
+
+
+def format_event(event_id, name, data):
+    """Encode one Server-Sent Event"""
+    return b'id: %d\nevent: %s\ndata: %s\n\n' % (event_id, name.encode(), serialization.dumps(data))
+
+
+class Subscriber:
+    """One open stream: a bounded queue of encoded events"""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=config.STREAM_QUEUE_SIZE)
+        self.closed = False
+
+    def push(self, event):
+        """Queue an event; a subscriber too slow to keep up is closed and must reconnect"""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.closed = True
+            return False
+
+
+class Broadcaster:
+    """Compute summary and alert changes once per change and fan them out to subscribers"""
+
+    def __init__(self, session_factory, poll_seconds=config.STREAM_POLL_SECONDS,
+                 max_subscribers=config.STREAM_MAX_SUBSCRIBERS):
+        self.session_factory = session_factory
+        self.poll_seconds = poll_seconds
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._event_id = 0
+        # Last computed state: {'summary': {...}, 'alerts': {key: alert}, 'total_count': n}
+        self._state = None
+
+    def subscribe(self):
+        """Register a new stream; it starts with a snapshot of the current state"""
+        subscriber = Subscriber()
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise StreamFull(f'Too many open streams (limit {self.max_subscribers}). Try again shortly.')
+            if self._state is not None:
+                subscriber.push(self._snapshot_event())
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-updates', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def wake(self):
+        """Check for changes now instead of at the next poll (called after local commits)"""
+        self._wake.set()
+
+    def _next_id(self):
+        self._event_id += 1
+        return self._event_id
+
+    def _snapshot_event(self):
+        state = self._state
+        return format_event(self._next_id(), 'snapshot', {
+            'summary': state['summary'],
+            'alerts': list(state['alerts'].values()),
+            'total_count': state['total_count']
+        })
+
+    def _compute(self):
+        """Current summary and alerts, from one session and shared aggregate queries"""
+        session = self.session_factory()
+        try:
+            result = dashboard.bootstrap(session, sections=('summary', 'alerts'))
+            return {
+                'summary': result['summary'],
+                'alerts': {alert_key(alert): dict(alert, key=alert_key(alert)) for alert in result['alerts']['alerts']},
+                'total_count': result['alerts']['total_count']
+            }
+        finally:
+            session.close()
+
+    def _changes(self, old, new):
+        """Events describing how the state moved from old to new"""
+        events = []
+        summary = {name: value for name, value in new['summary'].items() if old['summary'].get(name) != value}
+        if summary:
+            events.append(('summary', summary))
+
+        upserted = [alert for key, alert in new['alerts'].items() if old['alerts'].get(key) != alert]
+        removed = [key for key in old['alerts'] if key not in new['alerts']]
+        if upserted or removed:
+            events.append(('alerts', {'upserted': upserted, 'removed': removed, 'total_count': new['total_count']}))
+        return events
+
+    def _publish(self, state):
+        """Swap in a new state and push its changes (or a first snapshot) to every subscriber"""
+        with self._lock:
+            old, self._state = self._state, state
+            if old is None:
+                encoded = [self._snapshot_event()]
+            else:
+                encoded = [format_event(self._next_id(), name, data) for name, data in self._changes(old, state)]
+            for subscriber in list(self._subscribers):
+                for event in encoded:
+                    if not subscriber.push(event):
+                        self._subscribers.discard(subscriber)
+                        break
+
+    def _watch_versions(self):
+        session = self.session_factory()
+        try:
+            return versions.current(session, *WATCHED_TABLES)
+        finally:
+            session.close()
+
+    def _run(self):
+        """Watcher thread: recompute on data changes and time boundaries while anyone listens"""
+        seen_versions = None
+        boundary = None
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    self._state = None  # Stale by the time someone subscribes again
+                    return
+            try:
+                now = datetime.utcnow()
+                current_versions = self._watch_versions()
+                if current_versions != seen_versions or now >= boundary or self._state is None:
+                    self._publish(self._compute())
+                    seen_versions = current_versions
+                    boundary = alerts.next_time_boundary(now)
+            except Exception as e:
+                # Keep streams open through a database hiccup; retry on the next poll
+                print(f'Warning: live update check failed: {e}')
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+
+def event_stream(broadcaster):
+    """Streaming SSE response for a new subscriber (raises StreamFull when at capacity)"""
+    subscriber = broadcaster.subscribe()
+
+    def generate():
+        try:
+            yield b'retry: %d\n\n' % config.STREAM_RETRY_MS
+            deadline = time.monotonic() + config.STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    yield subscriber.queue.get(timeout=config.STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    if subscriber.closed:
+                        return
+                    yield b': keep-alive\n\n'  # Also how a dropped connection is noticed
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Don't let a reverse proxy buffer events
+    })
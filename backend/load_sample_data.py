@@ -4,7 +4,9 @@ Load sample data for testing the Palm Oil Business Management System
 
 from datetime import date, timedelta
 from sqlalchemy.orm import sessionmaker
-from models import init_db, Harvest, Milling, Storage, Sale
+from models import init_db, Harvest, Milling, Storage, Sale, DailyFinancials
+from rollups import rebuild_daily_financials
+import versions
 
 # Initialize database
 engine = init_db()
@@ -18,6 +20,7 @@ def load_sample_data():
     print("Loading sample data...")
 
     # Clear existing data
+    session.query(DailyFinancials).delete()
     session.query(Sale).delete()
     session.query(Storage).delete()
     session.query(Milling).delete()
@@ -143,13 +146,20 @@ def load_sample_data():
         session.add(sale)
         sales.append(sale)
 
-        # Mark storage as sold
+        # Update storage sold/remaining totals
         storage = session.query(Storage).get(data['storage_id'])
-        storage.is_sold = True
+        storage.record_sale(data['quantity_sold'])
 
     session.commit()
     print(f"Created {len(sales)} sales records")
 
+    # Build the daily profit rollup from the records above
+    rebuild_daily_financials(session)
+
+    # Invalidate anything derived from the previous data
+    versions.bump(session, *versions.TABLES)
+    session.commit()
+
     print("\nSample data loaded successfully!")
     print("\nSummary:")
     print(f"  - Harvests: {len(harvests)}")
@@ -0,0 +1,393 @@
+"""
+HTTP load test against a real gunicorn server
+
+Starts the app the way the Procfile does (gunicorn app:app) on a local port,
+replays a weighted mix of traffic from concurrent clients for a fixed time and
+reports throughput, p50/p95/p99 latency and error rate per route. Give several
+worker counts and worker classes to compare them side by side.
+
+Traffic scenarios (weights set with --mix):
+- dashboard: poll summary, alerts and profit trends, revalidating with ETags
+- browse:    page through a list endpoint and open one of its records
+- sale:      record a small sale against an unsold container
+- harvest:   record a new harvest
+- export:    download an Excel or PDF summary report
+
+Usage:
+    python loadtest.py --workers 1,2,4 --clients 16 --duration 30
+    python loadtest.py --worker-class sync,gthread --threads 4 --mix dashboard=60,browse=40
+    python loadtest.py --url http://localhost:5001 --clients 8      # an already running server
+
+Uses a temporary SQLite database filled by generate_data.py unless DATABASE_URL
+is set. WARNING: unless --no-generate or --url is given, the data in the target
+database is replaced before every run.
+"""
+
+import argparse
+import gzip
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from urllib.parse import urlsplit
+
+from benchmark import percentile, git_commit
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = 'dashboard=40,browse=35,sale=15,harvest=5,export=5'
+SCENARIOS = ('dashboard', 'browse', 'sale', 'harvest', 'export')
+LIST_ROUTES = ('harvests', 'milling', 'storage', 'sales')
+
+
+class Client:
+    """One simulated user: a keep-alive connection and the latencies it observed"""
+
+    def __init__(self, host, port, prefix, context, timeout):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.prefix = prefix
+        self.context = context
+        self.random = random.Random()
+        self.etags = {}
+        self.samples = []  # (route, status or None, seconds)
+        self.recording = False
+
+    def request(self, method, path, route, body=None, revalidate=False):
+        """Send one request; returns (status, parsed JSON body or None)"""
+        headers = {'Accept-Encoding': 'gzip'}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if revalidate and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, self.prefix + path, payload, headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # Dropped connection or timeout: counted as an error, reconnect on the next request
+            self.connection.close()
+            self._record(f'{method} {self.prefix}{route}', None, time.perf_counter() - started)
+            return None, None
+        self._record(f'{method} {self.prefix}{route}', response.status, time.perf_counter() - started)
+
+        if revalidate and response.getheader('ETag'):
+            self.etags[path] = response.getheader('ETag')
+        if response.getheader('Content-Type', '').startswith('application/json'):
+            if response.getheader('Content-Encoding') == 'gzip':
+                data = gzip.decompress(data)
+            return response.status, json.loads(data or 'null')
+        return response.status, None
+
+    def _record(self, route, status, elapsed):
+        if self.recording:
+            self.samples.append((route, status, elapsed))
+
+    # ---- scenarios ----
+
+    def dashboard(self):
+        self.request('GET', '/dashboard/summary', '/dashboard/summary', revalidate=True)
+        self.request('GET', '/dashboard/alerts?limit=50', '/dashboard/alerts', revalidate=True)
+        self.request('GET', '/dashboard/profit-trends?granularity=month', '/dashboard/profit-trends',
+                     revalidate=True)
+
+    def browse(self):
+        name = self.random.choice(LIST_ROUTES)
+        path = f'/{name}?limit=50'
+        for _ in range(self.random.randint(1, 3)):
+            status, page = self.request('GET', path, f'/{name}', revalidate=True)
+            if status != 200 or not page or not page.get('items'):
+                return
+            if not page.get('next_cursor'):
+                break
+            path = f'/{name}?limit=50&cursor={page["next_cursor"]}'
+        record = self.random.choice(page['items'])
+        self.request('GET', f'/{name}/{record["id"]}', f'/{name}/<int:id>')
+
+    def sale(self):
+        if not self.context['storage_ids']:
+            return
+        self.request('POST', '/sales', '/sales', body={
+            'storage_id': self.random.choice(self.context['storage_ids']),
+            'quantity_sold': 0.01,
+            'price_per_kg': 1000,
+            'sale_date': date.today().isoformat(),
+            'buyer_name': 'Load Test',
+            'payment_status': self.random.choice(['Paid', 'Pending'])
+        })
+
+    def harvest(self):
+        self.request('POST', '/harvests', '/harvests', body={
+            'harvest_date': date.today().isoformat(),
+            'plantation': self.random.choice(self.context['plantations']),
+            'num_bunches': self.random.randint(5, 40),
+            'weight_per_bunch': round(self.random.uniform(10, 25), 1),
+            'ripeness': 'Ripe'
+        })
+
+    def export(self):
+        report_format = self.random.choice(['excel', 'pdf'])
+        self.request('GET', f'/reports/{report_format}?type=summary', f'/reports/{report_format}')
+
+
+def parse_mix(text):
+    """Parse 'scenario=weight,...' into {scenario: weight}"""
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f'Unknown scenario in --mix: {name} (choose from {", ".join(SCENARIOS)})')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def client_loop(client, mix, think, stop):
+    """Run scenarios picked by weight until `stop` is set"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while not stop.is_set():
+        getattr(client, client.random.choices(names, weights)[0])()
+        if think:
+            time.sleep(client.random.expovariate(1 / think))
+
+
+def load_context(host, port, prefix, timeout):
+    """Ids the write scenarios need, read through the API so --url works too"""
+    import config
+
+    client = Client(host, port, prefix, None, timeout)
+    _, page = client.request('GET', '/storage?is_sold=false&sort=-quantity&limit=200', '/storage')
+    client.connection.close()
+    return {
+        'storage_ids': [record['id'] for record in (page or {}).get('items', [])],
+        'plantations': config.PLANTATIONS
+    }
+
+
+def summarize_route(samples, elapsed):
+    """Throughput, latency percentiles and error rate for a list of samples"""
+    latencies = sorted(seconds * 1000 for _, _, seconds in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        key = str(status) if status is not None else 'error'
+        statuses[key] = statuses.get(key, 0) + 1
+    errors = sum(count for key, count in statuses.items() if key == 'error' or int(key) >= 400)
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'error_rate': round(errors / len(samples), 4),
+        'statuses': dict(sorted(statuses.items()))
+    }
+
+
+def run_load(url, clients, duration, warmup, mix, think, timeout):
+    """Drive the server at `url`; returns (total summary, {route: summary})"""
+    parts = urlsplit(url)
+    host, port, prefix = parts.hostname, parts.port or 80, parts.path.rstrip('/') or '/api'
+    context = load_context(host, port, prefix, timeout)
+
+    stop = threading.Event()
+    users = [Client(host, port, prefix, context, timeout) for _ in range(clients)]
+    threads = [threading.Thread(target=client_loop, args=(user, mix, think, stop), daemon=True)
+               for user in users]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(warmup)
+    for user in users:
+        user.recording = True
+    began = time.perf_counter()
+    time.sleep(duration)
+    for user in users:
+        user.recording = False
+    elapsed = time.perf_counter() - began
+
+    stop.set()
+    for thread in threads:
+        thread.join(timeout + 1)
+    for user in users:
+        user.connection.close()
+
+    samples = [sample for user in users for sample in user.samples]
+    if not samples:
+        return None, {}
+    by_route = {}
+    for sample in samples:
+        by_route.setdefault(sample[0], []).append(sample)
+    routes = {route: summarize_route(route_samples, elapsed) for route, route_samples in sorted(by_route.items())}
+    return summarize_route(samples, elapsed), routes
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, worker_class, threads, log_file):
+    """Start gunicorn with the Procfile's settings on a free local port; returns (process, url)
+
+    Flags given here override gunicorn.conf.py, which gunicorn reads from BACKEND_DIR.
+    """
+    port = free_port()
+    command = [
+        sys.executable, '-m', 'gunicorn', 'app:app',
+        '--bind', f'127.0.0.1:{port}', '--timeout', '120',
+        '--workers', str(workers), '--worker-class', worker_class, '--threads', str(threads)
+    ]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=log_file, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}/api'
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return None, url
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/api/health')
+            if connection.getresponse().status == 200:
+                connection.close()
+                return process, url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop_server(process)
+    return None, url
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def generate(harvests, seed):
+    """Fill the target database with generate_data.py"""
+    from sqlalchemy.orm import sessionmaker
+    from models import init_db
+    import generate_data
+
+    engine = init_db()
+    session = sessionmaker(bind=engine)()
+    try:
+        generate_data.generate(session, harvests, seed=seed, log=lambda message: None)
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def print_run(label, total, routes):
+    print(f'\n=== {label} ===')
+    if total is None:
+        print('  ❌ No requests completed')
+        return
+    for route, stats in list(routes.items()) + [('TOTAL', total)]:
+        print(f'  {route:<40} {stats["requests"]:>7} req {stats["rps"]:>8.1f}/s   '
+              f'p50 {stats["p50_ms"]:>8.1f}  p95 {stats["p95_ms"]:>8.1f}  p99 {stats["p99_ms"]:>8.1f} ms   '
+              f'errors {stats["error_rate"] * 100:>5.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help='Comma-separated gunicorn worker counts to try')
+    parser.add_argument('--worker-class', default='gthread', help='Comma-separated gunicorn worker classes to try')
+    parser.add_argument('--threads', type=int, help='Threads per worker (used by gthread; default WEB_THREADS)')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds before each run')
+    parser.add_argument('--think-ms', type=float, default=0, help='Mean pause between a user\'s scenarios')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Scenario weights, e.g. dashboard=60,browse=40')
+    parser.add_argument('--timeout', type=float, default=120, help='Seconds before a request counts as failed')
+    parser.add_argument('--harvests', type=int, default=10000, help='Dataset size generated before each run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-generate', action='store_true', help='Use the data already in the database')
+    parser.add_argument('--url', help='Load an already running server instead of starting gunicorn')
+    parser.add_argument('--output', default='loadtest-results.json')
+    args = parser.parse_args()
+    if args.threads is None:
+        import config
+        args.threads = config.WEB_THREADS
+
+    mix = parse_mix(args.mix)
+    think = args.think_ms / 1000
+    runs = []
+
+    def record(label, settings, total, routes):
+        print_run(label, total, routes)
+        runs.append(dict(settings, total=total, routes=routes))
+
+    if args.url:
+        total, routes = run_load(args.url, args.clients, args.duration, args.warmup, mix, think, args.timeout)
+        record(args.url, {'url': args.url}, total, routes)
+    else:
+        if not os.getenv('DATABASE_URL'):
+            os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'loadtest.db')
+        log_path = os.path.join(tempfile.mkdtemp(), 'gunicorn.log')
+
+        worker_counts = [int(count) for count in args.workers.split(',')]
+        worker_classes = [name.strip() for name in args.worker_class.split(',')]
+        for worker_class, workers in itertools.product(worker_classes, worker_counts):
+            label = f'{workers} x {worker_class}' + (f' ({args.threads} threads)' if worker_class == 'gthread' else '')
+            if not args.no_generate:
+                generate(args.harvests, args.seed)  # Every run starts from the same data
+
+            with open(log_path, 'a') as log_file:
+                process, url = start_server(workers, worker_class, args.threads, log_file)
+            if process is None:
+                print(f'\n=== {label} ===\n  ⚠️  gunicorn did not start (see {log_path})')
+                continue
+            try:
+                total, routes = run_load(url, args.clients, args.duration, args.warmup, mix, think, args.timeout)
+            finally:
+                stop_server(process)
+            record(label, {'workers': workers, 'worker_class': worker_class, 'threads': args.threads},
+                   total, routes)
+
+        if len(runs) > 1:
+            print('\n=== Comparison ===')
+            for run in runs:
+                if run['total']:
+                    print(f'  {run["workers"]:>3} x {run["worker_class"]:<10} {run["total"]["rps"]:>8.1f} req/s   '
+                          f'p50 {run["total"]["p50_ms"]:>8.1f}  p95 {run["total"]["p95_ms"]:>8.1f}  '
+                          f'p99 {run["total"]["p99_ms"]:>8.1f} ms   errors {run["total"]["error_rate"] * 100:.1f}%')
+
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'database': (os.getenv('DATABASE_URL') or '').split(':', 1)[0] or None,
+            'clients': args.clients,
+            'duration': args.duration,
+            'think_ms': args.think_ms,
+            'mix': mix,
+            'harvests': None if args.no_generate or args.url else args.harvests
+        },
+        'runs': runs
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f'\nWrote {len(runs)} run(s) to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
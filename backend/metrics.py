@@ -0,0 +1,288 @@
+"""
+Prometheus-style metrics
+
+Counters, gauges and histograms kept in process memory and rendered in the
+Prometheus text exposition format at METRICS_PATH. Recording an observation
+is a lock, a dict lookup and (for histograms) a bisect, so instrumentation
+stays on in production.
+
+Each gunicorn worker keeps its own values and a scrape is answered by
+whichever worker receives it; every series carries a `worker` label (the
+process id) so Prometheus sees one consistent series per worker. Gauges
+read from the database (alerts) are the same whichever worker answers.
+"""
+
+import bisect
+import inspect
+import os
+import threading
+import time
+from flask import request, Response
+import config
+
+
+# Latency buckets (seconds) shared by request, query and report histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (10e3, 50e3, 100e3, 500e3, 1e6, 5e6, 20e6, 100e6)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = []
+
+
+def escape(value):
+    """Escape a label value for the text format"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=None):
+    pairs = [f'worker="{os.getpid()}"'] + [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class: a named family of series keyed by label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self):
+        """Yield (suffix, label values, extra label, value) for every series"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, values, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{format_labels(self.labelnames, values, extra)} {format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            series = list(self._series.items())
+        for key, value in sorted(series):
+            yield '_total', key, None, value
+
+
+class Gauge(Metric):
+    """Value that goes up and down, or is read from a function at scrape time
+
+    A function gauge returns a number, or {label values tuple: number} when
+    the gauge has labels.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        if self.function is not None:
+            value = self.function()
+            series = value.items() if isinstance(value, dict) else [((), value)]
+            series = [(tuple(labels), value) for labels, value in series]
+        else:
+            with self._lock:
+                series = list(self._series.items())
+        for key, value in sorted(series):
+            yield '', key, None, value
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets, with sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', key, f'le="{format_value(bound)}"', cumulative
+            yield '_sum', key, None, total
+            yield '_count', key, None, cumulative
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ============= METRIC DEFINITIONS =============
+
+HTTP_REQUESTS = Counter('http_requests', 'HTTP requests served', ('method', 'route', 'status'))
+HTTP_REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time to serve a request, including streamed bodies',
+                                 ('method', 'route', 'status'))
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests currently being served')
+
+DB_QUERIES = Counter('db_queries', 'SQL statements executed')
+DB_QUERIES_PER_REQUEST = Histogram('db_queries_per_request', 'SQL statements executed per request', ('route',),
+                                   buckets=QUERY_COUNT_BUCKETS)
+DB_QUERY_SECONDS_PER_REQUEST = Histogram('db_query_duration_per_request_seconds',
+                                         'Time spent in SQL statements per request', ('route',))
+DB_POOL_CHECKOUT_SECONDS = Histogram('db_pool_checkout_wait_seconds',
+                                     'Time to get a connection from the pool (including pre-ping)')
+
+REPORT_RENDER_SECONDS = Histogram('report_render_duration_seconds', 'Time to render a report on a cache miss',
+                                  ('format', 'type'))
+REPORT_SIZE_BYTES = Histogram('report_size_bytes', 'Size of rendered reports', ('format', 'type'), buckets=SIZE_BUCKETS)
+REPORT_CACHE_REQUESTS = Counter('report_cache_requests', 'Report requests by cache outcome', ('format', 'result'))
+CACHE_REQUESTS = Counter('cache_requests', 'Response cache lookups by outcome (local_hit, shared_hit, miss, error)',
+                         ('name', 'result'))
+
+
+# ============= REQUEST AND QUERY INSTRUMENTATION =============
+
+_local = threading.local()
+
+
+def before_request():
+    """before_request hook: start timing and query accounting for this request"""
+    _local.started = time.perf_counter()
+    _local.status = None
+    _local.queries = 0
+    _local.query_seconds = 0.0
+    HTTP_IN_FLIGHT.inc()
+
+
+def finish_request(started, method, route, status):
+    """Record a finished request and stop counting its queries"""
+    HTTP_IN_FLIGHT.dec()
+    HTTP_REQUESTS.inc(method, route, status)
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method, route, status)
+    DB_QUERIES_PER_REQUEST.observe(_local.queries, route)
+    DB_QUERY_SECONDS_PER_REQUEST.observe(_local.query_seconds, route)
+    _local.queries = None
+
+
+def after_request(response):
+    """after_request hook: note the status; streamed bodies are recorded once the response is closed"""
+    started = getattr(_local, 'started', None)
+    if started is None:
+        return response
+    _local.status = str(response.status_code)
+
+    if inspect.isgenerator(response.response):
+        # Generated bodies (streamed lists, event streams) are produced after teardown; record on close
+        _local.started = None
+        method = request.method
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = _local.status
+        response.call_on_close(lambda: finish_request(started, method, route, status))
+    return response
+
+
+def teardown_request(error=None):
+    """teardown_request hook: record every request whose body is already built (errors included)"""
+    started = getattr(_local, 'started', None)
+    if started is None:
+        return
+    _local.started = None
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    finish_request(started, request.method, route, _local.status or '500')
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    DB_QUERIES.inc()
+    if getattr(_local, 'queries', None) is not None:
+        _local.queries += 1
+        _local.query_seconds += elapsed
+
+
+def alert_counts(session_factory):
+    """{(type,): count} of current alerts, using the set-based alert queries"""
+    import alerts
+
+    session = session_factory()
+    try:
+        return {
+            (alert_type,): alerts.collect_alerts(session, types=[alert_type], limit=0)['total_count']
+            for alert_type in alerts.ALERT_TYPES
+        }
+    finally:
+        session.close()
+
+
+def init_app(app, engine, session_factory):
+    """Instrument a Flask app and its engine, and register the scrape-time gauges"""
+    from sqlalchemy import event
+    import database
+
+    if not config.METRICS_ENABLED:
+        return
+
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    def pool_value(field):
+        return lambda: database.pool_status(engine).get(field, 0)
+
+    Gauge('db_pool_checked_out', 'Connections currently checked out of the pool', function=pool_value('checked_out'))
+    Gauge('db_pool_checked_in', 'Idle connections in the pool', function=pool_value('checked_in'))
+    Gauge('db_pool_overflow', 'Connections open beyond the pool size', function=pool_value('overflow'))
+    Gauge('alerts', 'Current alerts by type', ('type',), function=lambda: alert_counts(session_factory))
+
+
+def metrics_response():
+    """Response for the metrics endpoint"""
+    return Response(render(), content_type=CONTENT_TYPE)
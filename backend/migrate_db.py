@@ -1,53 +1,62 @@
 """
-Migrate database to add purchase tracking fields to harvests table
-"""
+Bring an existing database up to the current schema
 
-import sqlite3
-import os
-import config
+Runs the pending versioned migrations from migrations.py against
+DATABASE_URL (or the development SQLite database), then rebuilds the
+daily_financials rollup if it is empty while there are milling records or
+sales. Safe to run repeatedly.
 
-def migrate_database():
-    """Add new columns to harvests table"""
-    db_path = config.DATABASE_PATH
+Usage:
+    python migrate_db.py           # apply pending migrations
+    python migrate_db.py --status  # list pending migrations without applying them
+"""
 
-    if not os.path.exists(db_path):
-        print(f"Database not found at {db_path}")
-        print("Please run init_db.py first")
-        return
+import sys
+from sqlalchemy.orm import sessionmaker
+from database import create_db_engine
+from migrations import pending_migrations, run_migrations
+from rollups import ensure_daily_financials
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
 
+def migrate_database():
+    """Apply all pending migrations"""
+    engine = create_db_engine()
     try:
-        # Check if columns already exist
-        cursor.execute("PRAGMA table_info(harvests)")
-        columns = [column[1] for column in cursor.fetchall()]
-
-        # Add new columns if they don't exist
-        if 'is_purchased' not in columns:
-            print("Adding is_purchased column...")
-            cursor.execute("ALTER TABLE harvests ADD COLUMN is_purchased BOOLEAN DEFAULT 0")
-
-        if 'supplier_name' not in columns:
-            print("Adding supplier_name column...")
-            cursor.execute("ALTER TABLE harvests ADD COLUMN supplier_name VARCHAR(100)")
-
-        if 'purchase_price' not in columns:
-            print("Adding purchase_price column...")
-            cursor.execute("ALTER TABLE harvests ADD COLUMN purchase_price FLOAT")
-
-        conn.commit()
-        print("\n✅ Database migrated successfully!")
-        print("New columns added:")
-        print("  - is_purchased (Boolean)")
-        print("  - supplier_name (String)")
-        print("  - purchase_price (Float)")
-
+        ran = run_migrations(engine)
+        if ran:
+            print(f"\n✅ Applied {len(ran)} migration(s); database is up to date")
+        else:
+            print("✅ Database is already up to date")
+
+        session = sessionmaker(bind=engine)()
+        try:
+            rebuilt = ensure_daily_financials(session)
+        finally:
+            session.close()
+        if rebuilt:
+            print(f"✅ Built the daily_financials rollup ({rebuilt} rows)")
     except Exception as e:
         print(f"❌ Migration failed: {e}")
-        conn.rollback()
+        raise SystemExit(1)
     finally:
-        conn.close()
+        engine.dispose()
+
+
+def show_status():
+    """Print the migrations that have not been applied yet"""
+    engine = create_db_engine()
+    try:
+        pending = pending_migrations(engine)
+        if not pending:
+            print("✅ Database is up to date")
+        for version, description in pending:
+            print(f"Pending {version:03d}: {description}")
+    finally:
+        engine.dispose()
+
 
 if __name__ == '__main__':
-    migrate_database()
+    if '--status' in sys.argv[1:]:
+        show_status()
+    else:
+        migrate_database()
@@ -0,0 +1,198 @@
+"""
+Versioned schema migrations for SQLite and PostgreSQL
+
+Each migration has a version number and runs once; applied versions are
+recorded in schema_migrations. Every step is also written to be idempotent
+(columns and indexes are only added when missing), so running migrations
+against a database that create_all() already brought up to date just
+records them as applied.
+
+Index migrations are non-transactional: on PostgreSQL they use
+CREATE INDEX CONCURRENTLY so tables stay writable while indexes build.
+"""
+
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from models import Base, PendingChange, SchemaMigration
+
+MIGRATIONS = []
+
+
+def migration(version, description, transactional=True):
+    """Register a migration function taking a Connection"""
+    def decorator(function):
+        MIGRATIONS.append((version, description, transactional, function))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return function
+    return decorator
+
+
+# ============= HELPERS =============
+
+def add_column(connection, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists; returns True if added"""
+    if column in {existing['name'] for existing in inspect(connection).get_columns(table)}:
+        return False
+    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    return True
+
+
+def find_index(name):
+    """Look up an index declared on the models by name"""
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(f'No index named {name} is declared in models.py')
+
+
+def create_index(connection, name):
+    """Create a model-declared index if missing (CONCURRENTLY on PostgreSQL)"""
+    index = find_index(name)
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=connection.dialect))
+
+    if connection.dialect.name == 'postgresql':
+        # A failed concurrent build leaves an INVALID index behind that IF NOT EXISTS would keep
+        invalid = connection.execute(text(
+            'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE c.relname = :name AND NOT i.indisvalid'
+        ), {'name': name}).first()
+        if invalid:
+            connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+        ddl = ddl.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+
+    connection.execute(text(ddl))
+
+
+# ============= MIGRATIONS =============
+
+@migration(1, 'Create tables missing from older databases')
+def create_missing_tables(connection):
+    Base.metadata.create_all(connection, checkfirst=True)
+
+
+@migration(2, 'Harvest purchase tracking columns')
+def harvest_purchase_columns(connection):
+    add_column(connection, 'harvests', 'is_purchased', 'BOOLEAN DEFAULT FALSE')
+    add_column(connection, 'harvests', 'supplier_name', 'VARCHAR(100)')
+    add_column(connection, 'harvests', 'purchase_price', 'FLOAT')
+
+
+@migration(3, 'Maintained storage sold/remaining quantities')
+def storage_sold_remaining(connection):
+    add_column(connection, 'storage', 'quantity_sold', 'FLOAT NOT NULL DEFAULT 0')
+    if add_column(connection, 'storage', 'remaining_quantity', 'FLOAT NOT NULL DEFAULT 0'):
+        # Backfill from existing sales
+        connection.execute(text("""
+            UPDATE storage SET quantity_sold = COALESCE(
+                (SELECT SUM(sales.quantity_sold) FROM sales WHERE sales.storage_id = storage.id), 0
+            )
+        """))
+        connection.execute(text('UPDATE storage SET remaining_quantity = quantity - quantity_sold'))
+
+
+@migration(4, 'Storage version column for optimistic concurrency')
+def storage_version_id(connection):
+    add_column(connection, 'storage', 'version_id', 'INTEGER NOT NULL DEFAULT 1')
+
+
+@migration(5, 'Indexes for list, alert, allocation and rollup queries', transactional=False)
+def query_indexes(connection):
+    for name in (
+        'ix_storage_remaining_quantity',
+        'ix_harvests_harvest_date_id',
+        'ix_harvests_plantation_harvest_date',
+        'ix_milling_harvest_id',
+        'ix_milling_milling_date_id',
+        'ix_storage_is_sold_storage_date',
+        'ix_storage_milling_id',
+        'ix_sales_storage_id',
+        'ix_sales_sale_date_id',
+        'ix_sales_payment_status_sale_date',
+    ):
+        create_index(connection, name)
+
+
+@migration(6, 'Change sequence columns for the change feed')
+def change_seq_columns(connection):
+    # Existing rows start at 0 and are all returned by a first sync without a cursor
+    for table in ('harvests', 'milling', 'storage', 'sales'):
+        add_column(connection, table, 'change_seq', 'INTEGER NOT NULL DEFAULT 0')
+
+
+@migration(7, 'Change feed indexes', transactional=False)
+def change_seq_indexes(connection):
+    for name in (
+        'ix_harvests_change_seq_id',
+        'ix_milling_change_seq_id',
+        'ix_storage_change_seq_id',
+        'ix_sales_change_seq_id',
+    ):
+        create_index(connection, name)
+
+
+@migration(8, 'Backfill the daily_financials rollup')
+def backfill_daily_financials(connection):
+    # Databases from before the rollup have an empty daily_financials table (created by migration 1)
+    from sqlalchemy.orm import Session
+    import rollups
+
+    session = Session(bind=connection)
+    try:
+        rollups.rebuild_daily_financials(session)  # Its commit stays inside the migration's transaction
+    finally:
+        session.close()
+
+
+@migration(9, 'Pending change counter bumps')
+def pending_changes_table(connection):
+    PendingChange.__table__.create(connection, checkfirst=True)
+
+
+# ============= RUNNER =============
+
+def applied_versions(engine):
+    """Versions already recorded in schema_migrations"""
+    SchemaMigration.__table__.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return {row[0] for row in connection.execute(SchemaMigration.__table__.select().with_only_columns(
+            SchemaMigration.version
+        ))}
+
+
+def record(connection, version, description):
+    connection.execute(SchemaMigration.__table__.insert().values(
+        version=version, description=description, applied_at=datetime.utcnow()
+    ))
+
+
+def pending_migrations(engine):
+    """(version, description) of migrations not yet applied, in order"""
+    applied = applied_versions(engine)
+    return [(version, description) for version, description, _, _ in MIGRATIONS if version not in applied]
+
+
+def run_migrations(engine, log=print):
+    """Apply every pending migration in version order; returns the versions applied"""
+    applied = applied_versions(engine)
+    ran = []
+
+    for version, description, transactional, function in MIGRATIONS:
+        if version in applied:
+            continue
+        log(f'Applying {version:03d}: {description}...')
+
+        if transactional:
+            # Schema change and its bookkeeping row commit (or roll back) together
+            with engine.begin() as connection:
+                function(connection)
+                record(connection, version, description)
+        else:
+            # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                function(connection)
+                record(connection, version, description)
+        ran.append(version)
+
+    return ran
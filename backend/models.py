@@ -3,17 +3,62 @@ Database models for Palm Oil Business Management System
 """
 
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Index, UniqueConstraint, and_, case, func
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql.expression import FunctionElement
 import config
+from database import create_db_engine
 
 Base = declarative_base()
 
+# Remaining quantities (kg) at or below this are float noise, not stock: the container counts as sold
+QUANTITY_EPSILON = 1e-9
+
+
+class date_add_days(FunctionElement):
+    """Portable SQL expression for `date + N days`"""
+    type = Date()
+    name = 'date_add_days'
+    inherit_cache = True
+
+
+@compiles(date_add_days)
+def compile_date_add_days(element, compiler, **kw):
+    """PostgreSQL (and default): date + integer yields a date"""
+    start, days = list(element.clauses)
+    return f'({compiler.process(start, **kw)} + {compiler.process(days, **kw)})'
+
+
+@compiles(date_add_days, 'sqlite')
+def compile_date_add_days_sqlite(element, compiler, **kw):
+    """SQLite: date(start, '+N days')"""
+    start, days = list(element.clauses)
+    return f"date({compiler.process(start, **kw)}, '+' || {compiler.process(days, **kw)} || ' days')"
+
+
+def dialect_insert(session, table):
+    """INSERT construct supporting on_conflict_do_update for the session's database"""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    raise NotImplementedError(f'Upserts are not supported on {dialect}')
+
 
 class Harvest(Base):
     """FFB Harvest records"""
     __tablename__ = 'harvests'
+    __table_args__ = (
+        # Newest-first list / keyset pagination, and the unmilled-harvest alert scan
+        Index('ix_harvests_harvest_date_id', 'harvest_date', 'id'),
+        Index('ix_harvests_plantation_harvest_date', 'plantation', 'harvest_date'),
+        Index('ix_harvests_change_seq_id', 'change_seq', 'id'),  # Change feed
+    )
 
     id = Column(Integer, primary_key=True)
     harvest_date = Column(Date, nullable=False)
@@ -29,14 +74,22 @@ class Harvest(Base):
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Table change counter of the last transaction that inserted or updated this row (see versions.py)
+    change_seq = Column(Integer, nullable=False, default=0, server_default='0')
+
     # Relationships
     milling_records = relationship('Milling', back_populates='harvest')
 
-    @property
+    @hybrid_property
     def total_weight(self):
         """Calculate total FFB weight"""
         return self.num_bunches * self.weight_per_bunch
 
+    @total_weight.expression
+    def total_weight(cls):
+        """SQL expression for total FFB weight"""
+        return cls.num_bunches * cls.weight_per_bunch
+
     @property
     def expected_oil_yield(self):
         """Calculate expected CPO yield based on OER"""
@@ -47,7 +100,7 @@ class Harvest(Base):
         """Calculate expected CPO yield in liters"""
         return self.expected_oil_yield / config.CPO_DENSITY
 
-    @property
+    @hybrid_property
     def ffb_cost(self):
         """Calculate FFB cost - use purchase price if purchased, otherwise estimate"""
         if self.is_purchased and self.purchase_price:
@@ -56,6 +109,14 @@ class Harvest(Base):
             # For own harvest, estimate based on weight (can be customized)
             return self.total_weight * 50  # Default ₦50/kg for own harvest
 
+    @ffb_cost.expression
+    def ffb_cost(cls):
+        """SQL expression for FFB cost (mirrors the Python branch above)"""
+        return case(
+            (and_(cls.is_purchased == True, func.coalesce(cls.purchase_price, 0) != 0), cls.purchase_price),
+            else_=cls.total_weight * 50
+        )
+
     @property
     def cost_per_kg(self):
         """Calculate cost per kg of FFB"""
@@ -93,6 +154,11 @@ class Harvest(Base):
 class Milling(Base):
     """Milling operations records"""
     __tablename__ = 'milling'
+    __table_args__ = (
+        Index('ix_milling_harvest_id', 'harvest_id'),  # Harvest -> milling joins and the unmilled anti-join
+        Index('ix_milling_milling_date_id', 'milling_date', 'id'),
+        Index('ix_milling_change_seq_id', 'change_seq', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     milling_date = Column(Date, nullable=False)
@@ -102,6 +168,7 @@ class Milling(Base):
     oil_yield = Column(Float, nullable=False)  # kg
     transport_cost = Column(Float, default=0)  # Naira
     created_at = Column(DateTime, default=datetime.utcnow)
+    change_seq = Column(Integer, nullable=False, default=0, server_default='0')  # See Harvest.change_seq
 
     # Relationships
     harvest = relationship('Harvest', back_populates='milling_records')
@@ -156,9 +223,20 @@ class Milling(Base):
         }
 
 
+def default_remaining_quantity(context):
+    """New containers start with their full quantity remaining"""
+    return context.get_current_parameters()['quantity']
+
+
 class Storage(Base):
     """CPO Storage inventory"""
     __tablename__ = 'storage'
+    __table_args__ = (
+        # Available stock, expiry alerts and FIFO allocation all scan unsold containers by date
+        Index('ix_storage_is_sold_storage_date', 'is_sold', 'storage_date'),
+        Index('ix_storage_milling_id', 'milling_id'),
+        Index('ix_storage_change_seq_id', 'change_seq', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     container_id = Column(String(50), unique=True, nullable=False)
@@ -170,15 +248,32 @@ class Storage(Base):
     is_sold = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Denormalized sales totals, maintained by record_sale() and rebuilt by reconcile_storage.py
+    quantity_sold = Column(Float, nullable=False, default=0)  # kg
+    remaining_quantity = Column(Float, nullable=False, default=default_remaining_quantity, index=True)  # kg
+
+    # Optimistic concurrency: every ORM update checks and increments this, so two
+    # sales racing on the same container can't both commit (see concurrency.py)
+    version_id = Column(Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version_id}
+
+    change_seq = Column(Integer, nullable=False, default=0, server_default='0')  # See Harvest.change_seq
+
     # Relationships
     milling = relationship('Milling', back_populates='storage_records')
     sales_records = relationship('Sale', back_populates='storage')
 
-    @property
+    @hybrid_property
     def expiry_date(self):
         """Calculate expiry date"""
         return self.storage_date + timedelta(days=self.max_shelf_life_days)
 
+    @expiry_date.expression
+    def expiry_date(cls):
+        """SQL expression for expiry date"""
+        return date_add_days(cls.storage_date, func.coalesce(cls.max_shelf_life_days, config.DEFAULT_SHELF_LIFE_DAYS))
+
     @property
     def days_until_expiry(self):
         """Calculate days until expiry"""
@@ -202,13 +297,16 @@ class Storage(Base):
 
     @property
     def total_sold(self):
-        """Calculate total quantity sold from this container"""
-        return sum(sale.quantity_sold for sale in self.sales_records)
+        """Get total quantity sold from this container"""
+        return self.quantity_sold
 
-    @property
-    def remaining_quantity(self):
-        """Calculate remaining quantity in storage"""
-        return self.quantity - self.total_sold
+    def record_sale(self, quantity):
+        """Update the sold/remaining totals for a new sale from this container"""
+        self.quantity_sold = (self.quantity_sold or 0) + quantity
+        self.remaining_quantity = self.quantity - self.quantity_sold
+        if self.remaining_quantity <= QUANTITY_EPSILON:
+            self.remaining_quantity = 0.0
+            self.is_sold = True
 
     @property
     def remaining_quantity_liters(self):
@@ -216,6 +314,9 @@ class Storage(Base):
         return self.remaining_quantity / config.CPO_DENSITY
 
     def to_dict(self):
+        # Expiry fields all derive from one date calculation; do it once per row
+        expiry_date = self.expiry_date
+        days_until_expiry = (expiry_date - datetime.utcnow().date()).days
         return {
             'id': self.id,
             'container_id': self.container_id,
@@ -229,10 +330,10 @@ class Storage(Base):
             'max_shelf_life_days': self.max_shelf_life_days,
             'plantation_source': self.plantation_source,
             'is_sold': self.is_sold,
-            'expiry_date': self.expiry_date.isoformat(),
-            'days_until_expiry': self.days_until_expiry,
-            'is_near_expiry': self.is_near_expiry,
-            'is_expired': self.is_expired,
+            'expiry_date': expiry_date.isoformat(),
+            'days_until_expiry': days_until_expiry,
+            'is_near_expiry': days_until_expiry <= config.STORAGE_EXPIRY_WARNING_DAYS and not self.is_sold,
+            'is_expired': days_until_expiry < 0 and not self.is_sold,
             'created_at': self.created_at.isoformat()
         }
 
@@ -240,6 +341,12 @@ class Storage(Base):
 class Sale(Base):
     """Sales transactions"""
     __tablename__ = 'sales'
+    __table_args__ = (
+        Index('ix_sales_storage_id', 'storage_id'),  # Per-container sold totals (reconcile_storage)
+        Index('ix_sales_sale_date_id', 'sale_date', 'id'),
+        Index('ix_sales_payment_status_sale_date', 'payment_status', 'sale_date'),  # Pending payment alerts
+        Index('ix_sales_change_seq_id', 'change_seq', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     sale_date = Column(Date, nullable=False)
@@ -250,20 +357,31 @@ class Sale(Base):
     payment_status = Column(String(20), nullable=False)  # Paid/Pending
     payment_date = Column(Date, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    change_seq = Column(Integer, nullable=False, default=0, server_default='0')  # See Harvest.change_seq
 
     # Relationships
     storage = relationship('Storage', back_populates='sales_records')
 
-    @property
+    @hybrid_property
     def total_revenue(self):
         """Calculate total revenue from sale"""
         return self.quantity_sold * self.price_per_kg
 
-    @property
+    @total_revenue.expression
+    def total_revenue(cls):
+        """SQL expression for total revenue"""
+        return cls.quantity_sold * cls.price_per_kg
+
+    @hybrid_property
     def is_payment_pending(self):
         """Check if payment is pending"""
         return self.payment_status.lower() == 'pending'
 
+    @is_payment_pending.expression
+    def is_payment_pending(cls):
+        """SQL expression for pending payment check"""
+        return func.lower(cls.payment_status) == 'pending'
+
     @property
     def quantity_sold_liters(self):
         """Calculate quantity sold in liters"""
@@ -286,8 +404,95 @@ class Sale(Base):
         }
 
 
+class DailyFinancials(Base):
+    """Per-day, per-plantation financial rollup maintained by rollups.py"""
+    __tablename__ = 'daily_financials'
+    __table_args__ = (UniqueConstraint('date', 'plantation', name='uq_daily_financials_date_plantation'),)
+
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, nullable=False)
+    plantation = Column(String(50), nullable=False)
+    cost = Column(Float, nullable=False, default=0)  # Naira, total production cost of milling on this date
+    revenue = Column(Float, nullable=False, default=0)  # Naira, sales on this date
+    pending_revenue = Column(Float, nullable=False, default=0)  # Naira, portion of revenue awaiting payment
+    oil_produced = Column(Float, nullable=False, default=0)  # kg
+    oil_sold = Column(Float, nullable=False, default=0)  # kg
+
+    @hybrid_property
+    def profit(self):
+        """Calculate profit for the day"""
+        return self.revenue - self.cost
+
+    def to_dict(self):
+        return {
+            'date': self.date.isoformat(),
+            'plantation': self.plantation,
+            'cost': self.cost,
+            'revenue': self.revenue,
+            'profit': self.profit,
+            'pending_revenue': self.pending_revenue,
+            'oil_produced': self.oil_produced,
+            'oil_sold': self.oil_sold
+        }
+
+
+class ReportJob(Base):
+    """Background report rendering jobs (see report_jobs.py)"""
+    __tablename__ = 'report_jobs'
+
+    id = Column(String(32), primary_key=True)
+    report_format = Column(String(10), nullable=False)  # excel/pdf
+    report_type = Column(String(20), nullable=False)
+    status = Column(String(20), nullable=False, default='queued')  # queued/running/done/failed
+    progress = Column(Float, nullable=False, default=0)  # 0.0 - 1.0
+    filepath = Column(String(500), nullable=True)
+    error = Column(String(500), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'format': self.report_format,
+            'type': self.report_type,
+            'status': self.status,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class TableVersion(Base):
+    """Change counter per table, bumped by every write (see versions.py)"""
+    __tablename__ = 'table_versions'
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class PendingChange(Base):
+    """A counter bump (and, with row_id, a change_seq stamp) owed by a committed write (see versions.py)"""
+    __tablename__ = 'pending_changes'
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String(50), nullable=False)
+    row_id = Column(Integer)  # None when only the table's counter is owed
+
+
+class SchemaMigration(Base):
+    """Migrations applied to this database (see migrations.py)"""
+    __tablename__ = 'schema_migrations'
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
 def init_db():
     """Initialize the database"""
-    engine = create_engine(config.SQLALCHEMY_DATABASE_URI)
+    engine = create_db_engine()
     Base.metadata.create_all(engine)
     return engine
@@ -0,0 +1,204 @@
+"""
+Keyset pagination, filtering and sorting helpers for list endpoints
+
+Pages are addressed by an opaque cursor holding the sort value and id of the
+last row returned, so fetching page N costs the same as fetching page 1.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, or_, func
+import config
+import fieldsets
+
+
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+
+
+def parse_bool(value):
+    """Parse a boolean query string value"""
+    lowered = value.strip().lower()
+    if lowered in TRUE_VALUES:
+        return True
+    if lowered in FALSE_VALUES:
+        return False
+    raise ValueError(f'Invalid boolean value: {value}')
+
+
+def parse_value(column, value):
+    """Convert a query string value to the Python type of a column"""
+    python_type = column.type.python_type
+    if python_type is bool:
+        return parse_bool(value)
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def serialize_value(value):
+    """Convert a column value to a JSON-safe cursor component"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(sort_value, row_id):
+    """Encode the keyset position of a row as an opaque cursor"""
+    payload = json.dumps([serialize_value(sort_value), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_column):
+    """Decode a cursor into (sort_value, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if isinstance(sort_value, str):
+            sort_value = parse_value(sort_column, sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def apply_filters(query, args, date_column=None, filters=None):
+    """Apply date range and equality filters taken from query string args
+
+    filters maps a query string argument name to the column it filters on.
+    """
+    if date_column is not None:
+        if args.get('date_from'):
+            query = query.filter(date_column >= date.fromisoformat(args['date_from']))
+        if args.get('date_to'):
+            query = query.filter(date_column <= date.fromisoformat(args['date_to']))
+
+    for arg, column in (filters or {}).items():
+        if args.get(arg) not in (None, ''):
+            query = query.filter(column == parse_value(column, args[arg]))
+
+    return query
+
+
+def resolve_sort(model, args, sortable, default_sort):
+    """Resolve the ?sort= argument into (column, descending)
+
+    A leading '-' sorts descending, e.g. sort=-sale_date.
+    """
+    sort = args.get('sort', default_sort)
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name != 'id' and name not in sortable:
+        raise ValueError(f'Cannot sort by {name}. Allowed: {", ".join(["id"] + list(sortable))}')
+    return getattr(model, name), descending
+
+
+class ListSpec:
+    """How a list endpoint's model can be filtered, sorted and projected
+
+    filters maps a query string argument name to the column it filters on;
+    date_column is the column date_from / date_to apply to. ?fields= narrows
+    the columns loaded and serialized (see fieldsets.py).
+    """
+
+    def __init__(self, model, date_column, filters, sortable, default_sort):
+        self.model = model
+        self.date_column = date_column
+        self.filters = filters
+        self.sortable = sortable
+        self.default_sort = default_sort
+
+    def filtered(self, session, args):
+        """Query for the model with the request's filters and field projection applied"""
+        query = session.query(self.model)
+        fieldset = fieldsets.parse(self.model, args.get('fields'))
+        if fieldset is not None:
+            sort_column, _ = self.sort(args)
+            query = query.options(*fieldset.load_options(sort_column))  # The cursor needs the sort value
+        return apply_filters(query, args, self.date_column, self.filters)
+
+    def serializer(self, args):
+        """Function turning a row into its JSON dict for the request's ?fields="""
+        fieldset = fieldsets.parse(self.model, args.get('fields'))
+        return fieldset.serialize if fieldset is not None else self.model.to_dict
+
+    def sort(self, args):
+        """Resolve the request's sort into (column, descending)"""
+        return resolve_sort(self.model, args, self.sortable, self.default_sort)
+
+    def ordered(self, session, args):
+        """Filtered query in the requested order (id breaks ties)"""
+        sort_column, descending = self.sort(args)
+        return order_query(self.filtered(session, args), sort_column, self.model.id, descending)
+
+
+def order_query(query, sort_column, id_column, descending):
+    """Order a query by (sort_column, id) in one direction"""
+    if descending:
+        return query.order_by(sort_column.desc(), id_column.desc())
+    return query.order_by(sort_column.asc(), id_column.asc())
+
+
+def wants_page(args):
+    """Check whether the client asked for a paginated response"""
+    return 'limit' in args or 'cursor' in args
+
+
+def page_size(args):
+    """Get the requested page size, clamped to the configured maximum"""
+    limit = int(args.get('limit', config.DEFAULT_PAGE_SIZE))
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+    return min(limit, config.MAX_PAGE_SIZE)
+
+
+def list_query(session, spec, args):
+    """Run a list spec's query with ordering (and keyset pagination when requested)
+
+    Returns (rows, page_info). page_info is None for unpaginated requests,
+    otherwise a dict with next_cursor, has_more and optionally total.
+    """
+    sort_column, descending = spec.sort(args)
+    id_column = spec.model.id
+    query = spec.filtered(session, args)
+    ordered = order_query(query, sort_column, id_column, descending)
+
+    if not wants_page(args):
+        return ordered.all(), None
+
+    limit = page_size(args)
+    page_info = {}
+
+    if args.get('include_total') and parse_bool(args['include_total']):
+        page_info['total'] = query.with_entities(func.count(id_column)).order_by(None).scalar()
+
+    if args.get('cursor'):
+        sort_value, last_id = decode_cursor(args['cursor'], sort_column)
+        if sort_column is id_column:
+            keyset = id_column < last_id if descending else id_column > last_id
+        elif descending:
+            keyset = or_(sort_column < sort_value, and_(sort_column == sort_value, id_column < last_id))
+        else:
+            keyset = or_(sort_column > sort_value, and_(sort_column == sort_value, id_column > last_id))
+        ordered = ordered.filter(keyset)
+
+    # Fetch one extra row to learn whether another page exists
+    rows = ordered.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    last = rows[-1] if rows else None
+    page_info['has_more'] = has_more
+    page_info['next_cursor'] = (
+        encode_cursor(getattr(last, sort_column.key), last.id) if has_more else None
+    )
+    return rows, page_info
+
+
+def page_response(items, page_info):
+    """Build the JSON body for a list endpoint"""
+    if page_info is None:
+        return items
+    return dict(items=items, **page_info)
@@ -0,0 +1,49 @@
+"""
+Rebuild the denormalized sold/remaining quantities on storage from the sales table
+"""
+
+from sqlalchemy import case, func, or_, select, update
+from sqlalchemy.orm import sessionmaker
+from models import init_db, QUANTITY_EPSILON, Storage, Sale
+import versions
+
+
+def reconcile_storage(session):
+    """Recompute quantity_sold, remaining_quantity and is_sold for every container
+
+    Returns the number of containers updated.
+    """
+    sold = (
+        select(func.coalesce(func.sum(Sale.quantity_sold), 0))
+        .where(Sale.storage_id == Storage.id)
+        .scalar_subquery()
+    )
+
+    # Float noise left over is snapped to 0 and the container marked sold, as Storage.record_sale does
+    remaining = case((Storage.quantity - sold <= QUANTITY_EPSILON, 0.0), else_=Storage.quantity - sold)
+    is_sold = remaining <= 0
+    # Only containers whose totals actually move show up in the change feed
+    corrected = or_(Storage.quantity_sold != sold, Storage.remaining_quantity != remaining, Storage.is_sold != is_sold)
+
+    change_seq = versions.bump(session, 'storage')['storage']
+    result = session.execute(
+        update(Storage).values(
+            quantity_sold=sold,
+            remaining_quantity=remaining,
+            is_sold=is_sold,
+            version_id=Storage.version_id + 1,  # In-flight sales against these rows will retry
+            change_seq=case((corrected, change_seq), else_=Storage.change_seq)
+        ).execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return result.rowcount
+
+
+if __name__ == '__main__':
+    engine = init_db()
+    session = sessionmaker(bind=engine)()
+    try:
+        count = reconcile_storage(session)
+        print(f"Reconciled sold/remaining quantities for {count} storage containers")
+    finally:
+        session.close()
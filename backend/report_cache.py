@@ -0,0 +1,145 @@
+"""
+Content-addressed report cache
+
+Rendered reports are stored under a key derived from (report type, format,
+filters, data version). An identical request made before the underlying
+tables change gets the already-rendered file back instantly. The cache
+directory is kept under a size and age limit by LRU eviction. Concurrent
+misses for the same key within a worker wait for the first render instead
+of rendering again.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import versions
+import metrics
+import config
+
+
+# Tables each report type reads from
+REPORT_TABLES = {
+    'harvest': ('harvests',),
+    'milling': ('milling', 'harvests'),
+    'storage': ('storage',),
+    'sales': ('sales', 'storage'),
+    'summary': ('harvests', 'milling', 'storage', 'sales'),
+    'all': ('harvests', 'milling', 'storage', 'sales'),
+}
+
+# Report types whose content depends on today's date (expiry status, days until expiry)
+DATE_DEPENDENT_TYPES = ('storage', 'summary', 'all')
+
+EXTENSIONS = {'excel': 'xlsx', 'pdf': 'pdf'}
+
+RENDER_LOCK_STRIPES = 64  # Keys hash onto this many render locks
+
+
+class ReportCache:
+    """Store rendered reports by content key with size/age-bounded LRU eviction"""
+
+    def __init__(self, directory=config.REPORT_CACHE_DIR, max_bytes=config.REPORT_CACHE_MAX_BYTES,
+                 max_age_seconds=config.REPORT_CACHE_MAX_AGE_DAYS * 86400):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._render_locks = [threading.Lock() for _ in range(RENDER_LOCK_STRIPES)]
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, session, report_format, report_type, filters=None):
+        """Build the cache key for a report from its parameters and data version"""
+        parts = {
+            'format': report_format,
+            'type': report_type,
+            'filters': filters or {},
+            'data_version': versions.current(session, *REPORT_TABLES.get(report_type, versions.TABLES)),
+        }
+        if report_type in DATE_DEPENDENT_TYPES:
+            parts['as_of'] = datetime.utcnow().date().isoformat()
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def path(self, key, report_format):
+        """Path of the cached file for a key"""
+        return os.path.join(self.directory, f'{key}.{EXTENSIONS[report_format]}')
+
+    def get_or_render(self, session, report_format, report_type, render, filters=None):
+        """Return a cached report, rendering it with render() on a miss
+
+        render must return the path of a freshly written file; it is moved
+        into the cache. Returns (filepath, hit).
+        """
+        key = self.key(session, report_format, report_type, filters)
+        filepath = self.path(key, report_format)
+
+        if self._touch(filepath):
+            metrics.REPORT_CACHE_REQUESTS.inc(report_format, 'hit')
+            return filepath, True
+
+        with self._render_locks[hash(key) % RENDER_LOCK_STRIPES]:
+            # Another request may have rendered it while this one waited
+            if self._touch(filepath):
+                metrics.REPORT_CACHE_REQUESTS.inc(report_format, 'hit')
+                return filepath, True
+
+            metrics.REPORT_CACHE_REQUESTS.inc(report_format, 'miss')
+            started = time.perf_counter()
+            rendered = render()
+            metrics.REPORT_RENDER_SECONDS.observe(time.perf_counter() - started, report_format, report_type)
+            metrics.REPORT_SIZE_BYTES.observe(os.path.getsize(rendered), report_format, report_type)
+            os.replace(rendered, filepath)
+        self.evict(protect=filepath)
+        return filepath, False
+
+    def _touch(self, filepath):
+        """Mark a cached file as recently used; False if it isn't cached"""
+        try:
+            os.utime(filepath)
+            return True
+        except FileNotFoundError:
+            return False  # Not rendered yet, or evicted by another worker
+
+    def evict(self, protect=None):
+        """Delete expired entries, then least recently used ones until under max_bytes
+
+        protect names a file that must survive (the one about to be served).
+        """
+        with self._lock:
+            now = time.time()
+            entries = []
+            total_bytes = 0
+            for entry in os.scandir(self.directory):
+                if not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.path == protect:
+                    total_bytes += stat.st_size
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            keep = []
+            for mtime, size, path in entries:
+                if now - mtime > self.max_age_seconds:
+                    self._remove(path)
+                else:
+                    keep.append((mtime, size, path))
+                    total_bytes += size
+
+            for mtime, size, path in sorted(keep):
+                if total_bytes <= self.max_bytes:
+                    break
+                self._remove(path)
+                total_bytes -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,118 @@
+"""
+Background report jobs
+
+Report rendering runs on a small local thread pool instead of inside the
+request, so a burst of export clicks can't tie up the API workers. Job state
+lives in the report_jobs table, so any worker process can answer status polls
+for a job another worker accepted.
+"""
+
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from models import ReportJob, Harvest, Milling, Storage, Sale
+import config
+
+
+REPORT_FORMATS = ('excel', 'pdf')
+
+
+class ReportQueueFull(Exception):
+    """Raised when too many report jobs are already queued or running"""
+
+
+class ReportJobQueue:
+    """Bounded thread pool that renders reports with ReportGenerator"""
+
+    def __init__(self, session_factory, report_generator, report_cache,
+                 max_workers=config.REPORT_JOB_WORKERS, max_pending=config.REPORT_JOB_MAX_PENDING):
+        self.session_factory = session_factory
+        self.report_generator = report_generator
+        self.report_cache = report_cache
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report-job')
+
+    def submit(self, report_format, report_type='summary'):
+        """Create a job and queue it for rendering. Returns the job as a dict."""
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f'Invalid report format: {report_format}. Allowed: {", ".join(REPORT_FORMATS)}')
+        if report_type not in config.REPORT_TYPES:
+            raise ValueError(f'Invalid report type: {report_type}. Allowed: {", ".join(config.REPORT_TYPES)}')
+
+        if not self._slots.acquire(blocking=False):
+            raise ReportQueueFull(f'Too many report jobs in progress (limit {self.max_pending}). Try again shortly.')
+
+        session = self.session_factory()
+        try:
+            job = ReportJob(id=uuid.uuid4().hex, report_format=report_format, report_type=report_type)
+            session.add(job)
+            session.commit()
+            job_dict = job.to_dict()
+        except Exception:
+            self._slots.release()
+            raise
+        finally:
+            session.close()
+
+        self._executor.submit(self._run, job_dict['id'])
+        return job_dict
+
+    def get(self, job_id):
+        """Get a job record, or None if it doesn't exist"""
+        session = self.session_factory()
+        try:
+            job = session.get(ReportJob, job_id)
+            if not job:
+                return None
+            session.expunge(job)
+            return job
+        finally:
+            session.close()
+
+    def _run(self, job_id):
+        """Render a job on a pool thread, recording status and progress"""
+        session = self.session_factory()
+        try:
+            job = session.get(ReportJob, job_id)
+            job.status = 'running'
+            job.started_at = datetime.utcnow()
+            session.commit()
+
+            def progress(fraction):
+                job.progress = round(fraction, 3)
+                session.commit()
+
+            def render():
+                if job.report_format == 'excel':
+                    return self.report_generator.generate_excel_report_streaming(
+                        session, job.report_type, progress=progress
+                    )
+                harvests = session.query(Harvest).all()
+                milling_records = session.query(Milling).all()
+                storage_records = session.query(Storage).all()
+                sales = session.query(Sale).all()
+                progress(0.5)
+                return self.report_generator.generate_pdf_report(
+                    harvests, milling_records, storage_records, sales, job.report_type
+                )
+
+            filepath, _ = self.report_cache.get_or_render(session, job.report_format, job.report_type, render)
+
+            job.filepath = filepath
+            job.status = 'done'
+            job.progress = 1.0
+            job.finished_at = datetime.utcnow()
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            job = session.get(ReportJob, job_id)
+            if job:
+                job.status = 'failed'
+                job.error = str(e)[:500]
+                job.finished_at = datetime.utcnow()
+                session.commit()
+        finally:
+            session.close()
+            self._slots.release()
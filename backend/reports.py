@@ -3,14 +3,20 @@ Report generation module for Excel and PDF exports
 """
 
 import os
-from datetime import datetime
+import tempfile
+from datetime import datetime, timedelta
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
+from sqlalchemy import String, cast, func
+from models import Harvest, Milling, Storage, Sale
+import aggregates
 import config
 
 
@@ -45,13 +51,35 @@ class ReportGenerator:
             self._create_sales_sheet(wb, sales)
 
         # Save file
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'palm_oil_report_{report_type}_{timestamp}.xlsx'
-        filepath = os.path.join(config.REPORTS_DIR, filename)
+        filepath = self._report_path(report_type, 'xlsx')
         wb.save(filepath)
 
         return filepath
 
+    def _report_path(self, report_type, extension):
+        """Create a uniquely named, timestamped output file in the reports directory
+
+        Concurrent renders of the same report (even within one second) each
+        get their own file.
+        """
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        fd, filepath = tempfile.mkstemp(
+            prefix=f'palm_oil_report_{report_type}_{timestamp}_', suffix=f'.{extension}', dir=config.REPORTS_DIR
+        )
+        os.close(fd)
+        return filepath
+
+    def _append_row(self, ws, values, widths):
+        """Append a row, tracking the longest value seen in each column"""
+        ws.append(values)
+        for index, value in enumerate(values):
+            widths[index] = max(widths.get(index, 0), len(str(value)))
+
+    def _apply_column_widths(self, ws, widths):
+        """Set column widths from tracked value lengths"""
+        for index, max_length in widths.items():
+            ws.column_dimensions[get_column_letter(index + 1)].width = min(max_length + 2, 50)
+
     def _create_harvest_sheet(self, wb, harvests):
         """Create harvest data sheet"""
         ws = wb.create_sheet('Harvest Records')
@@ -59,7 +87,8 @@ class ReportGenerator:
         # Headers
         headers = ['ID', 'Date', 'Plantation', 'Bunches', 'Weight/Bunch (kg)',
                    'Total Weight (kg)', 'Ripeness', 'Expected Yield (kg)']
-        ws.append(headers)
+        widths = {}
+        self._append_row(ws, headers, widths)
 
         # Style headers
         for cell in ws[1]:
@@ -69,7 +98,7 @@ class ReportGenerator:
 
         # Data rows
         for h in harvests:
-            ws.append([
+            self._append_row(ws, [
                 h.id,
                 h.harvest_date.strftime('%Y-%m-%d'),
                 h.plantation,
@@ -78,20 +107,10 @@ class ReportGenerator:
                 h.total_weight,
                 h.ripeness,
                 h.expected_oil_yield
-            ])
+            ], widths)
 
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        # Auto-adjust column widths (tracked while appending rows)
+        self._apply_column_widths(ws, widths)
 
     def _create_milling_sheet(self, wb, milling_records):
         """Create milling data sheet"""
@@ -99,7 +118,8 @@ class ReportGenerator:
 
         headers = ['ID', 'Date', 'Mill Location', 'Harvest ID', 'Milling Cost (₦)',
                    'Transport Cost (₦)', 'Oil Yield (kg)', 'Cost/kg (₦)', 'Total Cost (₦)']
-        ws.append(headers)
+        widths = {}
+        self._append_row(ws, headers, widths)
 
         for cell in ws[1]:
             cell.font = Font(bold=True, color='FFFFFF')
@@ -107,7 +127,7 @@ class ReportGenerator:
             cell.alignment = Alignment(horizontal='center')
 
         for m in milling_records:
-            ws.append([
+            self._append_row(ws, [
                 m.id,
                 m.milling_date.strftime('%Y-%m-%d'),
                 m.mill_location,
@@ -117,19 +137,9 @@ class ReportGenerator:
                 m.oil_yield,
                 round(m.cost_per_kg, 2),
                 m.total_cost
-            ])
+            ], widths)
 
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        self._apply_column_widths(ws, widths)
 
     def _create_storage_sheet(self, wb, storage_records):
         """Create storage data sheet"""
@@ -137,7 +147,8 @@ class ReportGenerator:
 
         headers = ['Container ID', 'Quantity (kg)', 'Storage Date', 'Expiry Date',
                    'Days Until Expiry', 'Plantation Source', 'Status']
-        ws.append(headers)
+        widths = {}
+        self._append_row(ws, headers, widths)
 
         for cell in ws[1]:
             cell.font = Font(bold=True, color='FFFFFF')
@@ -146,7 +157,7 @@ class ReportGenerator:
 
         for s in storage_records:
             status = 'Sold' if s.is_sold else ('Expired' if s.is_expired else 'Available')
-            ws.append([
+            self._append_row(ws, [
                 s.container_id,
                 s.quantity,
                 s.storage_date.strftime('%Y-%m-%d'),
@@ -154,7 +165,7 @@ class ReportGenerator:
                 s.days_until_expiry,
                 s.plantation_source,
                 status
-            ])
+            ], widths)
 
             # Highlight expired items
             if s.is_expired and not s.is_sold:
@@ -162,17 +173,7 @@ class ReportGenerator:
                     cell.fill = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')
                     cell.font = Font(color='FFFFFF')
 
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        self._apply_column_widths(ws, widths)
 
     def _create_sales_sheet(self, wb, sales):
         """Create sales data sheet"""
@@ -180,7 +181,8 @@ class ReportGenerator:
 
         headers = ['ID', 'Date', 'Buyer', 'Container ID', 'Quantity (kg)',
                    'Price/kg (₦)', 'Total Revenue (₦)', 'Payment Status', 'Payment Date']
-        ws.append(headers)
+        widths = {}
+        self._append_row(ws, headers, widths)
 
         for cell in ws[1]:
             cell.font = Font(bold=True, color='FFFFFF')
@@ -188,7 +190,7 @@ class ReportGenerator:
             cell.alignment = Alignment(horizontal='center')
 
         for s in sales:
-            ws.append([
+            self._append_row(ws, [
                 s.id,
                 s.sale_date.strftime('%Y-%m-%d'),
                 s.buyer_name,
@@ -198,24 +200,14 @@ class ReportGenerator:
                 s.total_revenue,
                 s.payment_status,
                 s.payment_date.strftime('%Y-%m-%d') if s.payment_date else 'N/A'
-            ])
+            ], widths)
 
             # Highlight pending payments
             if s.is_payment_pending:
                 for cell in ws[ws.max_row]:
                     cell.fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
 
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        self._apply_column_widths(ws, widths)
 
     def _create_summary_sheet(self, wb, harvests, milling_records, storage_records, sales):
         """Create summary sheet with KPIs"""
@@ -243,36 +235,301 @@ class ReportGenerator:
         total_oil = sum(m.oil_yield for m in milling_records)
         total_cost = sum(m.total_cost for m in milling_records)
         total_revenue = sum(s.total_revenue for s in sales)
-        total_profit = total_revenue - total_cost
         available_stock = sum(s.quantity for s in storage_records if not s.is_sold)
 
-        kpis = [
+        kpis = self._summary_kpis(
+            total_ffb, total_oil, total_cost, total_revenue, available_stock,
+            len(harvests), len(milling_records), len(sales)
+        )
+
+        for kpi, value in kpis:
+            ws[f'A{row}'] = kpi
+            ws[f'B{row}'] = value
+            ws[f'A{row}'].font = Font(bold=True)
+            row += 1
+
+        # Adjust column widths
+        ws.column_dimensions['A'].width = 30
+        ws.column_dimensions['B'].width = 20
+
+    def _summary_kpis(self, total_ffb, total_oil, total_cost, total_revenue, available_stock,
+                      harvest_count, milling_count, sales_count):
+        """Build the KPI rows shown on the summary sheet"""
+        total_profit = total_revenue - total_cost
+        return [
             ['Total FFB Harvested', f'{total_ffb:.2f} kg'],
             ['Total CPO Produced', f'{total_oil:.2f} kg'],
             ['Total Production Cost', f'₦{total_cost:,.2f}'],
             ['Total Revenue', f'₦{total_revenue:,.2f}'],
             ['Total Profit', f'₦{total_profit:,.2f}'],
             ['Available Stock', f'{available_stock:.2f} kg'],
-            ['Number of Harvests', len(harvests)],
-            ['Number of Milling Operations', len(milling_records)],
-            ['Number of Sales', len(sales)]
+            ['Number of Harvests', harvest_count],
+            ['Number of Milling Operations', milling_count],
+            ['Number of Sales', sales_count]
         ]
 
-        for kpi, value in kpis:
-            ws[f'A{row}'] = kpi
-            ws[f'B{row}'] = value
-            ws[f'A{row}'].font = Font(bold=True)
-            row += 1
+    # ============= STREAMING EXCEL EXPORT =============
 
-        # Adjust column widths
+    def generate_excel_report_streaming(self, session, report_type='summary', progress=None):
+        """Generate Excel report with constant memory use
+
+        Rows are fetched from the database in chunks (yield_per, which uses a
+        server-side cursor on PostgreSQL) and appended straight to openpyxl
+        write-only worksheets, so the dataset is never held in memory.
+        progress, if given, is called with the completed fraction after each sheet.
+        """
+        wb = Workbook(write_only=True)
+
+        if report_type == 'summary' or report_type == 'all':
+            sheets = [
+                self._stream_summary_sheet,
+                self._stream_harvest_sheet,
+                self._stream_milling_sheet,
+                self._stream_storage_sheet,
+                self._stream_sales_sheet
+            ]
+        else:
+            sheets = {
+                'harvest': [self._stream_harvest_sheet],
+                'milling': [self._stream_milling_sheet],
+                'storage': [self._stream_storage_sheet],
+                'sales': [self._stream_sales_sheet]
+            }.get(report_type, [])
+
+        for index, write_sheet in enumerate(sheets):
+            write_sheet(wb, session)
+            if progress:
+                progress((index + 1) / (len(sheets) + 1))
+
+        filepath = self._report_path(report_type, 'xlsx')
+        wb.save(filepath)
+
+        return filepath
+
+    def _styled_cells(self, ws, values, font=None, fill=None, alignment=None):
+        """Wrap row values in write-only cells carrying the given style"""
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value=value)
+            if font:
+                cell.font = font
+            if fill:
+                cell.fill = fill
+            if alignment:
+                cell.alignment = alignment
+            cells.append(cell)
+        return cells
+
+    def _stream_header(self, ws, headers, color):
+        """Append the styled header row to a write-only sheet"""
+        ws.append(self._styled_cells(
+            ws, headers,
+            font=Font(bold=True, color='FFFFFF'),
+            fill=PatternFill(start_color=color, end_color=color, fill_type='solid'),
+            alignment=Alignment(horizontal='center')
+        ))
+
+    def _set_streaming_widths(self, ws, query, headers, columns):
+        """Size columns before any rows are streamed
+
+        Write-only sheets emit column widths ahead of the rows, so widths are
+        taken from a single MAX(LENGTH(...)) aggregate over `query`. Each entry
+        in columns is either a SQL expression or a fixed width for values
+        computed in Python.
+        """
+        expressions = [column for column in columns if not isinstance(column, int)]
+        longest = iter(query.with_entities(
+            *[func.max(func.length(cast(expression, String))) for expression in expressions]
+        ).order_by(None).one()) if expressions else iter(())
+
+        for index, (header, column) in enumerate(zip(headers, columns)):
+            length = column if isinstance(column, int) else (next(longest) or 0)
+            ws.column_dimensions[get_column_letter(index + 1)].width = min(max(len(header), length) + 2, 50)
+
+    def _stream_harvest_sheet(self, wb, session):
+        """Stream harvest data sheet"""
+        ws = wb.create_sheet('Harvest Records')
+
+        headers = ['ID', 'Date', 'Plantation', 'Bunches', 'Weight/Bunch (kg)',
+                   'Total Weight (kg)', 'Ripeness', 'Expected Yield (kg)']
+        query = session.query(
+            Harvest.id, Harvest.harvest_date, Harvest.plantation, Harvest.num_bunches,
+            Harvest.weight_per_bunch, Harvest.ripeness
+        ).order_by(Harvest.id)
+
+        self._set_streaming_widths(ws, query, headers, [
+            Harvest.id, 10, Harvest.plantation, Harvest.num_bunches, Harvest.weight_per_bunch,
+            Harvest.total_weight, Harvest.ripeness, Harvest.total_weight * config.OER_PERCENTAGE
+        ])
+        self._stream_header(ws, headers, '4472C4')
+
+        for h in query.yield_per(config.REPORT_CHUNK_SIZE):
+            total_weight = h.num_bunches * h.weight_per_bunch
+            ws.append([
+                h.id,
+                h.harvest_date.strftime('%Y-%m-%d'),
+                h.plantation,
+                h.num_bunches,
+                h.weight_per_bunch,
+                total_weight,
+                h.ripeness,
+                total_weight * config.OER_PERCENTAGE
+            ])
+
+    def _stream_milling_sheet(self, wb, session):
+        """Stream milling data sheet"""
+        ws = wb.create_sheet('Milling Records')
+
+        headers = ['ID', 'Date', 'Mill Location', 'Harvest ID', 'Milling Cost (₦)',
+                   'Transport Cost (₦)', 'Oil Yield (kg)', 'Cost/kg (₦)', 'Total Cost (₦)']
+        total_cost = aggregates.milling_total_cost_expr()
+        query = session.query(
+            Milling.id, Milling.milling_date, Milling.mill_location, Milling.harvest_id,
+            Milling.milling_cost, Milling.transport_cost, Milling.oil_yield,
+            total_cost.label('total_cost')
+        ).select_from(Milling).outerjoin(
+            Harvest, Milling.harvest_id == Harvest.id
+        ).order_by(Milling.id)
+
+        self._set_streaming_widths(ws, query, headers, [
+            Milling.id, 10, Milling.mill_location, Milling.harvest_id, Milling.milling_cost,
+            Milling.transport_cost, Milling.oil_yield, 10, total_cost
+        ])
+        self._stream_header(ws, headers, '70AD47')
+
+        for m in query.yield_per(config.REPORT_CHUNK_SIZE):
+            transport_cost = m.transport_cost or 0
+            cost_per_kg = (m.milling_cost + transport_cost) / m.oil_yield if m.oil_yield > 0 else 0
+            ws.append([
+                m.id,
+                m.milling_date.strftime('%Y-%m-%d'),
+                m.mill_location,
+                m.harvest_id,
+                m.milling_cost,
+                m.transport_cost,
+                m.oil_yield,
+                round(cost_per_kg, 2),
+                m.total_cost
+            ])
+
+    def _stream_storage_sheet(self, wb, session):
+        """Stream storage data sheet"""
+        ws = wb.create_sheet('Storage Inventory')
+
+        headers = ['Container ID', 'Quantity (kg)', 'Storage Date', 'Expiry Date',
+                   'Days Until Expiry', 'Plantation Source', 'Status']
+        query = session.query(
+            Storage.container_id, Storage.quantity, Storage.storage_date,
+            Storage.max_shelf_life_days, Storage.plantation_source, Storage.is_sold
+        ).order_by(Storage.id)
+
+        self._set_streaming_widths(ws, query, headers, [
+            Storage.container_id, Storage.quantity, 10, 10, 6, Storage.plantation_source, 9
+        ])
+        self._stream_header(ws, headers, 'FFC000')
+
+        expired_fill = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')
+        expired_font = Font(color='FFFFFF')
+        today = datetime.utcnow().date()
+
+        for s in query.yield_per(config.REPORT_CHUNK_SIZE):
+            expiry_date = s.storage_date + timedelta(days=s.max_shelf_life_days)
+            days_until_expiry = (expiry_date - today).days
+            is_expired = days_until_expiry < 0 and not s.is_sold
+            status = 'Sold' if s.is_sold else ('Expired' if is_expired else 'Available')
+            values = [
+                s.container_id,
+                s.quantity,
+                s.storage_date.strftime('%Y-%m-%d'),
+                expiry_date.strftime('%Y-%m-%d'),
+                days_until_expiry,
+                s.plantation_source,
+                status
+            ]
+
+            # Highlight expired items
+            if is_expired:
+                values = self._styled_cells(ws, values, font=expired_font, fill=expired_fill)
+            ws.append(values)
+
+    def _stream_sales_sheet(self, wb, session):
+        """Stream sales data sheet"""
+        ws = wb.create_sheet('Sales Records')
+
+        headers = ['ID', 'Date', 'Buyer', 'Container ID', 'Quantity (kg)',
+                   'Price/kg (₦)', 'Total Revenue (₦)', 'Payment Status', 'Payment Date']
+        query = session.query(
+            Sale.id, Sale.sale_date, Sale.buyer_name, Storage.container_id, Sale.quantity_sold,
+            Sale.price_per_kg, Sale.payment_status, Sale.payment_date
+        ).select_from(Sale).outerjoin(
+            Storage, Sale.storage_id == Storage.id
+        ).order_by(Sale.id)
+
+        self._set_streaming_widths(ws, query, headers, [
+            Sale.id, 10, Sale.buyer_name, Storage.container_id, Sale.quantity_sold,
+            Sale.price_per_kg, Sale.total_revenue, Sale.payment_status, 10
+        ])
+        self._stream_header(ws, headers, 'C00000')
+
+        pending_fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
+
+        for s in query.yield_per(config.REPORT_CHUNK_SIZE):
+            values = [
+                s.id,
+                s.sale_date.strftime('%Y-%m-%d'),
+                s.buyer_name,
+                s.container_id or 'N/A',
+                s.quantity_sold,
+                s.price_per_kg,
+                s.quantity_sold * s.price_per_kg,
+                s.payment_status,
+                s.payment_date.strftime('%Y-%m-%d') if s.payment_date else 'N/A'
+            ]
+
+            # Highlight pending payments
+            if s.payment_status.lower() == 'pending':
+                values = self._styled_cells(ws, values, fill=pending_fill)
+            ws.append(values)
+
+    def _stream_summary_sheet(self, wb, session):
+        """Stream summary sheet with KPIs computed by SQL aggregates"""
+        ws = wb.create_sheet('Summary')
         ws.column_dimensions['A'].width = 30
         ws.column_dimensions['B'].width = 20
 
+        harvest = aggregates.harvest_totals(session)
+        milling = aggregates.milling_totals(session)
+        sales = aggregates.sales_totals(session)
+        available_stock = aggregates.unsold_quantity_total(session)
+
+        # Title and date
+        ws.append(self._styled_cells(
+            ws, ['PALM OIL BUSINESS SUMMARY'],
+            font=Font(size=16, bold=True), alignment=Alignment(horizontal='center')
+        ))
+        ws.append(self._styled_cells(
+            ws, [f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'],
+            alignment=Alignment(horizontal='center')
+        ))
+        ws.merged_cells.add('A1:D1')
+        ws.merged_cells.add('A2:D2')
+        ws.append([])
+
+        # KPIs
+        ws.append(self._styled_cells(ws, ['KEY PERFORMANCE INDICATORS'], font=Font(bold=True, size=12)))
+        ws.append([])
+
+        kpis = self._summary_kpis(
+            harvest['total_weight'], milling['total_oil'], milling['total_cost'],
+            sales['total_revenue'], available_stock,
+            harvest['count'], milling['count'], sales['count']
+        )
+        for kpi, value in kpis:
+            ws.append(self._styled_cells(ws, [kpi], font=Font(bold=True)) + [value])
+
     def generate_pdf_report(self, harvests, milling_records, storage_records, sales, report_type='summary'):
         """Generate PDF report"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'palm_oil_report_{report_type}_{timestamp}.pdf'
-        filepath = os.path.join(config.REPORTS_DIR, filename)
+        filepath = self._report_path(report_type, 'pdf')
 
         doc = SimpleDocTemplate(filepath, pagesize=letter)
         elements = []
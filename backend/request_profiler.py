@@ -0,0 +1,207 @@
+"""
+On-demand cProfile / tracemalloc capture of single requests
+
+A request is captured when either:
+- it carries `X-Profile: cpu`, `memory` or `cpu,memory` together with
+  `X-Admin-Token` matching ADMIN_TOKEN, or
+- its endpoint is in PROFILE_SAMPLE_ENDPOINTS and it is picked at random
+  with probability PROFILE_SAMPLE_RATE (CPU only)
+
+Each capture is saved to PROFILES_DIR as three files sharing an id: the raw
+pstats dump (`.pstats`, open with pstats or snakeviz), a text summary of the
+top functions and allocations (`.txt`) and its metadata (`.json`). Only the
+newest PROFILE_MAX_CAPTURES are kept. tracemalloc traces the whole process,
+so only one memory capture runs at a time and it includes allocations made
+by other threads meanwhile.
+"""
+
+import cProfile
+import hmac
+import inspect
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from flask import request
+import config
+
+
+HEADER = 'X-Profile'
+TOKEN_HEADER = 'X-Admin-Token'
+CAPTURE_HEADER = 'X-Profile-Capture'
+ADMIN_PREFIX = f'{config.API_PREFIX}/admin/'
+CAPTURE_ID = re.compile(r'^[0-9TZ]+-[A-Za-z0-9_]+-[0-9a-f]{8}$')
+EXTENSIONS = {'pstats': 'pstats', 'text': 'txt'}
+TOP_ENTRIES = 40  # Functions and allocation sites listed in the text summary
+
+_local = threading.local()
+_memory_lock = threading.Lock()
+
+
+def is_admin(token):
+    """Check an admin token against ADMIN_TOKEN (always False when none is configured)"""
+    return bool(config.ADMIN_TOKEN) and hmac.compare_digest(token or '', config.ADMIN_TOKEN)
+
+
+def requested_modes():
+    """(modes, trigger) for the current request; modes is a subset of {'cpu', 'memory'}, empty for none"""
+    value = request.headers.get(HEADER)
+    if request.path.startswith(ADMIN_PREFIX):
+        return set(), None  # Browsing captures must not evict them
+    if value and is_admin(request.headers.get(TOKEN_HEADER)):
+        modes = {mode.strip().lower() for mode in value.split(',')}
+        return ({'cpu', 'memory'} if modes & {'1', 'true', 'all'} else modes & {'cpu', 'memory'}), 'header'
+    if request.endpoint in config.PROFILE_SAMPLE_ENDPOINTS and random.random() < config.PROFILE_SAMPLE_RATE:
+        return {'cpu'}, 'sample'
+    return set(), None
+
+
+class Capture:
+    """Profilers running for the current request"""
+
+    def __init__(self, modes, trigger):
+        self.id = f'{datetime.utcnow():%Y%m%dT%H%M%S}Z-{request.endpoint or "unmatched"}-{uuid.uuid4().hex[:8]}'
+        self.trigger = trigger
+        self.method = request.method
+        self.path = request.full_path.rstrip('?')
+        self.endpoint = request.endpoint
+        self.profiler = None
+        self.memory = False
+        self.started = time.perf_counter()
+
+        if 'memory' in modes and _memory_lock.acquire(blocking=False):
+            self.memory = True
+            tracemalloc.start(config.PROFILE_TRACEMALLOC_FRAMES)
+        if 'cpu' in modes:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop(self, status):
+        """Stop profiling and write the capture files"""
+        duration = time.perf_counter() - self.started
+        snapshot = peak = None
+        if self.profiler:
+            self.profiler.disable()
+        if self.memory:
+            try:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                # Always end tracing so the next memory capture can run
+                tracemalloc.stop()
+                _memory_lock.release()
+
+        os.makedirs(config.PROFILES_DIR, exist_ok=True)
+        base = os.path.join(config.PROFILES_DIR, self.id)
+        summary = io.StringIO()
+        summary.write(f'{self.method} {self.path} -> {status} in {duration * 1000:.1f} ms\n')
+
+        if self.profiler:
+            self.profiler.dump_stats(base + '.pstats')
+            summary.write('\n=== CPU (top functions by cumulative time) ===\n')
+            pstats.Stats(self.profiler, stream=summary).sort_stats('cumulative').print_stats(TOP_ENTRIES)
+        if snapshot:
+            summary.write(f'\n=== Memory (peak {peak / 1024:.0f} KiB, top allocation sites) ===\n')
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            for stat in snapshot.statistics('lineno')[:TOP_ENTRIES]:
+                summary.write(f'{stat}\n')
+
+        with open(base + '.txt', 'w') as f:
+            f.write(summary.getvalue())
+        with open(base + '.json', 'w') as f:
+            json.dump({
+                'id': self.id,
+                'created_at': datetime.utcnow().isoformat(),
+                'trigger': self.trigger,
+                'method': self.method,
+                'path': self.path,
+                'endpoint': self.endpoint,
+                'status': status,
+                'duration_ms': round(duration * 1000, 3),
+                'cpu': self.profiler is not None,
+                'memory': self.memory,
+                'peak_memory_bytes': peak
+            }, f)
+        evict()
+
+
+def evict():
+    """Delete the oldest captures beyond PROFILE_MAX_CAPTURES"""
+    captures = sorted(list_captures(), key=lambda capture: capture['id'])
+    for capture in captures[:max(0, len(captures) - config.PROFILE_MAX_CAPTURES)]:
+        for extension in ('json', 'txt', 'pstats'):
+            try:
+                os.remove(os.path.join(config.PROFILES_DIR, f'{capture["id"]}.{extension}'))
+            except FileNotFoundError:
+                pass
+
+
+def list_captures():
+    """Metadata of saved captures, newest first"""
+    if not os.path.isdir(config.PROFILES_DIR):
+        return []
+    captures = []
+    for name in os.listdir(config.PROFILES_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(config.PROFILES_DIR, name)) as f:
+                captures.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # Being written or evicted by another worker
+    return sorted(captures, key=lambda capture: capture['id'], reverse=True)
+
+
+def capture_path(capture_id, kind):
+    """Path of one file of a capture, or None if the id or kind is invalid or the file is gone"""
+    if not CAPTURE_ID.match(capture_id) or kind not in EXTENSIONS:
+        return None
+    path = os.path.join(config.PROFILES_DIR, f'{capture_id}.{EXTENSIONS[kind]}')
+    return path if os.path.exists(path) else None
+
+
+# ============= REQUEST HOOKS =============
+
+def before_request():
+    modes, trigger = requested_modes()
+    _local.status = None
+    _local.capture = Capture(modes, trigger) if modes else None
+
+
+def after_request(response):
+    """Point the client at the capture; generator bodies are profiled until the response is closed"""
+    capture = getattr(_local, 'capture', None)
+    if capture is None:
+        return response
+    response.headers[CAPTURE_HEADER] = capture.id
+    _local.status = response.status_code
+
+    if inspect.isgenerator(response.response):
+        # Include the body of streamed responses in the profile
+        _local.capture = None
+        status = response.status_code
+        response.call_on_close(lambda: capture.stop(status))
+    return response
+
+
+def teardown_request(error=None):
+    """Stop the capture of every request whose body is already built, including ones that raised"""
+    capture = getattr(_local, 'capture', None)
+    if capture is None:
+        return
+    _local.capture = None
+    capture.stop(getattr(_local, 'status', None) or 500)
+
+
+def init_app(app):
+    """Register request capture hooks on a Flask app"""
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
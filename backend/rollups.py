@@ -0,0 +1,203 @@
+"""
+Daily financial rollups
+
+The daily_financials table holds cost, revenue and volume per date and
+plantation. Write endpoints update it incrementally in their own transaction
+via record_milling / record_sale / record_payment_change, and
+rebuild_daily_financials recomputes it from the source tables.
+
+Run this module directly to rebuild the rollup:
+
+    python rollups.py
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import sessionmaker
+from models import init_db, dialect_insert, DailyFinancials, Harvest, Milling, Storage, Sale
+from aggregates import milling_total_cost_expr
+import versions
+
+
+ROLLUP_FIELDS = ('cost', 'revenue', 'pending_revenue', 'oil_produced', 'oil_sold')
+GRANULARITIES = ('day', 'week', 'month')
+
+
+class RollupMissing(Exception):
+    """The rollup is empty although there are milling records or sales (never built)"""
+
+
+def rollup_missing(session):
+    """Check whether daily_financials is empty while its source tables are not"""
+    if session.query(DailyFinancials.date).first() is not None:
+        return False
+    return session.query(Milling.id).first() is not None or session.query(Sale.id).first() is not None
+
+
+def ensure_daily_financials(session):
+    """Rebuild the rollup if it was never built; returns the rows written (0 when it was already there)"""
+    if not rollup_missing(session):
+        return 0
+    return rebuild_daily_financials(session)
+
+
+def add_to_daily(session, day, plantation, **deltas):
+    """Atomically add deltas to the rollup row for (day, plantation), creating it if needed"""
+    values = {field: deltas.get(field, 0) for field in ROLLUP_FIELDS}
+    table = DailyFinancials.__table__
+    insert = dialect_insert(session, table)
+    statement = insert.values(date=day, plantation=plantation, **values).on_conflict_do_update(
+        index_elements=['date', 'plantation'],
+        set_={field: table.c[field] + insert.excluded[field] for field in ROLLUP_FIELDS}
+    )
+    session.execute(statement)
+
+
+def record_milling(session, milling, plantation):
+    """Add a new milling record's cost and oil yield to the rollup"""
+    add_to_daily(
+        session, milling.milling_date, plantation,
+        cost=milling.total_cost,
+        oil_produced=milling.oil_yield
+    )
+
+
+def record_sale(session, sale, plantation):
+    """Add a new sale's revenue and volume to the rollup"""
+    add_to_daily(
+        session, sale.sale_date, plantation,
+        revenue=sale.total_revenue,
+        pending_revenue=sale.total_revenue if sale.is_payment_pending else 0,
+        oil_sold=sale.quantity_sold
+    )
+
+
+def record_payment_change(session, sale, was_pending, plantation):
+    """Move a sale's revenue into or out of pending_revenue after a payment status update"""
+    if was_pending == sale.is_payment_pending:
+        return
+    delta = sale.total_revenue if sale.is_payment_pending else -sale.total_revenue
+    add_to_daily(session, sale.sale_date, plantation, pending_revenue=delta)
+
+
+def milling_plantation_expr():
+    """SQL expression for the plantation a milling record is attributed to
+
+    Matches create_milling: the harvest's plantation, else the plantation
+    recorded on the storage container it produced.
+    """
+    storage_source = (
+        select(func.min(Storage.plantation_source))
+        .where(Storage.milling_id == Milling.id)
+        .scalar_subquery()
+    )
+    return func.coalesce(Harvest.plantation, storage_source, 'Unknown')
+
+
+def rebuild_daily_financials(session):
+    """Recompute the whole rollup from milling and sales records
+
+    Returns the number of rollup rows written.
+    """
+    rows = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+
+    plantation = milling_plantation_expr()
+    milling_totals = session.query(
+        Milling.milling_date, plantation,
+        func.sum(milling_total_cost_expr()),
+        func.sum(Milling.oil_yield)
+    ).select_from(Milling).outerjoin(
+        Harvest, Milling.harvest_id == Harvest.id
+    ).group_by(Milling.milling_date, plantation)
+
+    for day, source, cost, oil in milling_totals:
+        rows[(day, source)]['cost'] += cost or 0
+        rows[(day, source)]['oil_produced'] += oil or 0
+
+    source = func.coalesce(Storage.plantation_source, 'Unknown')
+    sales_totals = session.query(
+        Sale.sale_date, source,
+        func.sum(Sale.total_revenue),
+        func.sum(case((Sale.is_payment_pending, Sale.total_revenue), else_=0)),
+        func.sum(Sale.quantity_sold)
+    ).select_from(Sale).outerjoin(
+        Storage, Sale.storage_id == Storage.id
+    ).group_by(Sale.sale_date, source)
+
+    for day, plantation_source, revenue, pending, sold in sales_totals:
+        rows[(day, plantation_source)]['revenue'] += revenue or 0
+        rows[(day, plantation_source)]['pending_revenue'] += pending or 0
+        rows[(day, plantation_source)]['oil_sold'] += sold or 0
+
+    session.query(DailyFinancials).delete()
+    session.bulk_insert_mappings(DailyFinancials, [
+        dict(date=day, plantation=plantation_source, **values)
+        for (day, plantation_source), values in rows.items()
+    ])
+    versions.bump(session, 'daily_financials')
+    session.commit()
+    return len(rows)
+
+
+def bucket_start(day, granularity):
+    """First date of the day/week/month bucket containing day (weeks start on Monday)"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def profit_trends(session, granularity='day', date_from=None, date_to=None, plantation=None):
+    """Read profit trends from the rollup, bucketed by day, week or month
+
+    Raises RollupMissing instead of returning no trends when the rollup was never built.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Invalid granularity: {granularity}. Allowed: {", ".join(GRANULARITIES)}')
+
+    query = session.query(
+        DailyFinancials.date,
+        func.sum(DailyFinancials.cost),
+        func.sum(DailyFinancials.revenue),
+        func.sum(DailyFinancials.oil_produced),
+        func.sum(DailyFinancials.oil_sold)
+    )
+    if date_from:
+        query = query.filter(DailyFinancials.date >= date_from)
+    if date_to:
+        query = query.filter(DailyFinancials.date <= date_to)
+    if plantation:
+        query = query.filter(DailyFinancials.plantation == plantation)
+
+    trends = {}
+    for day, cost, revenue, oil_produced, oil_sold in query.group_by(DailyFinancials.date):
+        date_str = bucket_start(day, granularity).isoformat()
+        if date_str not in trends:
+            trends[date_str] = {
+                'date': date_str, 'cost': 0, 'revenue': 0, 'profit': 0,
+                'oil_produced': 0, 'oil_sold': 0
+            }
+        trends[date_str]['cost'] += cost
+        trends[date_str]['revenue'] += revenue
+        trends[date_str]['oil_produced'] += oil_produced
+        trends[date_str]['oil_sold'] += oil_sold
+
+    if not trends and rollup_missing(session):
+        raise RollupMissing('The daily_financials rollup has not been built. Run python migrate_db.py')
+
+    for date_str in trends:
+        trends[date_str]['profit'] = trends[date_str]['revenue'] - trends[date_str]['cost']
+
+    return sorted(trends.values(), key=lambda x: x['date'])
+
+
+if __name__ == '__main__':
+    engine = init_db()
+    session = sessionmaker(bind=engine)()
+    try:
+        count = rebuild_daily_financials(session)
+        print(f"Rebuilt daily_financials rollup: {count} rows")
+    finally:
+        session.close()
@@ -0,0 +1,82 @@
+"""
+Fast JSON serialization
+
+FastJSONProvider plugs into Flask (app.json) so every jsonify() call uses
+orjson when it is installed, falling back to the standard library otherwise.
+stream_json_array() serializes large list responses incrementally instead of
+building the whole body in memory.
+"""
+
+import json
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+import config
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def dumps(obj, default=DefaultJSONProvider.default, sort_keys=False, indent=False):
+    """Serialize obj to UTF-8 JSON bytes with the fastest available encoder"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+
+    return json.dumps(
+        obj, default=default, sort_keys=sort_keys, ensure_ascii=False,
+        indent=2 if indent else None, separators=None if indent else (',', ':')
+    ).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (stdlib fallback)"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, default=self.default, sort_keys=self.sort_keys).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = dumps(obj, default=self.default, sort_keys=self.sort_keys, indent=indent)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def wants_stream(args):
+    """Check whether the client asked for a streamed list response (?stream=true)"""
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_json_array(session_factory, build_query, serialize):
+    """Stream query results as a JSON array without holding them all in memory
+
+    The generator opens its own session (the request's session is closed
+    before the body is sent), fetches rows in chunks with yield_per and
+    emits one chunk of serialized rows at a time.
+    """
+    def generate():
+        session = session_factory()
+        try:
+            yield b'['
+            separator = b''
+            chunk = []
+            for row in build_query(session).yield_per(config.STREAM_CHUNK_SIZE):
+                chunk.append(dumps(serialize(row)))
+                if len(chunk) >= config.STREAM_CHUNK_SIZE:
+                    yield separator + b','.join(chunk)
+                    separator = b','
+                    chunk = []
+            if chunk:
+                yield separator + b','.join(chunk)
+            yield b']\n'
+        finally:
+            session.close()
+
+    return Response(generate(), mimetype='application/json')
@@ -0,0 +1,210 @@
+"""
+Opt-in per-request SQL profiling
+
+When SQL_PROFILING is on, every statement run while serving a request is
+recorded with its duration and the application code that issued it. At the
+end of the request:
+
+- identical statements run SQL_N_PLUS_ONE_THRESHOLD or more times are
+  reported as N+1 patterns (typically a lazy-loaded relationship touched
+  inside a serialization loop), with the code locations that triggered them
+- the response gets an X-SQL-Profile summary header
+- the full profile is kept for GET /api/debug/sql
+
+Statements slower than SQL_SLOW_QUERY_MS are logged with their EXPLAIN plan,
+inside requests or not. Walking the stack for every statement is too costly
+to leave on in production, so this is off by default.
+"""
+
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from flask import request
+import config
+
+
+logger = logging.getLogger('sql_profiler')
+
+THIS_FILE = os.path.abspath(__file__)
+BACKEND_DIR = os.path.dirname(THIS_FILE)
+HEADER = 'X-SQL-Profile'
+LOCATION_DEPTH = 5  # Application frames kept per statement, innermost first
+
+_local = threading.local()
+_recent = deque(maxlen=config.SQL_PROFILE_HISTORY)
+_recent_lock = threading.Lock()
+
+
+def code_location():
+    """The innermost application frames (outside SQLAlchemy and this module) that led to a statement"""
+    frames = []
+    frame = sys._getframe(2)
+    while frame is not None and len(frames) < LOCATION_DEPTH:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(BACKEND_DIR) and filename != THIS_FILE and 'site-packages' not in filename:
+            frames.append(f'{os.path.basename(filename)}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return ' <- '.join(frames) or 'unknown'
+
+
+def explain(conn, cursor, statement, parameters):
+    """EXPLAIN plan of a statement, run on the same DBAPI connection"""
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute(prefix + statement, parameters)
+        return '\n'.join(' '.join(str(column) for column in row) for row in explain_cursor.fetchall())
+    except Exception as e:
+        return f'(EXPLAIN failed: {e})'
+    finally:
+        explain_cursor.close()
+
+
+class RequestProfile:
+    """Statements run while serving one request"""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.statements = []  # (statement, seconds, location)
+
+    def n_plus_one(self):
+        """Statements repeated at least SQL_N_PLUS_ONE_THRESHOLD times, most frequent first"""
+        groups = {}
+        for statement, seconds, location in self.statements:
+            group = groups.setdefault(statement, {'count': 0, 'seconds': 0.0, 'locations': {}})
+            group['count'] += 1
+            group['seconds'] += seconds
+            group['locations'][location] = group['locations'].get(location, 0) + 1
+
+        repeated = [
+            {
+                'statement': statement,
+                'count': group['count'],
+                'time_ms': round(group['seconds'] * 1000, 3),
+                'locations': sorted(group['locations'], key=group['locations'].get, reverse=True)
+            }
+            for statement, group in groups.items()
+            if group['count'] >= config.SQL_N_PLUS_ONE_THRESHOLD
+        ]
+        return sorted(repeated, key=lambda item: item['count'], reverse=True)
+
+    def summary(self):
+        slow_seconds = config.SQL_SLOW_QUERY_MS / 1000
+        return {
+            'method': self.method,
+            'path': self.path,
+            'started_at': self.started_at,
+            'queries': len(self.statements),
+            'time_ms': round(sum(seconds for _, seconds, _ in self.statements) * 1000, 3),
+            'n_plus_one': self.n_plus_one(),
+            'slow': [
+                {'statement': statement, 'time_ms': round(seconds * 1000, 3), 'location': location}
+                for statement, seconds, location in self.statements if seconds >= slow_seconds
+            ]
+        }
+
+    def header(self):
+        """Compact summary for the X-SQL-Profile response header"""
+        slow_seconds = config.SQL_SLOW_QUERY_MS / 1000
+        return (
+            f'queries={len(self.statements)}; '
+            f'time_ms={sum(seconds for _, seconds, _ in self.statements) * 1000:.1f}; '
+            f'n_plus_one={len(self.n_plus_one())}; '
+            f'slow={sum(1 for _, seconds, _ in self.statements if seconds >= slow_seconds)}'
+        )
+
+
+# ============= ENGINE EVENTS =============
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['profiler_started'].pop()
+    profile = getattr(_local, 'profile', None)
+    slow = elapsed * 1000 >= config.SQL_SLOW_QUERY_MS
+    if profile is None and not slow:
+        return
+
+    location = code_location()
+    if profile is not None:
+        profile.statements.append((statement, elapsed, location))
+    if slow:
+        plan = None if executemany else explain(conn, cursor, statement, parameters)
+        logger.warning('Slow query (%.1f ms) at %s\n%s\nPlan:\n%s', elapsed * 1000, location, statement, plan)
+
+
+# ============= REQUEST HOOKS =============
+
+def before_request():
+    _local.profile = RequestProfile(request.method, request.full_path.rstrip('?'))
+    _local.streaming = False
+
+
+def finish(profile):
+    """Keep a finished profile and log its N+1 patterns"""
+    with _recent_lock:
+        _recent.append(profile)
+    for pattern in profile.n_plus_one():
+        logger.warning('N+1 in %s %s: %d x %s\n  at %s', profile.method, profile.path, pattern['count'],
+                       pattern['statement'], '\n  at '.join(pattern['locations']))
+
+
+def after_request(response):
+    """Add the summary header; generator bodies are profiled until the response is closed"""
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        return response
+    response.headers[HEADER] = profile.header()
+    if inspect.isgenerator(response.response):
+        # Streamed bodies keep querying after teardown, so keep profiling until the response is closed
+        _local.streaming = True
+        response.call_on_close(lambda: close_stream(profile))
+    return response
+
+
+def teardown_request(error=None):
+    """Finish the profile of every request whose body is already built, including ones that raised"""
+    profile = getattr(_local, 'profile', None)
+    if profile is None or getattr(_local, 'streaming', False):
+        return
+    _local.profile = None
+    finish(profile)
+
+
+def close_stream(profile):
+    """call_on_close hook of a streamed response: stop profiling this thread and keep the profile"""
+    if getattr(_local, 'profile', None) is profile:
+        _local.profile = None
+    finish(profile)
+
+
+def recent_profiles():
+    """Summaries of recent requests handled by this worker, newest first"""
+    with _recent_lock:
+        profiles = list(_recent)
+    return [profile.summary() for profile in reversed(profiles)]
+
+
+def init_app(app, engine):
+    """Attach the profiler to an app and engine when SQL_PROFILING is on"""
+    from sqlalchemy import event
+
+    if not config.SQL_PROFILING:
+        return
+
+    logging.basicConfig()
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
@@ -0,0 +1,200 @@
+"""
+Concurrency stress test for sales
+
+Runs the POST /api/sales endpoint from several worker processes at once
+(each with its own database connection pool, like gunicorn workers), all
+selling from the same few containers, then checks that no container was
+oversold, that the storage totals agree with the sales table and that every
+row was stamped with a change_seq for the change feed.
+
+It also reports sale throughput at each worker count relative to the first
+and fails when it drops below --min-scaling times that. SQLite allows one
+writer at a time, so there the numbers are only reported.
+
+Usage:
+    python stress_sales.py                      # temporary SQLite database
+    DATABASE_URL=postgresql://... python stress_sales.py --workers 1,2,4,8
+
+WARNING: the target database is dropped and recreated for every run.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import date
+
+
+def reset_database(containers, quantity):
+    """Recreate the schema with `containers` fresh containers of `quantity` kg each
+
+    The containers are added through the ORM without calling versions.bump(),
+    so this also checks that such writes still get a change_seq.
+    """
+    from sqlalchemy.orm import sessionmaker
+    from models import Base, Storage, init_db
+    import versions  # Registers the change_seq stamping listeners
+
+    engine = init_db()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        for number in range(containers):
+            session.add(Storage(
+                container_id=f'STRESS-{number + 1}',
+                quantity=quantity,
+                storage_date=date.today(),
+                plantation_source='Owerri'
+            ))
+        session.commit()
+        unstamped = session.query(Storage).filter(Storage.change_seq <= 0).count()
+        if unstamped:
+            raise RuntimeError(f'{unstamped} containers committed without versions.bump() got no change_seq')
+        return [storage.id for storage in session.query(Storage).order_by(Storage.id)]
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def sell_worker(storage_ids, attempts, sale_size, start, results):
+    """Worker process: fire `attempts` sales at random containers, count outcomes by status"""
+    from app import app
+
+    client = app.test_client()
+    counts = {}
+    start.wait()
+    for _ in range(attempts):
+        response = client.post('/api/sales', json={
+            'storage_id': random.choice(storage_ids),
+            'quantity_sold': sale_size,
+            'price_per_kg': 1000,
+            'sale_date': date.today().isoformat(),
+            'buyer_name': 'Stress Test',
+            'payment_status': 'Paid'
+        })
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+    results.put(counts)
+
+
+def check_invariants(sale_size, successful_sales):
+    """Return a list of invariant violations (empty when the run was consistent)"""
+    from sqlalchemy import func
+    from sqlalchemy.orm import sessionmaker
+    from models import Storage, Sale, init_db
+
+    engine = init_db()
+    session = sessionmaker(bind=engine)()
+    problems = []
+    try:
+        for storage in session.query(Storage).order_by(Storage.id):
+            sold = session.query(func.coalesce(func.sum(Sale.quantity_sold), 0)).filter(
+                Sale.storage_id == storage.id
+            ).scalar()
+            if sold > storage.quantity + 1e-9:
+                problems.append(f'{storage.container_id} oversold: {sold} of {storage.quantity}kg')
+            if abs(sold - storage.quantity_sold) > 1e-9:
+                problems.append(f'{storage.container_id} quantity_sold {storage.quantity_sold} != sales total {sold}')
+            if abs(storage.remaining_quantity - (storage.quantity - sold)) > 1e-9:
+                problems.append(f'{storage.container_id} remaining_quantity {storage.remaining_quantity} is wrong')
+
+        for model in (Storage, Sale):
+            unstamped = session.query(func.count(model.id)).filter(model.change_seq <= 0).scalar()
+            if unstamped:
+                problems.append(f'{unstamped} {model.__tablename__} rows have no change_seq')
+
+        sale_count = session.query(func.count(Sale.id)).scalar()
+        if sale_count != successful_sales:
+            problems.append(f'{sale_count} sales stored but {successful_sales} requests succeeded')
+        return problems
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def run(workers, containers, quantity, sale_size, oversubscribe):
+    """Run one stress round with `workers` processes; returns (counts, elapsed, problems)"""
+    storage_ids = reset_database(containers, quantity)
+
+    # Ask for more than exists so every container is fought over until empty
+    total_attempts = int(containers * quantity / sale_size * oversubscribe)
+    per_worker = max(1, total_attempts // workers)
+
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=sell_worker, args=(storage_ids, per_worker, sale_size, start, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    time.sleep(1)  # Let workers import the app before the clock starts
+    began = time.perf_counter()
+    start.set()
+
+    counts = {}
+    for _ in processes:
+        for status, count in results.get().items():
+            counts[status] = counts.get(status, 0) + count
+    elapsed = time.perf_counter() - began
+    for process in processes:
+        process.join()
+
+    return counts, elapsed, check_invariants(sale_size, counts.get(201, 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker process counts to try')
+    parser.add_argument('--containers', type=int, default=8)
+    parser.add_argument('--quantity', type=float, default=200, help='kg per container')
+    parser.add_argument('--sale-size', type=float, default=1, help='kg per sale request')
+    parser.add_argument('--oversubscribe', type=float, default=1.5,
+                        help='Sale attempts as a multiple of the stock available')
+    parser.add_argument('--min-scaling', type=float, default=1.0,
+                        help='Fail when throughput at a higher worker count is below this multiple of the first')
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db')
+
+    failed = False
+    throughput = {}
+    for workers in [int(count) for count in args.workers.split(',')]:
+        counts, elapsed, problems = run(workers, args.containers, args.quantity, args.sale_size, args.oversubscribe)
+        throughput[workers] = counts.get(201, 0) / elapsed
+        print(
+            f'{workers} worker(s): {counts.get(201, 0)} sales in {elapsed:.2f}s '
+            f'({throughput[workers]:.0f}/s), responses by status {dict(sorted(counts.items()))}'
+        )
+        for problem in problems:
+            print(f'  ❌ {problem}')
+        failed = failed or bool(problems)
+
+    print('❌ Invariants violated' if failed else '✅ No container oversold; storage totals match sales')
+
+    baseline_workers, baseline = next(iter(throughput.items()))
+    scaling = {workers: rate / baseline for workers, rate in throughput.items()}
+    print(f'Throughput vs {baseline_workers} worker(s): ' + ', '.join(
+        f'{workers} → {ratio:.2f}x' for workers, ratio in scaling.items()
+    ))
+    if os.environ['DATABASE_URL'].startswith('sqlite'):
+        print('ℹ️  SQLite serializes all writers, so scaling is not checked')
+    else:
+        behind = [workers for workers, ratio in scaling.items() if ratio < args.min_scaling]
+        if behind:
+            print(f'❌ Throughput below {args.min_scaling:.2f}x of {baseline_workers} worker(s) '
+                  f'at {", ".join(map(str, behind))} workers')
+            failed = True
+        else:
+            print(f'✅ Throughput scales with workers (at least {args.min_scaling:.2f}x)')
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Per-table change counters
+
+Readers call current() to get a cheap fingerprint of the data a response
+depends on. Write paths record which tables they changed in one of two ways:
+
+- bump_after_commit(): request handlers. The counters are bumped right after
+  the write commits, in a short transaction of their own, so concurrent
+  writes never queue on the few counter rows while holding their other locks
+  (sales to different containers commit in parallel). A reader that sees the
+  old counter with the new data just revalidates once more after the bump.
+- bump(): bulk and maintenance writes that need the new value inside their
+  transaction (e.g. to set change_seq with a Core statement).
+
+Deferred bumps are written to pending_changes inside the write's own
+transaction (plain inserts, so writers still don't contend) and swept after
+commit. A sweep that fails leaves them there, and the next write's sweep
+bumps and stamps them, so a committed write can't keep a stale counter.
+
+The counters also drive the change feed (see changes.py). Every harvest,
+milling, storage and sale row inserted or updated through the ORM is stamped
+with its table's new counter value in change_seq: inside the transaction
+when the table was bump()ed there, otherwise by the sweep. Either way the
+stamp is written while the counter row is locked, so per table change_seq
+values become visible in increasing order and a reader that has seen
+everything up to N never misses a later stamp at or below N.
+"""
+
+import random
+import time
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from models import dialect_insert, PendingChange, TableVersion, Harvest, Milling, Storage, Sale
+import concurrency
+import config
+
+
+TABLES = ('harvests', 'milling', 'storage', 'sales', 'daily_financials')
+
+# Tables with a change_seq column, parents before children
+CHANGE_TRACKED = {model.__tablename__: model for model in (Harvest, Milling, Storage, Sale)}
+
+STAMP_CHUNK_SIZE = 500  # Ids per UPDATE when stamping change_seq
+
+
+def bump(session, *tables):
+    """Increment the change counter of each table (creating it if needed)
+
+    Returns {table: new version}.
+    """
+    table = TableVersion.__table__
+    bumped = session.info.setdefault('bumped_versions', {})
+    for name in tables:
+        insert = dialect_insert(session, table)
+        bumped[name] = session.execute(insert.values(name=name, version=1).on_conflict_do_update(
+            index_elements=['name'],
+            set_={'version': table.c.version + 1}
+        ).returning(table.c.version)).scalar_one()
+    return {name: bumped[name] for name in tables}
+
+
+def bump_after_commit(session, *tables):
+    """Bump the given tables' counters once the session's transaction commits"""
+    session.info.setdefault('pending_bumps', set()).update(tables)
+
+
+def current(session, *tables):
+    """Get {table: version} for the given tables (all tracked tables by default)"""
+    tables = tables or TABLES
+    versions = dict.fromkeys(tables, 0)
+    rows = session.query(TableVersion.name, TableVersion.version).filter(TableVersion.name.in_(tables))
+    versions.update(dict(rows))
+    return versions
+
+
+# ============= CHANGE SEQUENCE STAMPING =============
+
+@event.listens_for(Session, 'after_flush')
+def record_changed_rows(session, flush_context):
+    """Remember which tracked rows this transaction inserted or modified"""
+    changed = session.info.setdefault('changed_rows', {})
+    for instance in list(session.new) + list(session.dirty):
+        name = getattr(instance, '__tablename__', None)
+        if name not in CHANGE_TRACKED:
+            continue
+        if instance not in session.new and not session.is_modified(instance, include_collections=False):
+            continue  # Only a relationship collection changed
+        changed.setdefault(name, set()).add(instance.id)
+
+
+def stamp(session, changed, bumped):
+    """Set change_seq on the given {table: ids} to the table's bumped counter"""
+    for name, ids in changed.items():
+        table = CHANGE_TRACKED[name].__table__
+        ids = sorted(ids)
+        for start in range(0, len(ids), STAMP_CHUNK_SIZE):
+            session.execute(
+                table.update()
+                .where(table.c.id.in_(ids[start:start + STAMP_CHUNK_SIZE]))
+                .values(change_seq=bumped[name])
+            )
+
+
+@event.listens_for(Session, 'before_commit')
+def stamp_changed_rows(session):
+    """Stamp changed rows of tables bumped in this transaction; record the rest as pending changes"""
+    session.flush()
+    changed = session.info.pop('changed_rows', {})
+    bumped = session.info.get('bumped_versions', {})
+    stamp(session, {name: ids for name, ids in changed.items() if name in bumped}, bumped)
+
+    deferred = {name: ids for name, ids in changed.items() if name not in bumped}
+    # A write path that bumped nothing (or forgot to) is stamped after commit
+    bump_after_commit(session, *deferred)
+    pending = session.info.get('pending_bumps')
+    if pending:
+        # Committed with the write, so a bump that fails after commit is still owed
+        session.execute(PendingChange.__table__.insert(), [
+            {'table_name': name, 'row_id': row_id}
+            for name in sorted(pending)
+            for row_id in (sorted(deferred.get(name, ())) or [None])
+        ])
+
+
+def sweep_pending_changes(session):
+    """Bump the counters and stamp the rows of every pending change, then clear them
+
+    Returns {table: new version}, empty when nothing was pending.
+    """
+    pending = PendingChange.__table__
+    rows = session.execute(select(pending.c.id, pending.c.table_name, pending.c.row_id)).all()
+    if not rows:
+        return {}
+
+    changed = {}
+    for _, name, row_id in rows:
+        ids = changed.setdefault(name, set())
+        if row_id is not None and name in CHANGE_TRACKED:
+            ids.add(row_id)
+    bumped = bump(session, *sorted(changed))
+    stamp(session, {name: ids for name, ids in changed.items() if ids}, bumped)
+
+    pending_ids = [row_id for row_id, _, _ in rows]
+    for start in range(0, len(pending_ids), STAMP_CHUNK_SIZE):
+        session.execute(pending.delete().where(pending.c.id.in_(pending_ids[start:start + STAMP_CHUNK_SIZE])))
+    return bumped
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_pending_bumps(session):
+    """Sweep pending changes (this transaction's and any left over) in a transaction of their own
+
+    Tables are locked in name order so concurrent writers can't deadlock.
+    The write has already committed, so failures are retried and then only
+    logged: raising here would make the caller retry a write that succeeded.
+    The pending changes stay behind for the next write's sweep.
+    """
+    if not session.info.pop('pending_bumps', None):
+        return
+
+    for attempt in range(1, config.WRITE_RETRY_ATTEMPTS + 1):
+        counters = Session(bind=session.get_bind())
+        try:
+            bumped = sweep_pending_changes(counters)
+            counters.commit()
+            # Reported with the transaction's own bumps (e.g. for cache invalidation)
+            session.info.setdefault('bumped_versions', {}).update(bumped)
+            return
+        except Exception as e:
+            counters.rollback()
+            if not concurrency.is_retryable(e) or attempt == config.WRITE_RETRY_ATTEMPTS:
+                print(f'Warning: could not bump change counters, left pending for the next write: {e}')
+                return
+        finally:
+            counters.close()
+        time.sleep(config.WRITE_RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def reset_change_tracking(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('changed_rows', None)
+        session.info.pop('bumped_versions', None)
+        session.info.pop('pending_bumps', None)
@@ -3,7 +3,7 @@
 import { useEffect, useState } from 'react';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
-import { getDashboardSummary, getProfitTrends, downloadExcelReport, downloadPdfReport, type DashboardSummary, type ProfitTrend } from '@/lib/api';
+import { getDashboardBootstrap, downloadExcelReport, downloadPdfReport, type DashboardSummary, type ProfitTrend } from '@/lib/api';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, BarChart, Bar } from 'recharts';
 import { TrendingUp, Package, DollarSign, AlertCircle, Download, FileSpreadsheet } from 'lucide-react';
 
@@ -20,13 +20,10 @@ export default function Dashboard() {
   const fetchData = async () => {
     try {
       setLoading(true);
-      const [summaryRes, trendsRes] = await Promise.all([
-        getDashboardSummary(),
-        getProfitTrends()
-      ]);
+      const res = await getDashboardBootstrap({ include: ['summary', 'trends'] });
 
-      setSummary(summaryRes.data);
-      setProfitTrends(trendsRes.data);
+      setSummary(res.data.summary ?? null);
+      setProfitTrends(res.data.trends ?? []);
       setError(null);
     } catch (err) {
       setError('Failed to load dashboard data');
@@ -53,9 +53,13 @@ export default function SalesPage() {
     try {
       const [salesRes, storageRes, millingRes, harvestsRes] = await Promise.all([
         getSales(),
-        getAvailableStorage(),
-        getMilling(),
-        getHarvests(),
+        // Only the fields this page shows
+        getAvailableStorage([
+          'id', 'container_id', 'milling_id', 'quantity', 'remaining_quantity', 'remaining_quantity_liters',
+          'plantation_source', 'expiry_date', 'days_until_expiry', 'is_near_expiry',
+        ]),
+        getMilling(['id', 'harvest_id', 'cost_per_kg']),
+        getHarvests(['id', 'harvest_date', 'is_purchased', 'supplier_name', 'total_weight']),
       ]);
       setSales(salesRes.data);
       setStorage(storageRes.data.inventory);
@@ -96,6 +96,15 @@ export interface ProfitTrend {
   cost: number;
   revenue: number;
   profit: number;
+  oil_produced: number;
+  oil_sold: number;
+}
+
+export interface ProfitTrendParams {
+  granularity?: 'day' | 'week' | 'month';
+  date_from?: string;
+  date_to?: string;
+  plantation?: string;
 }
 
 export interface Alert {
@@ -108,34 +117,85 @@ export interface Alert {
   current_stock?: number;
 }
 
+export interface ListParams {
+  limit?: number;
+  cursor?: string;
+  sort?: string;
+  date_from?: string;
+  date_to?: string;
+  include_total?: boolean;
+  fields?: string;  // Comma-separated sparse fieldset, e.g. 'id,container_id'
+  [filter: string]: string | number | boolean | undefined;
+}
+
+export interface Page<T> {
+  items: T[];
+  next_cursor: string | null;
+  has_more: boolean;
+  total?: number;
+}
+
+// Sparse fieldsets: with fields given, records only carry those fields
+const fieldParams = (fields?: string[]) => ({ params: { fields: fields?.join(',') } });
+
 // Harvest API
-export const getHarvests = () => api.get<Harvest[]>('/harvests');
+export const getHarvests = (fields?: (keyof Harvest)[]) => api.get<Harvest[]>('/harvests', fieldParams(fields));
+export const getHarvestsPage = (params: ListParams) => api.get<Page<Harvest>>('/harvests', { params });
 export const getHarvest = (id: number) => api.get<Harvest>(`/harvests/${id}`);
 export const createHarvest = (data: Partial<Harvest>) => api.post<Harvest>('/harvests', data);
+export const bulkCreateHarvests = (data: Partial<Harvest>[] | File) => {
+  if (Array.isArray(data)) return api.post<BulkResult>('/harvests/bulk', data);
+  const form = new FormData();
+  form.append('file', data);
+  return api.post<BulkResult>('/harvests/bulk', form);
+};
 
 // Milling API
-export const getMilling = () => api.get<Milling[]>('/milling');
+export const getMilling = (fields?: (keyof Milling)[]) => api.get<Milling[]>('/milling', fieldParams(fields));
+export const getMillingPage = (params: ListParams) => api.get<Page<Milling>>('/milling', { params });
 export const getMillingRecord = (id: number) => api.get<Milling>(`/milling/${id}`);
 export const createMilling = (data: Partial<Milling>) => api.post<Milling>('/milling', data);
 
 // Storage API
 export const getStorage = () => api.get<Storage[]>('/storage');
-export const getAvailableStorage = () => api.get<{ inventory: Storage[]; total_quantity: number }>('/storage/available');
+export const getStoragePage = (params: ListParams) => api.get<Page<Storage>>('/storage', { params });
+export const getAvailableStorage = (fields?: (keyof Storage)[]) =>
+  api.get<{ inventory: Storage[]; total_quantity: number }>('/storage/available', fieldParams(fields));
 export const getStorageAlerts = () => api.get<{ near_expiry: Storage[]; expired: Storage[]; total_alerts: number }>('/storage/alerts');
 export const getStorageRecord = (id: number) => api.get<Storage>(`/storage/${id}`);
 
 // Sales API
 export const getSales = () => api.get<Sale[]>('/sales');
+export const getSalesPage = (params: ListParams) => api.get<Page<Sale>>('/sales', { params });
 export const getSale = (id: number) => api.get<Sale>(`/sales/${id}`);
 export const createSale = (data: Partial<Sale>) => api.post<Sale>('/sales', data);
+export const allocateSale = (data: AllocationRequest) => api.post<AllocationResult>('/sales/allocate', data);
 export const updatePaymentStatus = (id: number, data: { payment_status: string; payment_date?: string }) =>
   api.patch<Sale>(`/sales/${id}/payment`, data);
 
 // Dashboard API
 export const getDashboardSummary = () => api.get<DashboardSummary>('/dashboard/summary');
-export const getProfitTrends = () => api.get<ProfitTrend[]>('/dashboard/profit-trends');
+export const getProfitTrends = (params?: ProfitTrendParams) =>
+  api.get<ProfitTrend[]>('/dashboard/profit-trends', { params });
 export const getAllAlerts = () => api.get<{ alerts: Alert[]; total_count: number }>('/dashboard/alerts');
 
+export type DashboardSection = 'summary' | 'alerts' | 'trends';
+
+export interface DashboardBootstrapParams extends ProfitTrendParams {
+  include?: DashboardSection[];
+  alert_limit?: number;
+}
+
+export interface DashboardBootstrap {
+  summary?: DashboardSummary;
+  alerts?: { alerts: Alert[]; total_count: number };
+  trends?: ProfitTrend[];
+}
+
+// Summary, alerts and trends in one request (only the sections in include, all by default)
+export const getDashboardBootstrap = ({ include, ...params }: DashboardBootstrapParams = {}) =>
+  api.get<DashboardBootstrap>('/dashboard/bootstrap', { params: { ...params, include: include?.join(',') } });
+
 // Reports API
 export const downloadExcelReport = (type: string = 'summary') => {
   return `${API_BASE_URL}/reports/excel?type=${type}`;
@@ -145,4 +205,92 @@ export const downloadPdfReport = (type: string = 'summary') => {
   return `${API_BASE_URL}/reports/pdf?type=${type}`;
 };
 
+export interface AllocationRequest {
+  quantity: number;
+  policy?: 'fefo' | 'fifo';
+  plantation?: string;
+  include_expired?: boolean;
+  sale_date: string;
+  buyer_name: string;
+  price_per_kg: number;
+  payment_status: string;
+  payment_date?: string;
+}
+
+export interface AllocationResult {
+  quantity_sold: number;
+  allocations: {
+    storage_id: number;
+    container_id: string;
+    quantity_sold: number;
+    storage_remaining: number;
+    container_fully_sold: boolean;
+    sale: Sale;
+  }[];
+}
+
+export interface BulkResult {
+  received: number;
+  inserted: number;
+  failed: number;
+  errors: { row: number; error: string }[];
+}
+
+export interface ReportJob {
+  id: string;
+  format: 'excel' | 'pdf';
+  type: string;
+  status: 'queued' | 'running' | 'done' | 'failed';
+  progress: number;
+  error: string | null;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+  download_url?: string;
+}
+
+export const createReportJob = (format: 'excel' | 'pdf', type: string = 'summary') =>
+  api.post<ReportJob>('/reports/jobs', { format, type });
+export const getReportJob = (id: string) => api.get<ReportJob>(`/reports/jobs/${id}`);
+export const downloadReportJob = (id: string) => `${API_BASE_URL}/reports/jobs/${id}/download`;
+
+// Change feed: rows inserted or updated since a cursor
+export type Changed<T> = T & { change_seq: number };
+
+export interface ChangesPage {
+  changes: {
+    harvests: Changed<Harvest>[];
+    milling: Changed<Milling>[];
+    storage: Changed<Storage>[];
+    sales: Changed<Sale>[];
+  };
+  cursor: string;
+  has_more: boolean;
+}
+
+// Omit since for a full first sync; keep calling with the returned cursor while has_more is true
+export const getChanges = (since?: string, limit?: number) =>
+  api.get<ChangesPage>('/changes', { params: { since, limit } });
+
+// Live updates (Server-Sent Events)
+export type LiveAlert = Alert & { key: string };
+
+export interface LiveUpdateHandlers {
+  onSnapshot?: (data: { summary: DashboardSummary; alerts: LiveAlert[]; total_count: number }) => void;
+  onSummary?: (changed: Partial<DashboardSummary>) => void;
+  onAlerts?: (delta: { upserted: LiveAlert[]; removed: string[]; total_count: number }) => void;
+}
+
+// Subscribe to KPI and alert changes instead of polling; returns a function that closes the stream
+export const subscribeToLiveUpdates = (handlers: LiveUpdateHandlers) => {
+  const source = new EventSource(`${API_BASE_URL}/stream`);
+  const listen = <T,>(name: string, handler?: (data: T) => void) => {
+    if (handler) source.addEventListener(name, (event) => handler(JSON.parse((event as MessageEvent).data)));
+  };
+  listen('snapshot', handlers.onSnapshot);
+  listen('summary', handlers.onSummary);
+  listen('alerts', handlers.onAlerts);
+  return () => source.close();
+};
+
 export default api;